@@ -1,5 +1,6 @@
 import os
 import sys
+import atexit
 import threading
 from flask import Flask, session, render_template, redirect, url_for, send_from_directory
 from flask_socketio import SocketIO, join_room,leave_room
@@ -40,6 +41,10 @@ def create_app():
     # --- WebSocket and Background Task Setup ---
     # Initialize the WebSocket client
     websocket_client = wss_client.WSSClient(socketio, bubble_chart)
+    # Flush buffered ticks to disk when the server shuts down.
+    atexit.register(websocket_client.shutdown)
+    # Instruments with viewers are subscribed in a richer mode (depth, OI, greeks).
+    bubble_chart.set_viewer_listener(websocket_client.update_viewers)
 
     # Pass the websocket connection starter to the auth module
     # This allows the auth blueprint to trigger the websocket connection upon successful login
@@ -55,6 +60,10 @@ def create_app():
     )
     subscription_thread.start()
 
+    # Expire stale BBSCAN subscriptions and report the subscription count and message rate.
+    review_thread = threading.Thread(target=websocket_client.run_subscription_review, daemon=True)
+    review_thread.start()
+
     # --- Main Routes ---
     @app.route('/')
     def index():
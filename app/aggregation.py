@@ -0,0 +1,397 @@
+import math
+import threading
+from bisect import insort
+from collections import OrderedDict
+
+import numpy as np
+
+# 2030-01-01T00:00:00Z; larger ltt values are treated as bogus and truncated to seconds.
+# TickValidator applies this at ingest; older day files may still hold such values.
+MAX_LTT_MS = 1893456000000
+
+# Bar layout: [time, open, high, low, close, buyVolume, bigBuyVolume, sellVolume, bigSellVolume]
+BAR_TIME, BAR_OPEN, BAR_HIGH, BAR_LOW, BAR_CLOSE, BAR_BUY, BAR_BIG_BUY, BAR_SELL, BAR_BIG_SELL = range(9)
+# Bubble group layout: [time, price, sumLtq, maxLtq]
+BUBBLE_TIME, BUBBLE_PRICE, BUBBLE_SUM, BUBBLE_MAX = range(4)
+
+# Aggregators nobody is viewing are kept (without live updates) so that switching back
+# to a recent parameter set only has to catch up on the ticks received since.
+IDLE_AGGREGATOR_CACHE_SIZE = 32
+
+
+def normalize_ltt(ltt):
+    """Returns ltt in epoch milliseconds, truncating implausible far-future values to the second."""
+    if ltt > MAX_LTT_MS:
+        return ltt // 1000 * 1000
+    return ltt
+
+
+def _group_by_arrival(keys):
+    """
+    Groups ticks by bucket key while keeping arrival order inside each group.
+
+    Returns:
+        tuple: (order, starts, ends, group_keys, group_of_tick) where `order` is the
+        stable sort permutation, [starts[i], ends[i]) the i-th group's slice of it,
+        and `group_of_tick` the group index of every tick in arrival order.
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    is_start = np.empty(len(keys), dtype=bool)
+    is_start[:1] = True
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(keys))
+    group_of_tick = np.empty(len(keys), dtype=np.int64)
+    group_of_tick[order] = np.cumsum(is_start) - 1
+    return order, starts, ends, sorted_keys[starts], group_of_tick
+
+
+def aggregate_arrays(ltt, ltp, ltq, candle_ms, bubble_ms, big_player_qty):
+    """
+    Vectorized equivalent of feeding every tick through BarAggregator.add.
+
+    Timestamps are floor-divided into candle and bubble buckets. OHLC, volumes and
+    bubble sums/maxima come from grouped reductions, and the tick-rule aggressor is
+    a shifted comparison against the previous valid price.
+
+    Args:
+        ltt, ltp, ltq: NumPy arrays (int64 ms, float64, integer) in arrival order.
+
+    Returns:
+        dict: bars, bubbles (lists in the BarAggregator layouts), last_price,
+        qty_total and qty_count.
+    """
+    valid = (ltq > 0) & ~np.isnan(ltp)
+    ltt, ltp, ltq = ltt[valid], ltp[valid], ltq[valid].astype(np.int64)
+    result = {'bars': [], 'bubbles': [], 'last_price': 0.0, 'qty_total': int(ltq.sum()), 'qty_count': len(ltq)}
+    if not len(ltq):
+        return result
+    time_ms = np.where(ltt > MAX_LTT_MS, ltt // 1000 * 1000, ltt)
+
+    # Candles: OHLC in arrival order within each bucket.
+    order, starts, ends, bar_times, bar_of_tick = _group_by_arrival(time_ms // candle_ms * candle_ms)
+    prices = ltp[order]
+    opens = prices[starts]
+    closes = prices[ends - 1]
+    highs = np.maximum.reduceat(prices, starts)
+    lows = np.minimum.reduceat(prices, starts)
+
+    # Aggressor: up-tick is a buy; the first tick (no previous price) compares with its open.
+    previous = np.empty_like(ltp)
+    previous[0] = 0.0
+    previous[1:] = ltp[:-1]
+    is_buy = np.where(previous == 0, ltp >= opens[bar_of_tick], ltp > previous)
+    is_big = ltq >= big_player_qty
+    n_bars = len(starts)
+    volumes = [
+        np.bincount(bar_of_tick, weights=np.where(mask, ltq, 0), minlength=n_bars).astype(np.int64)
+        for mask in (is_buy & ~is_big, is_buy & is_big, ~is_buy & ~is_big, ~is_buy & is_big)
+    ]
+    result['bars'] = [list(row) for row in zip(
+        bar_times.tolist(), opens.tolist(), highs.tolist(), lows.tolist(), closes.tolist(),
+        *(volume.tolist() for volume in volumes))]
+
+    # Bubble groups: last price, total and largest quantity per bucket.
+    order, starts, ends, bubble_times, _ = _group_by_arrival(time_ms // bubble_ms * bubble_ms)
+    quantities = ltq[order]
+    result['bubbles'] = [list(row) for row in zip(
+        bubble_times.tolist(),
+        ltp[order][ends - 1].tolist(),
+        np.add.reduceat(quantities, starts).tolist(),
+        np.maximum.reduceat(quantities, starts).tolist())]
+    result['last_price'] = float(ltp[-1])
+    return result
+
+
+def ohlcv_arrays(ltt, ltp, ltq, interval_ms):
+    """
+    Plain OHLCV bars of one interval, for range queries.
+
+    Args:
+        ltt, ltp, ltq: NumPy arrays (int64 ms, float64, integer) of trades in arrival order.
+
+    Returns:
+        list: [time, open, high, low, close, volume, trades] per non-empty interval, oldest first.
+    """
+    if not len(ltt):
+        return []
+    time_ms = np.where(ltt > MAX_LTT_MS, ltt // 1000 * 1000, ltt)
+    order, starts, ends, bar_times, _ = _group_by_arrival(time_ms // interval_ms * interval_ms)
+    prices = ltp[order]
+    quantities = ltq[order].astype(np.int64)
+    return [list(row) for row in zip(
+        bar_times.tolist(), prices[starts].tolist(), np.maximum.reduceat(prices, starts).tolist(),
+        np.minimum.reduceat(prices, starts).tolist(), prices[ends - 1].tolist(),
+        np.add.reduceat(quantities, starts).tolist(), (ends - starts).tolist())]
+
+
+class BarAggregator:
+    """
+    Incremental OHLCV, aggressor volume and bubble aggregation for one
+    (instrument, candle interval, bubble interval, big player qty) combination.
+
+    Mirrors processAndDrawAll in BubbleChart.html tick for tick: ticks with a
+    non-positive quantity or a NaN price are skipped, the aggressor is decided by the
+    tick rule against the previous valid price (first tick uses the candle open), and
+    each tick's quantity goes to the normal or big player buy/sell volume of its candle.
+    Bubble groups keep the last price, total quantity and largest single trade.
+    """
+    def __init__(self, candle_ms, bubble_ms, big_player_qty):
+        self.candle_ms = candle_ms
+        self.bubble_ms = bubble_ms
+        self.big_player_qty = big_player_qty
+        self.bars = {}
+        self.bar_times = []
+        self.bubbles = {}
+        self.last_price = 0.0
+        self.qty_total = 0
+        self.qty_count = 0
+        self.ticks_consumed = 0
+
+    @classmethod
+    def from_columns(cls, candle_ms, bubble_ms, big_player_qty, parts):
+        """
+        Builds an aggregator from TickColumns in one vectorized pass.
+
+        Args:
+            parts (list): TickColumns in time order. They must not be appended to
+                while this runs (NumPy borrows their buffers).
+        """
+        aggregator = cls(candle_ms, bubble_ms, big_player_qty)
+        parts = [columns for columns in parts if columns is not None and len(columns)]
+        if not parts:
+            return aggregator
+
+        def column(name, dtype):
+            arrays = [np.frombuffer(getattr(columns, name), dtype=dtype) for columns in parts]
+            return np.concatenate(arrays) if len(arrays) > 1 else arrays[0].copy()
+
+        result = aggregate_arrays(
+            column('ltt', np.int64), column('ltp', np.float64), column('ltq', np.int32),
+            candle_ms, bubble_ms, big_player_qty)
+        aggregator.bars = {bar[BAR_TIME]: bar for bar in result['bars']}
+        aggregator.bar_times = [bar[BAR_TIME] for bar in result['bars']]
+        aggregator.bubbles = {group[BUBBLE_TIME]: group for group in result['bubbles']}
+        aggregator.last_price = result['last_price']
+        aggregator.qty_total = result['qty_total']
+        aggregator.qty_count = result['qty_count']
+        aggregator.ticks_consumed = sum(len(columns) for columns in parts)
+        return aggregator
+
+    @property
+    def avg_ltq(self):
+        """Mean quantity of all valid ticks, used to scale bubble impact scores."""
+        return self.qty_total / self.qty_count if self.qty_count else 1.0
+
+    def add(self, ltt, ltp, ltq):
+        """
+        Adds one tick.
+
+        Returns:
+            tuple: (bar, bubble) lists that changed, or None if the tick was invalid.
+        """
+        self.ticks_consumed += 1
+        if ltq <= 0 or math.isnan(ltp):
+            return None
+        time_ms = normalize_ltt(ltt)
+        self.qty_total += ltq
+        self.qty_count += 1
+
+        candle_start = time_ms // self.candle_ms * self.candle_ms
+        bar = self.bars.get(candle_start)
+        if bar is None:
+            bar = self.bars[candle_start] = [candle_start, ltp, ltp, ltp, ltp, 0, 0, 0, 0]
+            if self.bar_times and candle_start < self.bar_times[-1]:
+                insort(self.bar_times, candle_start)
+            else:
+                self.bar_times.append(candle_start)
+        else:
+            if ltp > bar[BAR_HIGH]:
+                bar[BAR_HIGH] = ltp
+            if ltp < bar[BAR_LOW]:
+                bar[BAR_LOW] = ltp
+            bar[BAR_CLOSE] = ltp
+
+        if self.last_price == 0:
+            is_buy = ltp >= bar[BAR_OPEN]
+        else:
+            is_buy = ltp > self.last_price
+        self.last_price = ltp
+        if ltq >= self.big_player_qty:
+            bar[BAR_BIG_BUY if is_buy else BAR_BIG_SELL] += ltq
+        else:
+            bar[BAR_BUY if is_buy else BAR_SELL] += ltq
+
+        bubble_start = time_ms // self.bubble_ms * self.bubble_ms
+        bubble = self.bubbles.get(bubble_start)
+        if bubble is None:
+            bubble = self.bubbles[bubble_start] = [bubble_start, ltp, 0, 0]
+        bubble[BUBBLE_PRICE] = ltp
+        bubble[BUBBLE_SUM] += ltq
+        if ltq > bubble[BUBBLE_MAX]:
+            bubble[BUBBLE_MAX] = ltq
+        return bar, bubble
+
+    def add_columns(self, columns, start=0):
+        """Feeds the ticks of a TickColumns from index `start` on through `add`."""
+        for ltt, ltp, ltq in zip(columns.ltt[start:], columns.ltp[start:], columns.ltq[start:]):
+            self.add(ltt, ltp, ltq)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Time-ordered bars plus the bubble groups whose largest trade reaches
+            the big player qty (the bubble threshold is applied by the client).
+        """
+        bubbles = sorted(
+            (group for group in self.bubbles.values() if group[BUBBLE_MAX] >= self.big_player_qty),
+            key=lambda group: group[BUBBLE_TIME],
+        )
+        return {
+            'bars': [self.bars[t] for t in self.bar_times],
+            'bubbles': bubbles,
+            'avgLtq': self.avg_ltq,
+        }
+
+
+class AggregationEngine:
+    """
+    Owns one BarAggregator per (instrument, candle interval, bubble interval,
+    big player qty) that at least one client is viewing, and keeps them current as
+    live ticks arrive, so every client of the same view shares the work.
+
+    New views are built with one vectorized pass over the instrument's tick arrays.
+    Views nobody watches any more are parked in a small LRU keyed by the parameter
+    tuple and only catch up on newer ticks when someone asks for them again.
+
+    Live ticks must be recorded through `append_live_tick`, which appends them to the
+    history store and the aggregators under one lock; that way an aggregator built
+    from history never misses or double counts a tick.
+    """
+    def __init__(self, history, idle_cache_size=IDLE_AGGREGATOR_CACHE_SIZE):
+        self.history = history
+        self.idle_cache_size = idle_cache_size
+        self._lock = threading.Lock()
+        self._aggregators = {}
+        self._idle = OrderedDict()
+        self._keys_by_security = {}
+        self._subscribers = {}
+
+    @property
+    def lock(self):
+        """The lock live ticks are recorded in the history store under."""
+        return self._lock
+
+    @staticmethod
+    def make_key(security_id, candle_ms, bubble_ms, big_player_qty):
+        """Validates view parameters and returns the aggregator key for them."""
+        candle_ms, bubble_ms = int(candle_ms), int(bubble_ms)
+        big_player_qty = float(big_player_qty)
+        if candle_ms <= 0 or bubble_ms <= 0:
+            raise ValueError("Candle and bubble intervals must be positive.")
+        if big_player_qty.is_integer():
+            big_player_qty = int(big_player_qty)
+        return (security_id, candle_ms, bubble_ms, big_player_qty)
+
+    @staticmethod
+    def room_for(key):
+        """Socket.IO room that receives bar updates for an aggregator key."""
+        return 'bars:' + ':'.join(str(part) for part in key)
+
+    def subscribe(self, sid, key):
+        """
+        Registers a client for a view, building or reviving its aggregator if needed.
+
+        Returns:
+            dict: The current snapshot of the view.
+        """
+        security_id = key[0]
+        # Load disk history outside the lock; it can take a while on a cold symbol.
+        disk_columns = self.history.disk_columns(security_id)
+        with self._lock:
+            aggregator = self._aggregators.get(key) or self._idle.pop(key, None)
+            if aggregator is None:
+                # Copy the live ticks so the vectorized build can run without the lock.
+                live_columns = self.history.live.get(security_id)
+                live_copy = live_columns.copy() if live_columns is not None else None
+
+        if aggregator is None:
+            aggregator = BarAggregator.from_columns(key[1], key[2], key[3], [disk_columns, live_copy])
+
+        with self._lock:
+            aggregator = self._aggregators.get(key, aggregator)
+            self._catch_up(aggregator, security_id, len(disk_columns))
+            self._aggregators[key] = aggregator
+            self._keys_by_security.setdefault(security_id, set()).add(key)
+            self._subscribers.setdefault(key, set()).add(sid)
+            return aggregator.snapshot()
+
+    def aggregate(self, key):
+        """
+        Returns a snapshot for any parameter set without subscribing to live updates.
+        Results are cached per parameter tuple in the idle LRU.
+        """
+        snapshot = self.subscribe(None, key)
+        self.unsubscribe(None, key)
+        return snapshot
+
+    def unsubscribe(self, sid, key):
+        """Removes a client from a view and parks the aggregator once nobody watches it."""
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers is None:
+                return
+            subscribers.discard(sid)
+            if subscribers:
+                return
+            del self._subscribers[key]
+            self._idle[key] = self._aggregators.pop(key)
+            while len(self._idle) > self.idle_cache_size:
+                self._idle.popitem(last=False)
+            keys = self._keys_by_security[key[0]]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_security[key[0]]
+
+    def roll(self, history):
+        """
+        Starts a new session on `history` (a day rollover): every watched view restarts
+        empty and keeps its subscribers, and parked views are dropped.
+        """
+        with self._lock:
+            self.history = history
+            for key in self._aggregators:
+                self._aggregators[key] = BarAggregator(key[1], key[2], key[3])
+            self._idle.clear()
+
+    def append_live_tick(self, tick):
+        """
+        Records a live tick in the history store and every aggregator of its instrument.
+
+        Returns:
+            list: (key, bar, bubble, avg_ltq) for each view the tick changed.
+        """
+        updates = []
+        with self._lock:
+            self.history.append_tick(tick)
+            for key in self._keys_by_security.get(tick.instrument_key, ()):
+                aggregator = self._aggregators[key]
+                changed = aggregator.add(tick.ltt, tick.ltp, tick.ltq)
+                if changed is not None:
+                    updates.append((key, changed[0], changed[1], aggregator.avg_ltq))
+        return updates
+
+    def cache_info(self):
+        """Returns the number of active and parked aggregators."""
+        with self._lock:
+            return {'active': len(self._aggregators), 'idle': len(self._idle)}
+
+    def _catch_up(self, aggregator, security_id, disk_length):
+        """Feeds the live ticks an aggregator has not seen yet. Call with the lock held."""
+        live_columns = self.history.live.get(security_id)
+        if live_columns is None:
+            return
+        start = aggregator.ticks_consumed - disk_length
+        if start < len(live_columns):
+            aggregator.add_columns(live_columns, start)
@@ -0,0 +1,349 @@
+"""
+Multi-resolution bar pyramid: OHLC, aggressor volume and bubble statistics of one
+instrument at several fixed intervals, so a zoomed-out chart can ask for a few
+hundred bars instead of every raw tick.
+
+A bar is [time, open, high, low, close, buyVolume, sellVolume, maxQty, trades]:
+buy/sell volume by the tick rule (as BarAggregator), and the largest single trade,
+which with buyVolume + sellVolume is the bubble group of the bar's interval. The big
+player split depends on a per-client threshold, so it is left to BarAggregator.
+
+The open and close of a bar are its trades with the earliest and the latest ltt
+(the first and last to arrive on a tie), so a late trade cannot move them and a
+bar comes out the same whether it was built from ticks, from finer bars or tick
+by tick. Each bar keeps those two times alongside the layout for that.
+
+The finest level is aggregated from ticks; every coarser level from the level
+below it, so the intervals must each divide the next.
+"""
+import math
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from .aggregation import MAX_LTT_MS, normalize_ltt
+
+PYRAMID_LEVELS_MS = (1000, 5000, 15000, 60000, 300000)
+
+# Instruments nobody is viewing whose session pyramid is still kept built and updated
+PYRAMID_CACHE_SIZE = 64
+
+# Bar layout
+PB_TIME, PB_OPEN, PB_HIGH, PB_LOW, PB_CLOSE, PB_BUY, PB_SELL, PB_MAX, PB_TRADES = range(9)
+_FIELDS = (('time', 'q'), ('open', 'd'), ('high', 'd'), ('low', 'd'), ('close', 'd'),
+           ('buy', 'q'), ('sell', 'q'), ('max_qty', 'q'), ('trades', 'q'))
+# Stored with the bars but not part of the layout: ltt (ms) of the open and close trades
+_TRADE_TIMES = (('first_time', 'q'), ('last_time', 'q'))
+_COLUMNS = _FIELDS + _TRADE_TIMES
+
+
+def choose_level(span_ms, points, levels=PYRAMID_LEVELS_MS):
+    """
+    Returns the coarsest interval that still gives roughly `points` bars over
+    `span_ms` (at least half as many), or the finest level for short spans.
+    """
+    for interval in reversed(levels):
+        if span_ms / interval >= points / 2:
+            return interval
+    return levels[0]
+
+
+class BarColumns:
+    """
+    Time-ordered bars of one interval as typed arrays (88 bytes per bar), one per
+    field of the bar layout plus the times of each bar's open and close trades.
+    """
+    __slots__ = tuple(name for name, _ in _COLUMNS)
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Builds from a dict of NumPy arrays keyed by column name. Without the trade
+        times (pyramids saved before they were kept) both default to the bar time.
+        """
+        bars = cls()
+        for name, typecode in _COLUMNS:
+            values = arrays[name] if name in arrays else arrays['time']
+            getattr(bars, name).frombytes(np.ascontiguousarray(values, dtype=typecode).tobytes())
+        return bars
+
+    def as_arrays(self):
+        """Returns zero-copy NumPy views keyed by column name."""
+        return {name: np.frombuffer(getattr(self, name), dtype=typecode) for name, typecode in _COLUMNS}
+
+    def add(self, start, time_ms, ltp, ltq, is_buy):
+        """Adds one trade at `time_ms` to the bar starting at `start`, creating the bar if needed."""
+        times = self.time
+        if not times or start > times[-1]:
+            self._insert(len(times), start, time_ms, ltp)
+            index = -1
+        elif start == times[-1]:
+            index = -1
+        else:
+            # A late trade for an older bar; rare once ticks are validated at ingest.
+            index = int(np.searchsorted(np.frombuffer(times, dtype=np.int64), start))
+            if times[index] != start:
+                self._insert(index, start, time_ms, ltp)
+        if ltp > self.high[index]:
+            self.high[index] = ltp
+        elif ltp < self.low[index]:
+            self.low[index] = ltp
+        if time_ms < self.first_time[index]:
+            self.open[index] = ltp
+            self.first_time[index] = time_ms
+        if time_ms >= self.last_time[index]:
+            self.close[index] = ltp
+            self.last_time[index] = time_ms
+        if is_buy:
+            self.buy[index] += ltq
+        else:
+            self.sell[index] += ltq
+        if ltq > self.max_qty[index]:
+            self.max_qty[index] = ltq
+        self.trades[index] += 1
+
+    def _insert(self, index, start, time_ms, ltp):
+        for name, value in (('time', start), ('open', ltp), ('high', ltp), ('low', ltp), ('close', ltp),
+                            ('buy', 0), ('sell', 0), ('max_qty', 0), ('trades', 0),
+                            ('first_time', time_ms), ('last_time', time_ms)):
+            getattr(self, name).insert(index, value)
+
+    def between(self, start_ms=None, end_ms=None):
+        """Returns the bars with time in [start_ms, end_ms) as lists in the bar layout."""
+        times = np.frombuffer(self.time, dtype=np.int64)
+        lo = 0 if start_ms is None else int(np.searchsorted(times, start_ms))
+        hi = len(times) if end_ms is None else int(np.searchsorted(times, end_ms))
+        return [list(row) for row in zip(*(getattr(self, name)[lo:hi].tolist() for name, _ in _FIELDS))]
+
+
+def _bars_from_ticks(time_ms, ltp, ltq, is_buy, interval):
+    # Ordering by trade time (arrival order on ties) groups the bars and puts each
+    # bar's open trade first and its close trade last.
+    order = np.argsort(time_ms, kind='stable')
+    times = time_ms[order]
+    keys = times // interval * interval
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys))
+    prices = ltp[order]
+    quantities = ltq[order]
+    buys = np.where(is_buy[order], quantities, 0)
+    return BarColumns.from_arrays({
+        'time': keys[starts],
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+        'buy': np.add.reduceat(buys, starts),
+        'sell': np.add.reduceat(quantities - buys, starts),
+        'max_qty': np.maximum.reduceat(quantities, starts),
+        'trades': ends - starts,
+        'first_time': times[starts],
+        'last_time': times[ends - 1],
+    })
+
+
+def _coarsen(bars, interval):
+    """Aggregates time-ordered bars of a finer interval into bars of `interval`."""
+    fine = bars.as_arrays()
+    if not len(fine['time']):
+        return BarColumns()
+    keys = fine['time'] // interval * interval
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys))
+    return BarColumns.from_arrays({
+        'time': keys[starts],
+        'open': fine['open'][starts],
+        'high': np.maximum.reduceat(fine['high'], starts),
+        'low': np.minimum.reduceat(fine['low'], starts),
+        'close': fine['close'][ends - 1],
+        'buy': np.add.reduceat(fine['buy'], starts),
+        'sell': np.add.reduceat(fine['sell'], starts),
+        'max_qty': np.maximum.reduceat(fine['max_qty'], starts),
+        'trades': np.add.reduceat(fine['trades'], starts),
+        'first_time': fine['first_time'][starts],
+        'last_time': fine['last_time'][ends - 1],
+    })
+
+
+class BarPyramid:
+    """
+    Bars of one instrument at every level of `levels`, built in one vectorized pass
+    and then updated tick by tick with `add`.
+    """
+    def __init__(self, levels=PYRAMID_LEVELS_MS):
+        self.levels = OrderedDict((interval, BarColumns()) for interval in levels)
+        self.last_price = 0.0
+        self.ticks_consumed = 0
+
+    @classmethod
+    def from_columns(cls, parts, levels=PYRAMID_LEVELS_MS):
+        """
+        Builds a pyramid from TickColumns in time order (not appended to meanwhile).
+        Non-trades (NaN ltp, ltq <= 0) are skipped but counted as consumed.
+        """
+        pyramid = cls(levels)
+        parts = [columns for columns in parts if columns is not None and len(columns)]
+        if not parts:
+            return pyramid
+        ltt = np.concatenate([np.frombuffer(columns.ltt, dtype=np.int64) for columns in parts])
+        ltp = np.concatenate([np.frombuffer(columns.ltp, dtype=np.float64) for columns in parts])
+        ltq = np.concatenate([np.frombuffer(columns.ltq, dtype=np.int32) for columns in parts]).astype(np.int64)
+        pyramid.ticks_consumed = len(ltt)
+        valid = (ltq > 0) & ~np.isnan(ltp)
+        ltt, ltp, ltq = ltt[valid], ltp[valid], ltq[valid]
+        if not len(ltt):
+            return pyramid
+
+        time_ms = np.where(ltt > MAX_LTT_MS, ltt // 1000 * 1000, ltt)
+        # Tick rule: an up-tick is a buy, the very first trade counts as one.
+        is_buy = np.empty(len(ltp), dtype=bool)
+        is_buy[0] = True
+        np.greater(ltp[1:], ltp[:-1], out=is_buy[1:])
+        finer = None
+        for interval in pyramid.levels:
+            if finer is None:
+                finer = _bars_from_ticks(time_ms, ltp, ltq, is_buy, interval)
+            else:
+                finer = _coarsen(finer, interval)
+            pyramid.levels[interval] = finer
+        pyramid.last_price = float(ltp[-1])
+        return pyramid
+
+    def add(self, ltt, ltp, ltq):
+        """Adds one tick to every level."""
+        self.ticks_consumed += 1
+        if ltq <= 0 or math.isnan(ltp):
+            return
+        time_ms = normalize_ltt(ltt)
+        is_buy = self.last_price == 0 or ltp > self.last_price
+        self.last_price = ltp
+        for interval, bars in self.levels.items():
+            bars.add(time_ms // interval * interval, time_ms, ltp, ltq, is_buy)
+
+    def add_columns(self, columns, start=0):
+        for ltt, ltp, ltq in zip(columns.ltt[start:], columns.ltp[start:], columns.ltq[start:]):
+            self.add(ltt, ltp, ltq)
+
+    def save(self, path):
+        """Writes every level to one compressed .npz (arrays named '<interval>_<field>')."""
+        arrays = {}
+        for interval, bars in self.levels.items():
+            for name, values in bars.as_arrays().items():
+                arrays[f'{interval}_{name}'] = values
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path, levels=PYRAMID_LEVELS_MS):
+        pyramid = cls(levels)
+        with np.load(path) as data:
+            for interval in levels:
+                if f'{interval}_time' in data:
+                    pyramid.levels[interval] = BarColumns.from_arrays(
+                        {name: data[f'{interval}_{name}'] for name, _ in _COLUMNS if f'{interval}_{name}' in data})
+        return pyramid
+
+
+class PyramidEngine:
+    """
+    Session bar pyramids kept current as live ticks arrive: those of every instrument
+    a client is viewing (see `set_viewed`), plus an LRU of PYRAMID_CACHE_SIZE others
+    zoomed on recently.
+
+    A pyramid is built from the HistoryStore's disk and live ticks on first use, in
+    one vectorized pass (tens of milliseconds for a busy instrument's day). It is not
+    checkpointed: a restart rebuilds it from the journal it would be checked against,
+    and a closed day's pyramids are saved by HistoryCompactor.
+    Live ticks are folded in by catching up on the history store's live columns
+    after they were recorded there, so a pyramid built concurrently from a copy of
+    them never misses or double counts a tick.
+
+    Args:
+        history (HistoryStore): Source of the session's ticks.
+        lock (threading.Lock): The lock live ticks are recorded in `history` under
+            (AggregationEngine.lock).
+    """
+    def __init__(self, history, lock, levels=PYRAMID_LEVELS_MS, cache_size=PYRAMID_CACHE_SIZE):
+        self.history = history
+        self.levels = tuple(levels)
+        self.cache_size = cache_size
+        # security_id -> (pyramid, number of its ticks from disk)
+        self._pyramids = OrderedDict()
+        self._viewed = set()
+        self._lock = lock
+
+    def set_viewed(self, security_id, viewed):
+        """Marks whether clients are viewing an instrument; viewed pyramids are never evicted."""
+        with self._lock:
+            if viewed:
+                self._viewed.add(security_id)
+            else:
+                self._viewed.discard(security_id)
+                self._evict()
+
+    def get(self, security_id):
+        """Returns the instrument's up-to-date session pyramid, building it if needed."""
+        with self._lock:
+            entry = self._pyramids.get(security_id)
+            if entry is not None:
+                self._pyramids.move_to_end(security_id)
+                self._catch_up(security_id, *entry)
+                return entry[0]
+
+        # Load disk history and build outside the lock; it can take a while on a cold symbol.
+        disk_columns = self.history.disk_columns(security_id)
+        with self._lock:
+            live_columns = self.history.live.get(security_id)
+            live_copy = live_columns.copy() if live_columns is not None else None
+        pyramid = BarPyramid.from_columns([disk_columns, live_copy], self.levels)
+
+        with self._lock:
+            entry = self._pyramids.setdefault(security_id, (pyramid, len(disk_columns)))
+            self._pyramids.move_to_end(security_id)
+            self._catch_up(security_id, *entry)
+            self._evict()
+            return entry[0]
+
+    def bars_between(self, security_id, interval, start_ms=None, end_ms=None):
+        """
+        Returns an instrument's session bars of one level with time in [start_ms, end_ms),
+        read under the lock so live ticks cannot resize the arrays meanwhile.
+        """
+        pyramid = self.get(security_id)
+        with self._lock:
+            return pyramid.levels[interval].between(start_ms, end_ms)
+
+    def append_live_tick(self, tick):
+        """Brings the instrument's pyramid, if one is built, up to date with the live store."""
+        with self._lock:
+            entry = self._pyramids.get(tick.instrument_key)
+            if entry is not None:
+                self._catch_up(tick.instrument_key, *entry)
+
+    def cache_info(self):
+        """Returns the number of built pyramids and of viewed instruments."""
+        with self._lock:
+            return {'pyramids': len(self._pyramids), 'viewed': len(self._viewed)}
+
+    def _evict(self):
+        """Drops the least recently used unviewed pyramids beyond cache_size. Call with the lock held."""
+        unviewed = [security_id for security_id in self._pyramids if security_id not in self._viewed]
+        for security_id in unviewed[:max(0, len(unviewed) - self.cache_size)]:
+            del self._pyramids[security_id]
+
+    def _catch_up(self, security_id, pyramid, disk_length):
+        """Feeds the live ticks a pyramid has not seen yet. Call with the lock held."""
+        live_columns = self.history.live.get(security_id)
+        if live_columns is None:
+            return
+        start = pyramid.ticks_consumed - disk_length
+        if start < len(live_columns):
+            pyramid.add_columns(live_columns, start)
@@ -1,15 +1,55 @@
 import json
 import os
 import time
-from flask import Blueprint, request
-from threading import Thread
-from google.protobuf.json_format import MessageToDict
+from flask import Blueprint, Response, request
+from threading import Thread, Lock
 from flask_socketio import SocketIO, join_room,leave_room
 
-from datetime import datetime
+import numpy as np
 
-UpstoxWSS_JSONFilename = 'UpstoxWSS_' + datetime.now().strftime('%d_%m_%y') + '.txt'
-FILEPATH = 'static/'+UpstoxWSS_JSONFilename
+from .history_store import HistoryStore
+from .aggregation import AggregationEngine, normalize_ltt, ohlcv_arrays
+from .bar_pyramid import PyramidEngine, choose_level
+from .fanout import LiveFanout
+from .last_value_cache import BIG_PLAYER_QTY, LastValueCache
+from .metrics import METRICS
+from .partitions import HISTORY_DIR, DayArchive, day_base_path, day_jsonl_path, day_of
+from .securities import SecurityRegistry
+from .watchlist import WatchlistStream
+from .wire import BINARY_MIN_TICKS, WIRE_BINARY, WIRE_FORMATS, WIRE_JSON, encode_columns
+
+# History loading
+LAZY_HISTORY = True                        # Load each symbol's history on first request
+HISTORY_MEMORY_BUDGET = 256 * 1024 * 1024  # Bytes of loaded history kept in the LRU (lazy mode)
+HISTORY_PARSE_WORKERS = None               # Processes for parsing JSONL history (None: one per core)
+
+# Historical tick streaming
+HISTORY_CHUNK_SIZE = 5000                  # Ticks per `historical_chunk` event
+HISTORY_MAX_CHUNK_SIZE = 50000             # Upper bound on a client-requested chunk size
+HISTORY_WINDOW_MS = 30 * 60 * 1000         # Newest-first window, and default span of `request_older`
+
+# Range queries (`request_range`) over any span of days
+RANGE_TICKS = "tick"                       # Resolution that returns raw ticks instead of bars
+RANGE_MIN_RESOLUTION_MS = 1000             # Finest bar resolution
+
+# Viewport queries (`request_viewport`), answered from the precomputed bar pyramids
+VIEWPORT_POINTS = 500                      # Bars aimed for when the client does not say
+VIEWPORT_MAX_POINTS = 5000
+
+# Live updates are batched per room and sent this often (seconds); 0 sends each one at once.
+LIVE_FLUSH_INTERVAL = 0.15
+
+# Watchlists (`watch_symbols`): summaries of many symbols per client, sent this often (seconds).
+WATCHLIST_INTERVAL = 1.0
+WATCHLIST_MAX_SYMBOLS = 200
+
+# Tick events are sent as packed binary blocks to clients that ask for it on connect
+# (auth={'wire': 'binary'}); set to False to serve JSON to everyone.
+ALLOW_BINARY_WIRE = True
+
+# Pipeline metrics are served at /metrics and sent as a `backend_stats` event this often (seconds).
+BACKEND_STATS_INTERVAL = 5.0
+BACKEND_STATS_TOP_INSTRUMENTS = 10         # Busiest instruments listed with their ticks/sec
 
 class BubbleChartLogic:
     """
@@ -20,121 +60,621 @@ class BubbleChartLogic:
         self.socketio = socketio
         self.bp = Blueprint('bubble_chart', __name__, template_folder='../templates')
         self.clients = {}
-        self.file_data_cache = {}
-        self.available_securities = [] 
+        # Viewers per security, reported to the feed so it can pick subscription modes.
+        self.viewers = {}
+        self.viewer_listener = None
+        self.viewers_lock = Lock()
+        # Held while the session's day, history, pyramids and last values are swapped (see
+        # _roll_session), and by readers that use more than one of them together.
+        self.session_lock = Lock()
+        self.securities = SecurityRegistry()
+        self.securities_lock = Lock()
 
-        # Define the history file path relative to the project root
+        # This session's history is today's day file; earlier days are read from the
+        # archive when a request reaches back into them. The session rolls over to the
+        # next day with the feed (see _roll_session).
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.history_file = os.path.join(project_root, FILEPATH)
+        self.history_dir = os.path.join(project_root, HISTORY_DIR)
+        day = day_of()
+        self._set_session(day, self._session_history(day))
+        # Server-side bars shared by every client viewing the same symbol and intervals.
+        self.aggregation = AggregationEngine(self.history)
+        # 1s to 5m bars per instrument for zoomed-out viewports, updated with the same live ticks.
+        self.pyramids = PyramidEngine(self.history, self.aggregation.lock)
+        # Last tick, day OHLC, volume and current bars per instrument, sent as `snapshot` to new viewers.
+        self.last_values = LastValueCache(self.history, big_player_qty=BIG_PLAYER_QTY)
+        # Live ticks and bar updates are conflated per room and flushed in batches.
+        self.fanout = LiveFanout(socketio, '/bubble', flush_interval=LIVE_FLUSH_INTERVAL)
+        # Watchlist rows are computed from the same cache once per interval and shared by every watcher.
+        self.watchlists = WatchlistStream(socketio, '/bubble', self.last_values, interval=WATCHLIST_INTERVAL)
+        self._stats_task = None
+
+        @self.bp.route('/metrics')
+        def metrics():
+            """Pipeline counters, queue depths and stage latencies in the Prometheus text format."""
+            return Response(METRICS.render_prometheus(), mimetype='text/plain; version=0.0.4')
+        METRICS.gauge('connected_clients', lambda: len(self.clients))
+
+        # In eager mode the whole history is loaded up front in a background thread;
+        # in lazy mode each symbol is loaded when a client first asks for it.
+        self.data_loading_thread = None
+        if not LAZY_HISTORY:
+            self.data_loading_thread = Thread(target=self._load_file_data)
+            self.data_loading_thread.daemon = True
+            self.data_loading_thread.start()
+
+    def _session_history(self, day, disk_history=True):
+        """Builds the HistoryStore over a day's history files."""
+        return HistoryStore(
+            day_base_path(self.history_dir, day),
+            day_jsonl_path(self.history_dir, day),
+            memory_budget=HISTORY_MEMORY_BUDGET if LAZY_HISTORY else None,
+            parse_workers=HISTORY_PARSE_WORKERS,
+            archive=DayArchive(self.history_dir, day),
+            disk_history=disk_history,
+        )
+
+    def _set_session(self, day, history):
+        """Points the session at a day and its HistoryStore."""
+        self.session_day = day
+        self.history_file = day_jsonl_path(self.history_dir, day)
+        self.journal_base_path = day_base_path(self.history_dir, day)
+        self.history = history
+
+    def _roll_session(self, day):
+        """
+        Moves the session to a later day, as the tick writer's DailySink does: the new
+        day starts with no live ticks, the finished one is served by the archive, and
+        the views, pyramids and last values start over. Called on the feed thread
+        before the first tick of the new day is recorded.
+
+        The new day's objects are built first and then published together under
+        `session_lock` (and `viewers_lock`, so no viewer change lands on the old
+        pyramids in between); readers never see one day's history with the other's
+        pyramids or last values.
+        """
+        previous = self.session_day
+        history = self._session_history(day, disk_history=False)
+        pyramids = PyramidEngine(history, self.aggregation.lock)
+        last_values = LastValueCache(history, big_player_qty=BIG_PLAYER_QTY)
+        with self.viewers_lock:
+            for symbol in self.viewers:
+                pyramids.set_viewed(symbol, True)
+            with self.session_lock:
+                self._set_session(day, history)
+                self.aggregation.roll(history)
+                self.pyramids = pyramids
+                self.last_values = last_values
+                self.watchlists.last_values = last_values
+        print(f"Session rolled over from {previous} to {day}.")
+
+    def set_viewer_listener(self, listener):
+        """Sets a callable(security_id, viewer_count) called whenever a security gains or loses a viewer."""
+        self.viewer_listener = listener
 
-        # Start loading the historical data in a background thread.
-        self.data_loading_thread = Thread(target=self._load_file_data)
-        self.data_loading_thread.daemon = True
-        self.data_loading_thread.start()
+    @staticmethod
+    def quote_room(security_id):
+        """Room of every client viewing a security, in either aggregation mode; receives `quote` events."""
+        return 'quotes:' + security_id
 
     def register_handlers(self):
         """Registers all Socket.IO event handlers for the /bubble namespace."""
         namespace = '/bubble'
 
         @self.socketio.on('connect', namespace=namespace)
-        def handle_connect():
+        def handle_connect(auth=None):
             sid = request.sid
-            print(f"Client connected: {sid}")
-            self.clients[sid] = {'symbol': None}
+            wire = self._negotiate_wire(auth)
+            print(f"Client connected: {sid} ({wire} ticks)")
+            self.clients[sid] = {'symbol': None, 'bars_key': None, 'history_gen': 0, 'wire': wire}
+            if self._stats_task is None:
+                self._stats_task = self.socketio.start_background_task(self._run_backend_stats)
+            # The live flush task must start here, in the server's context, not on the feed thread.
+            self.fanout.start()
             # Send the list of available securities once the client connects.
             # This task waits for the initial data load to complete.
             self.socketio.start_background_task(self._send_available_securities, sid)
 
+        @self.socketio.on('request_available_securities', namespace=namespace)
+        def handle_securities_request(req=None):
+            # Sent by clients on (re)connect or when they missed a `securities_added` delta.
+            self.socketio.start_background_task(self._send_available_securities, request.sid)
+
         @self.socketio.on('request_initial_data', namespace=namespace)
         def handle_data_request(req):
             symbol, sid = req.get('symbol'), request.sid
             if not symbol:
                 return
             print(f"Client {sid} requested data for symbol: {symbol}")
-            self.clients[sid]['symbol'] = symbol
-            join_room(symbol, sid=sid, namespace=namespace)
-            # Send historical data for the requested symbol.
-            self.socketio.start_background_task(self._send_historical_ticks, symbol, sid)
+            self._leave_current_view(sid)
+            self._start_viewing(sid, symbol)
+            wire = self.clients[sid]['wire']
+            join_room(LiveFanout.tick_room(symbol, wire), sid=sid, namespace=namespace)
+            self.fanout.watch_ticks(symbol, wire, 1)
+            # Stream historical data for the requested symbol, newest window first unless asked otherwise.
+            window_ms = HISTORY_WINDOW_MS if req.get('newestFirst', True) else None
+            self.socketio.start_background_task(
+                self._stream_historical_ticks, symbol, sid, self._next_history_generation(sid),
+                'initial', None, None, window_ms, self._chunk_size(req))
+
+        @self.socketio.on('request_older', namespace=namespace)
+        def handle_older_request(req):
+            sid = request.sid
+            symbol = req.get('symbol')
+            if not symbol or self.clients.get(sid, {}).get('symbol') != symbol:
+                return
+            try:
+                end_ms = int(req['before'])
+                span_ms = int(req.get('span') or HISTORY_WINDOW_MS)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Invalid older history request from {sid}: {e}")
+                return
+            # The newest `span` before the oldest loaded tick, however far back (e.g. the
+            # previous day's close), so gaps without trades never come back empty.
+            window_ms = span_ms if span_ms > 0 else None
+            self.socketio.start_background_task(
+                self._stream_historical_ticks, symbol, sid, self._next_history_generation(sid),
+                'older', None, end_ms, window_ms, self._chunk_size(req))
+
+        @self.socketio.on('request_range', namespace=namespace)
+        def handle_range_request(req):
+            sid = request.sid
+            try:
+                symbol = req['symbol']
+                start_ms = int(req['from'])
+                end_ms = int(req['to']) if req.get('to') is not None else None
+                resolution = req.get('resolution') or RANGE_TICKS
+                if resolution != RANGE_TICKS:
+                    resolution = int(resolution)
+                    if resolution < RANGE_MIN_RESOLUTION_MS:
+                        raise ValueError(f"resolution must be at least {RANGE_MIN_RESOLUTION_MS} ms")
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Invalid range request from {sid}: {e}")
+                return
+            self.socketio.start_background_task(
+                self._send_range, symbol, sid, req.get('requestId'), start_ms, end_ms, resolution, self._chunk_size(req))
+
+        @self.socketio.on('request_viewport', namespace=namespace)
+        def handle_viewport_request(req):
+            sid = request.sid
+            try:
+                symbol = req['symbol']
+                start_ms = int(req['from'])
+                end_ms = int(req['to']) if req.get('to') is not None else None
+                points = min(int(req.get('points') or VIEWPORT_POINTS), VIEWPORT_MAX_POINTS)
+                if points <= 0:
+                    raise ValueError("points must be positive")
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Invalid viewport request from {sid}: {e}")
+                return
+            self.socketio.start_background_task(
+                self._send_viewport, symbol, sid, req.get('requestId'), start_ms, end_ms, points)
+
+        @self.socketio.on('watch_symbols', namespace=namespace)
+        def handle_watch_request(req):
+            sid = request.sid
+            symbols = req.get('symbols') if isinstance(req, dict) else None
+            if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+                print(f"Invalid watchlist from {sid}: {req}")
+                return
+            # Independent of the symbol being charted; an empty list stops the summaries.
+            symbols = list(dict.fromkeys(symbols))[:WATCHLIST_MAX_SYMBOLS]
+            print(f"Client {sid} is watching {len(symbols)} symbols")
+            self.watchlists.set_watchlist(sid, symbols)
+            if symbols:
+                self.socketio.start_background_task(self.watchlists.send_full, sid)
+
+        @self.socketio.on('request_bars', namespace=namespace)
+        def handle_bars_request(req):
+            sid = request.sid
+            try:
+                key = AggregationEngine.make_key(
+                    req['symbol'], req['candleInterval'], req['bubbleInterval'], req['bigPlayerQty'])
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Invalid bars request from {sid}: {e}")
+                return
+            print(f"Client {sid} requested bars: {key}")
+            self._leave_current_view(sid)
+            self._start_viewing(sid, key[0])
+            self.clients[sid]['bars_key'] = key
+            join_room(AggregationEngine.room_for(key), sid=sid, namespace=namespace)
+            self.socketio.start_background_task(self._send_bars, key, sid)
 
         @self.socketio.on('disconnect', namespace=namespace)
         def handle_disconnect():
             sid = request.sid
             if sid in self.clients:
                 print(f"Client disconnected: {sid}")
-                symbol = self.clients[sid].get('symbol')
-                if symbol:
-                    leave_room(symbol, sid=sid, namespace=namespace)
+                self._leave_current_view(sid)
+                self.watchlists.remove(sid)
                 del self.clients[sid]
 
+    @staticmethod
+    def _negotiate_wire(auth):
+        """Returns the tick wire format a connecting client asked for, if the server allows it."""
+        wire = auth.get('wire') if isinstance(auth, dict) else None
+        if wire not in WIRE_FORMATS or (wire == WIRE_BINARY and not ALLOW_BINARY_WIRE):
+            return WIRE_JSON
+        return wire
+
+    def _leave_current_view(self, sid):
+        """Takes a client out of the room (and aggregator) of the symbol it was viewing."""
+        client = self.clients.get(sid)
+        if not client:
+            return
+        # Cancels any history stream still running for the old view.
+        self._next_history_generation(sid)
+        bars_key = client.get('bars_key')
+        if bars_key:
+            leave_room(AggregationEngine.room_for(bars_key), sid=sid, namespace='/bubble')
+            self.aggregation.unsubscribe(sid, bars_key)
+        elif client.get('symbol'):
+            leave_room(LiveFanout.tick_room(client['symbol'], client['wire']), sid=sid, namespace='/bubble')
+            self.fanout.watch_ticks(client['symbol'], client['wire'], -1)
+        if client.get('symbol'):
+            leave_room(self.quote_room(client['symbol']), sid=sid, namespace='/bubble')
+            self._count_viewer(client['symbol'], -1)
+        client['symbol'] = None
+        client['bars_key'] = None
+
+    def _start_viewing(self, sid, symbol):
+        self.clients[sid]['symbol'] = symbol
+        join_room(self.quote_room(symbol), sid=sid, namespace='/bubble')
+        self._count_viewer(symbol, 1)
+
+    def _count_viewer(self, symbol, delta):
+        with self.viewers_lock:
+            count = self.viewers.get(symbol, 0) + delta
+            if count > 0:
+                self.viewers[symbol] = count
+            else:
+                self.viewers.pop(symbol, None)
+            self.pyramids.set_viewed(symbol, count > 0)
+        if self.viewer_listener is not None:
+            try:
+                self.viewer_listener(symbol, max(count, 0))
+            except Exception as e:
+                print(f"Error reporting viewers of {symbol}: {e}")
+
     def _load_file_data(self):
         """
-        Loads and caches raw tick data from the history file.
+        Loads the history of every security up front (eager mode).
         This runs once on application startup.
         """
         print("Data loading thread started.")
         start_time = time.time()
+        with self.session_lock:
+            history, day, journal_base_path = self.history, self.session_day, self.journal_base_path
 
-        if not os.path.exists(self.history_file):
-            print(f"History file not found: {self.history_file}")
-            return
+        if not history.has_disk_history():
+            print(f"No history found for {day} at: {journal_base_path}")
+        else:
+            history.preload()
+
+        self._ensure_available_securities()
+        METRICS.observe('load_file_data', time.time() - start_time)
+        usage = history.memory_usage()
+        print(f"--> BG_LOAD: History loaded in {time.time() - start_time:.2f}s. Found {len(self.securities)} securities, "
+              f"{usage['loaded_ticks']} ticks in {usage['loaded_bytes'] / 1e6:.1f} MB.")
 
-        print(f"Loading historical data from: {self.history_file}")
-        with open(self.history_file, 'r') as f:
-            for i, line in enumerate(f):
-                try:
-                    if not line.strip():
-                        continue
-                    data = json.loads(line.strip())
-                    if 'feeds' in data:
-                        for sec_id, feed_data in data['feeds'].items():
-                            if 'ltpc' in feed_data:
-                                if sec_id not in self.file_data_cache:
-                                    self.file_data_cache[sec_id] = []
-                                self.file_data_cache[sec_id].append(feed_data['ltpc'])
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON on line {i+1}: {e}")
-                except (TypeError, AttributeError) as e:
-                    print(f"Error processing data on line {i+1}: {e}")
-
-        self.available_securities = sorted(self.file_data_cache.keys())
-        print(f"--> BG_LOAD: File loaded in {time.time() - start_time:.2f}s. Found {len(self.available_securities)} securities.")
+    def _wait_for_history(self):
+        """Blocks until the eager history load has finished; returns at once in lazy mode."""
+        if self.data_loading_thread is not None:
+            self.data_loading_thread.join()
+
+    def _ensure_available_securities(self):
+        """
+        Fills the security registry on first use from the history index (or a light
+        scan of the JSONL file), without loading any ticks.
+        """
+        if not self.securities.loaded:
+            with self.securities_lock:
+                if not self.securities.loaded:
+                    self.securities.load(self.history.securities())
+        return self.securities
 
     def _send_available_securities(self, sid):
         """
-        Waits for data loading and sends the list of available securities to a client.
+        Sends the full list of available securities, with its version, to a client.
         """
         print("Preparing to send available securities...")
-        self.data_loading_thread.join()  # Wait for the loading thread to complete
-        print(f"Sending {len(self.available_securities)} securities to client {sid}.")
-        self.socketio.emit('available_securities', {'securities': self.available_securities}, room=sid, namespace='/bubble')
+        self._wait_for_history()
+        version, securities = self._ensure_available_securities().snapshot()
+        print(f"Sending {len(securities)} securities (version {version}) to client {sid}.")
+        self.socketio.emit('available_securities', {'securities': securities, 'version': version},
+                           room=sid, namespace='/bubble')
+
+    def _next_history_generation(self, sid):
+        """Starts a new history request for a client; streams of older generations stop."""
+        client = self.clients.get(sid)
+        if client is None:
+            return None
+        client['history_gen'] += 1
+        return client['history_gen']
+
+    def _is_current_history(self, sid, generation):
+        return self.clients.get(sid, {}).get('history_gen') == generation
 
-    def _send_historical_ticks(self, security_id, sid):
+    @staticmethod
+    def _chunk_size(req):
+        """Client-requested ticks per chunk, clamped to a sane range."""
+        try:
+            chunk_size = int(req.get('chunkSize') or HISTORY_CHUNK_SIZE)
+        except (TypeError, ValueError):
+            chunk_size = HISTORY_CHUNK_SIZE
+        return min(max(chunk_size, 100), HISTORY_MAX_CHUNK_SIZE)
+
+    def _send_snapshot(self, security_id, sid):
         """
-        Waits for data loading and sends all cached historical ticks for a symbol to a client.
+        Sends a security's cached current state (last tick, day OHLC, volume, current
+        bars) as one `snapshot` event, so the chart can paint before any history arrives.
         """
-        self.data_loading_thread.join()
-        ticks = self.file_data_cache.get(security_id, [])
-        print(f"Sending {len(ticks)} historical ticks for {security_id} to {sid}")
-        self.socketio.emit('historical_ticks', {'securityId': security_id, 'ticks': ticks}, room=sid, namespace='/bubble')
+        start_time = time.time()
+        try:
+            snapshot = self.last_values.snapshot(security_id)
+        except Exception as e:
+            print(f"Error building snapshot for {security_id}: {e}")
+            return
+        if snapshot is not None:
+            self.socketio.emit('snapshot', snapshot, room=sid, namespace='/bubble')
+        METRICS.observe('snapshot_send', time.time() - start_time)
 
-    def broadcast_live_tick(self, message):
+    def _stream_historical_ticks(self, security_id, sid, generation, kind, start_ms, end_ms, window_ms, chunk_size):
         """
-        Processes a live tick from the WebSocket, broadcasts it to relevant clients,
-        and updates the list of available securities if a new one is found.
+        Streams a symbol's historical ticks to a client as numbered `historical_chunk`
+        events, loading them from disk on the first request for that symbol.
+
+        Only ticks with ltt in [start_ms, end_ms) are sent (or the newest `window_ms`
+        when given), in arrival order. Each chunk is built just before it is emitted
+        and the loop yields to the event loop between chunks; it stops as soon as the
+        client starts another request or switches symbol.
+        """
+        self._wait_for_history()
+        if not self._is_current_history(sid, generation):
+            return
+        if kind == 'initial':
+            self._send_snapshot(security_id, sid)
+        start_time = time.time()
+        columns, start_ms, has_older = self.history.ticks_in_range(security_id, start_ms, end_ms, window_ms)
+        total = len(columns)
+        METRICS.observe('history_prepare', time.time() - start_time)
+        print(f"Streaming {total} {kind} historical ticks for {security_id} to {sid} "
+              f"in chunks of {chunk_size} (prepared in {time.time() - start_time:.2f}s)")
+
+        binary = self.clients.get(sid, {}).get('wire') == WIRE_BINARY
+        n_chunks = max(1, -(-total // chunk_size))
+        for seq in range(n_chunks):
+            if not self._is_current_history(sid, generation):
+                print(f"History stream {generation} for {security_id} to {sid} cancelled after {seq} of {n_chunks} chunks.")
+                return
+            chunk_start, chunk_stop = seq * chunk_size, (seq + 1) * chunk_size
+            if binary and min(chunk_stop, total) - chunk_start >= BINARY_MIN_TICKS:
+                payload = {'block': encode_columns(columns, chunk_start, chunk_stop)}
+            else:
+                payload = {'ticks': columns.to_wire(chunk_start, chunk_stop)}
+            self.socketio.emit('historical_chunk', {
+                'securityId': security_id,
+                'requestId': generation,
+                'kind': kind,
+                'seq': seq,
+                'chunks': n_chunks,
+                'totalTicks': total,
+                'final': seq == n_chunks - 1,
+                'rangeStart': start_ms,
+                'rangeEnd': end_ms,
+                'hasOlder': has_older,
+                **payload,
+            }, room=sid, namespace='/bubble')
+            self.socketio.sleep(0)
+        METRICS.observe('history_send', time.time() - start_time)
+
+    def request_range(self, security_id, start_ms, end_ms=None, resolution=RANGE_TICKS):
+        """
+        Answers a range query over any span of days, reading only the day partitions
+        that overlap [start_ms, end_ms).
+
+        Args:
+            resolution: RANGE_TICKS for the raw ticks, or a bar interval in ms.
+
+        Returns:
+            dict: securityId, from, to, resolution and hasOlder, plus `columns` (a
+            TickColumns) for ticks or `bars` ([time, open, high, low, close, volume,
+            trades] per interval) otherwise.
+        """
+        start_time = time.time()
+        columns, start_ms, has_older = self.history.ticks_in_range(security_id, start_ms, end_ms)
+        result = {'securityId': security_id, 'from': start_ms, 'to': end_ms, 'resolution': resolution, 'hasOlder': has_older}
+        if resolution == RANGE_TICKS:
+            result['columns'] = columns
+        else:
+            result['bars'] = ohlcv_arrays(
+                np.frombuffer(columns.ltt, dtype=np.int64), np.frombuffer(columns.ltp, dtype=np.float64),
+                np.frombuffer(columns.ltq, dtype=np.int32), resolution)
+        METRICS.observe('range_query', time.time() - start_time)
+        return result
+
+    def _send_range(self, security_id, sid, request_id, start_ms, end_ms, resolution, chunk_size):
         """
+        Sends a range query's result as `range_data` events: one with `bars`, or the
+        ticks in numbered chunks (`ticks` or `block`, in the client's wire format).
+        """
+        try:
+            result = self.request_range(security_id, start_ms, end_ms, resolution)
+        except Exception as e:
+            print(f"Error answering range request for {security_id}: {e}")
+            return
+        result['requestId'] = request_id
+        columns = result.pop('columns', None)
+        if columns is None:
+            print(f"Sending {len(result['bars'])} {resolution} ms bars for {security_id} to {sid}")
+            self.socketio.emit('range_data', result, room=sid, namespace='/bubble')
+            return
+
+        total = len(columns)
+        print(f"Sending {total} ticks for {security_id} in [{start_ms}, {end_ms}) to {sid}")
+        binary = self.clients.get(sid, {}).get('wire') == WIRE_BINARY
+        n_chunks = max(1, -(-total // chunk_size))
+        for seq in range(n_chunks):
+            if sid not in self.clients:
+                return
+            chunk_start, chunk_stop = seq * chunk_size, (seq + 1) * chunk_size
+            if binary and min(chunk_stop, total) - chunk_start >= BINARY_MIN_TICKS:
+                payload = {'block': encode_columns(columns, chunk_start, chunk_stop)}
+            else:
+                payload = {'ticks': columns.to_wire(chunk_start, chunk_stop)}
+            self.socketio.emit('range_data', {
+                **result, 'seq': seq, 'chunks': n_chunks, 'totalTicks': total, 'final': seq == n_chunks - 1, **payload,
+            }, room=sid, namespace='/bubble')
+            self.socketio.sleep(0)
+
+    def request_viewport(self, security_id, start_ms, end_ms=None, points=VIEWPORT_POINTS):
+        """
+        Answers a viewport query from the bar pyramids: the bars of the coarsest
+        pyramid level that still gives roughly `points` bars over [start_ms, end_ms)
+        (end_ms None: up to now), without touching raw ticks of days already compacted.
+
+        Returns:
+            dict: securityId, from, to, resolution (the level's interval in ms) and
+            `bars` ([time, open, high, low, close, buyVolume, sellVolume, maxQty,
+            trades] per interval).
+        """
+        start_time = time.time()
+        with self.session_lock:
+            history, pyramids = self.history, self.pyramids
+        span_ms = (end_ms if end_ms is not None else int(time.time() * 1000)) - start_ms
+        resolution = choose_level(span_ms, points, pyramids.levels)
+        bars = []
+        archive = history.archive
+        session_start_ms = start_ms
+        if archive is not None and start_ms < archive.before_ms:
+            bars = archive.bars_between(security_id, resolution, start_ms, end_ms)
+            session_start_ms = archive.before_ms
+        if end_ms is None or end_ms > session_start_ms:
+            bars += pyramids.bars_between(security_id, resolution, session_start_ms, end_ms)
+        METRICS.observe('viewport_query', time.time() - start_time)
+        return {'securityId': security_id, 'from': start_ms, 'to': end_ms, 'resolution': resolution, 'bars': bars}
+
+    def _send_viewport(self, security_id, sid, request_id, start_ms, end_ms, points):
+        """Sends a viewport query's bars as one `viewport_bars` event."""
+        self._wait_for_history()
         try:
-            message_dict = MessageToDict(message)
-            if 'feeds' in message_dict:
-                for security_id, data in message_dict['feeds'].items():
-                    # If a tick for a new security arrives, add it to the list and notify all clients.
-                    if security_id not in self.available_securities:
-                        self.available_securities.append(security_id)
-                        self.available_securities.sort()
-                        print(f"Discovered new security: {security_id}. Broadcasting updated list.")
-                        self.socketio.emit('available_securities', {'securities': self.available_securities}, namespace='/bubble')
-
-                    # Broadcast the live tick to clients subscribed to this security's room.
-                    if 'ltpc' in data:
-                        self.socketio.emit('live_tick', {'securityId': security_id, 'tick': data['ltpc']}, room=security_id, namespace='/bubble')
+            result = self.request_viewport(security_id, start_ms, end_ms, points)
         except Exception as e:
-            print(f"Error broadcasting live tick: {e}")
\ No newline at end of file
+            print(f"Error answering viewport request for {security_id}: {e}")
+            return
+        result['requestId'] = request_id
+        self.socketio.emit('viewport_bars', result, room=sid, namespace='/bubble')
+
+    def _send_bars(self, key, sid):
+        """
+        Sends the current aggregated bars for a view to a client. Later changes arrive
+        as `bar_update` events in the view's room.
+        """
+        self._wait_for_history()
+        self._send_snapshot(key[0], sid)
+        start_time = time.time()
+        snapshot = self.aggregation.subscribe(sid, key)
+        if self.clients.get(sid, {}).get('bars_key') != key:
+            # The client moved on (or left) while the bars were being built.
+            self.aggregation.unsubscribe(sid, key)
+            return
+        security_id, candle_ms, bubble_ms, big_player_qty = key
+        print(f"Sending {len(snapshot['bars'])} bars for {security_id} to {sid} (prepared in {time.time() - start_time:.2f}s)")
+        snapshot.update({
+            'securityId': security_id,
+            'candleInterval': candle_ms,
+            'bubbleInterval': bubble_ms,
+            'bigPlayerQty': big_player_qty,
+        })
+        self.socketio.emit('bars', snapshot, room=sid, namespace='/bubble')
+        METRICS.observe('bars_send', time.time() - start_time)
+
+    def broadcast_live_tick(self, ticks, current_ts=None):
+        """
+        Queues decoded live ticks for the rooms watching each security (the fan-out
+        sends them in batches), and updates the list of available securities if a
+        new one is found. The first ticks of a new day roll the session over.
+
+        Args:
+            ticks (list): Tick records decoded once by the WebSocket client.
+            current_ts (int): The feed message's currentTs (epoch ms), which dates the
+                ticks as the history writer does; the newest ltt when not given.
+        """
+        start = time.perf_counter()
+        try:
+            day = day_of(current_ts or max(normalize_ltt(tick.ltt) for tick in ticks))
+            if day > self.session_day:
+                self._roll_session(day)
+
+            # If ticks for new securities arrive, register them and send just the additions.
+            securities = self._ensure_available_securities()
+            new_securities = [tick.instrument_key for tick in ticks if tick.instrument_key not in securities]
+            if new_securities:
+                base_version, version, added = securities.add_many(new_securities)
+                if added:
+                    print(f"Discovered {len(added)} new securities: {', '.join(added)}. Broadcasting additions.")
+                    self.fanout.add_event('securities_added', {
+                        'securities': added,
+                        'baseVersion': base_version,
+                        'version': version,
+                    })
+
+            for tick in ticks:
+                security_id = tick.instrument_key
+                updates = self.aggregation.append_live_tick(tick)
+                self.pyramids.append_live_tick(tick)
+                self.last_values.update(tick)
+                self.watchlists.mark(security_id)
+
+                # Queue the live tick for clients subscribed to this security's rooms.
+                self.fanout.add_tick(security_id, tick)
+
+                # And the changed bar and bubble group for clients viewing server-side bars.
+                for key, bar, bubble, avg_ltq in updates:
+                    self.fanout.add_bar_update(AggregationEngine.room_for(key), key, bar, bubble, avg_ltq)
+        except Exception as e:
+            print(f"Error broadcasting live tick: {e}")
+        METRICS.observe('broadcast_live_tick', time.perf_counter() - start)
+
+    def broadcast_quotes(self, quotes):
+        """
+        Queues depth/OI/greeks quotes for the clients viewing each security. Only the
+        latest quote per security is sent with each fan-out batch.
+
+        Args:
+            quotes (list): MarketQuote records decoded by the WebSocket client.
+        """
+        for quote in quotes:
+            self.fanout.add_quote(self.quote_room(quote.instrument_key), quote.instrument_key, quote.to_wire())
+
+    def backend_stats(self, previous_counts, elapsed):
+        """
+        Builds the `backend_stats` payload: stage latencies (ms), gauges, counters,
+        the overall tick rate and the busiest instruments' ticks/sec.
+
+        Args:
+            previous_counts (dict): Per-instrument tick counts at the previous report.
+            elapsed (float): Seconds since that report.
+        """
+        counts = METRICS.tick_counts()
+        rates = {key: (count - previous_counts.get(key, 0)) / elapsed for key, count in counts.items()}
+        busiest = sorted((key for key in rates if rates[key] > 0), key=rates.get, reverse=True)
+        stats = METRICS.snapshot()
+        stats['ticksPerSec'] = round(sum(rates.values()), 1)
+        stats['instruments'] = [[key, round(rates[key], 1)] for key in busiest[:BACKEND_STATS_TOP_INSTRUMENTS]]
+        return stats, counts
+
+    def _run_backend_stats(self):
+        """Background task: sends `backend_stats` to every client each BACKEND_STATS_INTERVAL seconds."""
+        counts = METRICS.tick_counts()
+        last_time = time.monotonic()
+        while True:
+            self.socketio.sleep(BACKEND_STATS_INTERVAL)
+            try:
+                now = time.monotonic()
+                stats, counts = self.backend_stats(counts, max(now - last_time, 1e-9))
+                last_time = now
+                if self.clients:
+                    self.socketio.emit('backend_stats', stats, namespace='/bubble')
+            except Exception as e:
+                print(f"Error sending backend stats: {e}")
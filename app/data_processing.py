@@ -1,84 +1,177 @@
-import pandas as pd
-import time
+import csv
+import fnmatch
 import glob
+import io
 import os
 
-def get_instrument_keys_from_bbscan(project_root):
-    """
-    Reads tickers from the latest BBSCAN file in the project root and maps them
-    to instrument keys using the 'instruments.csv' file.
-
-    Args:
-        project_root (str): The absolute path to the project's root directory.
-
-    Returns:
-        list: A list of instrument keys corresponding to the tickers in the BBSCAN file.
-    """
-    try:
-        bbscan_pattern = os.path.join(project_root, "BBSCAN_FIRED_*.csv")
-        instruments_file = os.path.join(project_root, "instruments.csv")
+from .file_watch import DirectoryWatcher
+from .instruments import get_instrument_master
 
-        # Find the latest BBSCAN file based on the pattern
-        list_of_files = glob.glob(bbscan_pattern)
-        if not list_of_files:
-            print(f"No BBSCAN files found with pattern: {bbscan_pattern}")
-            return []
+BBSCAN_PATTERN = "BBSCAN_FIRED_*.csv"
+# How often the watcher re-checks files even without change events (inotify mode).
+BBSCAN_RESCAN_INTERVAL = 30.0
+# Sleep between checks when inotify is not available.
+BBSCAN_POLL_INTERVAL = 1.0
 
-        latest_file = max(list_of_files, key=os.path.getctime)
-        print(f"Processing BBSCAN file: {latest_file}")
 
-        # Read tickers from the BBSCAN file
-        bbscan_df = pd.read_csv(latest_file)
-        tickers = bbscan_df['ticker'].unique().tolist()
-
-        # Read the instruments mapping file
-        instruments_df = pd.read_csv(instruments_file)
-
-        # Filter instruments to get keys for the required tickers
-        instrument_keys = instruments_df[instruments_df['tradingsymbol'].isin(tickers)]['instrument_key'].tolist()
-
-        print(f"Found {len(instrument_keys)} instrument keys for {len(tickers)} unique tickers.")
+class BBScanTailer:
+    """
+    Follows the newest BBSCAN file and returns the tickers of rows appended since
+    the last call. A ticker is returned every time it appears again, so the
+    subscription manager can tell how recently it was scanned.
+
+    The file is read from the byte offset where the previous read stopped, and only
+    complete lines are consumed, so a row that is half written is picked up on the
+    next call. When a newer BBSCAN file appears, reading starts over on that file.
+    Tickers are mapped to instrument keys with the shared InstrumentMaster, which
+    stays in memory and is only reloaded when 'instruments.csv' changes.
+    """
+    def __init__(self, project_root, pattern=BBSCAN_PATTERN):
+        self.project_root = project_root
+        self.pattern = pattern
+        self.instruments_file = os.path.join(project_root, "instruments.csv")
+        self.current_file = None
+        self.offset = 0
+        self.ticker_column = None
+        self.seen_tickers = set()
+        self.unresolved_tickers = set()
+        self._partial = b''
+        self._instruments = None
+        self._missing_instruments_reported = False
+
+    def is_relevant(self, name):
+        """True if a changed file name can affect the result of `poll`."""
+        return fnmatch.fnmatch(name, self.pattern) or name == os.path.basename(self.instruments_file)
+
+    def poll(self):
+        """
+        Reads whatever was appended to the newest BBSCAN file.
+
+        Returns:
+            list: Instrument keys of the tickers in the new rows.
+        """
+        retried = self._resolve(self.unresolved_tickers) if self._refresh_instruments() else []
+        latest_file = self._latest_file()
+        if latest_file is None:
+            return retried
+        if latest_file != self.current_file:
+            print(f"Following BBSCAN file: {latest_file}")
+            self._start_file(latest_file)
+
+        try:
+            size = os.path.getsize(self.current_file)
+        except OSError as e:
+            print(f"Could not stat BBSCAN file {self.current_file}: {e}")
+            return retried
+        if size < self.offset:
+            print(f"BBSCAN file {self.current_file} was truncated; reading it again from the start.")
+            self._start_file(self.current_file)
+        if size == self.offset:
+            return retried
+
+        with open(self.current_file, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        return retried + self._keys_for_lines(data[:end])
+
+    def _latest_file(self):
+        files = glob.glob(os.path.join(self.project_root, self.pattern))
+        if not files:
+            return None
+        return max(files, key=os.path.getctime)
+
+    def _start_file(self, path):
+        self.current_file = path
+        self.offset = 0
+        self.ticker_column = None
+        self._partial = b''
+
+    def _keys_for_lines(self, data):
+        tickers = []
+        for row in csv.reader(io.StringIO(data.decode('utf-8', errors='replace'))):
+            if not row:
+                continue
+            if self.ticker_column is None:
+                if 'ticker' not in row:
+                    print(f"BBSCAN file {self.current_file} has no 'ticker' column: {row}")
+                    self.ticker_column = -1
+                else:
+                    self.ticker_column = row.index('ticker')
+                continue
+            if self.ticker_column < 0 or self.ticker_column >= len(row):
+                continue
+            ticker = row[self.ticker_column].strip()
+            if ticker and ticker not in tickers:
+                tickers.append(ticker)
+        self.seen_tickers.update(tickers)
+        return self._resolve(tickers)
+
+    def _resolve(self, tickers):
+        """Maps tickers to instrument keys; unknown tickers are retried when instruments.csv changes."""
+        instrument_keys = []
+        resolved = 0
+        for ticker in list(tickers):
+            keys = self._instruments.keys_for_symbol(ticker) if self._instruments is not None else None
+            if keys:
+                instrument_keys.extend(keys)
+                self.unresolved_tickers.discard(ticker)
+                resolved += 1
+            elif ticker not in self.unresolved_tickers:
+                print(f"No instrument found for BBSCAN ticker {ticker}.")
+                self.unresolved_tickers.add(ticker)
+        if resolved:
+            print(f"Found {len(instrument_keys)} instrument keys for {resolved} scanned tickers.")
         return instrument_keys
 
-    except FileNotFoundError as e:
-        print(f"Error: A required file was not found. {e}")
-        return []
-    except Exception as e:
-        print(f"An error occurred in get_instrument_keys_from_bbscan: {e}")
-        return []
+    def _refresh_instruments(self):
+        """Picks up a reloaded instrument master. Returns True if it changed."""
+        try:
+            instruments = get_instrument_master(self.instruments_file)
+        except FileNotFoundError as e:
+            if not self._missing_instruments_reported:
+                print(f"Error: A required file was not found. {e}")
+                self._missing_instruments_reported = True
+            return False
+        if instruments is self._instruments:
+            return False
+        self._instruments = instruments
+        print(f"Loaded {len(instruments)} instruments from {self.instruments_file}")
+        return True
+
 
 def start_symbol_subscription_thread(wss_client):
     """
-    A background thread that periodically checks for new symbols in the BBSCAN file
-    and subscribes to them via the WebSocket client.
+    A background thread that watches the BBSCAN files and passes every scanned
+    symbol to the WebSocket client as soon as its row is written. New symbols are
+    subscribed; repeated ones keep their subscription from expiring.
+
+    Keys subscribed while the WebSocket is down are remembered by the client and
+    sent when the connection opens.
 
     Args:
         wss_client (WSSClient): An instance of the WebSocket client.
     """
-    subscribed_keys = set()
     project_root = wss_client.project_root # Get project root from the WSS client
+    tailer = BBScanTailer(project_root)
+    watcher = DirectoryWatcher(project_root, poll_interval=BBSCAN_POLL_INTERVAL)
 
+    changed = None
     while True:
-        print("Checking for new symbols to subscribe...")
-
-        # Wait for the WebSocket connection to be fully established
-        if not wss_client.is_connected():
-            print("WebSocket client not connected. Waiting for connection...")
-            time.sleep(10) 
-            continue
-
-        instrument_keys = get_instrument_keys_from_bbscan(project_root)
-
-        # Determine which keys are new and need to be subscribed
-        new_keys_to_subscribe = [key for key in instrument_keys if key not in subscribed_keys]
-
-        if new_keys_to_subscribe:
-            print(f"Found {len(new_keys_to_subscribe)} new symbols to subscribe.")
-            wss_client.subscribe(new_keys_to_subscribe)
-            subscribed_keys.update(new_keys_to_subscribe)
-        else:
-            print("No new symbols found to subscribe.")
-
-        # Wait for 2 minutes before the next check
-        print("Waiting for 2 minutes before next symbol check...")
-        time.sleep(120)
\ No newline at end of file
+        if changed is None or any(tailer.is_relevant(name) for name in changed):
+            try:
+                instrument_keys = tailer.poll()
+            except Exception as e:
+                print(f"An error occurred while reading BBSCAN files: {e}")
+                instrument_keys = []
+            if instrument_keys:
+                wss_client.subscribe(instrument_keys)
+
+        changed = watcher.wait(BBSCAN_RESCAN_INTERVAL)
+        if changed is not None and not changed:
+            # Nothing happened for a while: re-check anyway in case an event was missed.
+            changed = None
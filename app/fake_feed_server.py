@@ -0,0 +1,232 @@
+"""
+Local stand-in for the Upstox V3 market data feed.
+
+Speaks the same protocol as the real endpoint: clients send binary JSON requests
+({"guid", "method": "sub" | "unsub" | "change_mode", "data": {"instrumentKeys", "mode"}})
+and receive protobuf `FeedResponse` frames. Every subscribed instrument gets a
+random-walk tick each interval, shaped like its subscription mode (ltpc, full with
+five depth levels and OI, or option_greeks), so the sharded feed and the rest of the
+pipeline can be exercised without an Upstox account.
+
+Point the app at it by setting `wss_client.FEED_URL` (e.g. "ws://127.0.0.1:8765").
+
+Usage:
+    python -m app.fake_feed_server [--host 127.0.0.1] [--port 8765] [--interval 0.1]
+                                   [--max-keys 5000] [--keys-per-frame 100]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+
+import websockets
+from upstox_client.feeder.proto import MarketDataFeedV3_pb2
+
+DEFAULT_PORT = 8765
+
+
+class FakeFeedServer:
+    """
+    Serves a synthetic market data feed over WebSocket.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind (0 picks a free one; see `url` after `start`).
+        interval (float): Seconds between tick rounds.
+        max_keys (int): Per-connection subscription limit; keys beyond it are ignored,
+            like instruments over the real feed's limit.
+        keys_per_frame (int): Instruments packed into one FeedResponse.
+    """
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, interval=0.1, max_keys=5000, keys_per_frame=100):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.max_keys = max_keys
+        self.keys_per_frame = keys_per_frame
+        self.stats = {'connections': 0, 'open_connections': 0, 'requests': 0, 'frames': 0, 'ticks': 0, 'rejected_keys': 0}
+        self._prices = {}
+        self._connections = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self):
+        """Runs the server on a background thread and returns once it is listening."""
+        self._thread = threading.Thread(target=self._run_thread, name="FakeFeedServer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """Closes every connection and stops the server thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._shutdown)
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def drop_connections(self):
+        """Closes every client connection abnormally (to exercise reconnects)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._drop_all)
+
+    def subscriptions(self):
+        """Returns the subscribed keys of each open connection."""
+        return [set(subscribed) for subscribed in list(self._connections.values())]
+
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await websockets.serve(self._handle, self.host, self.port, max_size=None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Fake market data feed listening on {self.url}")
+        self._ready.set()
+        await self._server.wait_closed()
+
+    def _run_thread(self):
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            self._ready.set()
+
+    def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _drop_all(self):
+        for websocket in list(self._connections):
+            websocket.transport.abort()
+
+    async def _handle(self, websocket, path=None):
+        subscribed = {}
+        self._connections[websocket] = subscribed
+        self.stats['connections'] += 1
+        self.stats['open_connections'] += 1
+        sender = asyncio.ensure_future(self._send_ticks(websocket, subscribed))
+        try:
+            async for message in websocket:
+                self._apply_request(websocket, subscribed, message)
+                await self._send_initial(websocket, subscribed)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            sender.cancel()
+            self._connections.pop(websocket, None)
+            self.stats['open_connections'] -= 1
+
+    def _apply_request(self, websocket, subscribed, message):
+        try:
+            request = json.loads(message)
+            method = request['method']
+            keys = request['data']['instrumentKeys']
+            mode = request['data'].get('mode', 'ltpc')
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Fake feed: ignoring malformed request: {e}")
+            return
+        self.stats['requests'] += 1
+        if method == 'sub':
+            for key in keys:
+                if key not in subscribed and len(subscribed) >= self.max_keys:
+                    self.stats['rejected_keys'] += 1
+                    continue
+                subscribed[key] = mode
+        elif method == 'unsub':
+            for key in keys:
+                subscribed.pop(key, None)
+        elif method == 'change_mode':
+            for key in keys:
+                if key in subscribed:
+                    subscribed[key] = mode
+
+    async def _send_initial(self, websocket, subscribed):
+        """Sends an initial_feed frame for keys that have not been sent one yet."""
+        pending = [(key, mode) for key, mode in subscribed.items() if key not in self._prices]
+        if pending:
+            await self._send_frames(websocket, pending, MarketDataFeedV3_pb2.initial_feed)
+
+    async def _send_ticks(self, websocket, subscribed):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                if subscribed:
+                    await self._send_frames(websocket, list(subscribed.items()), MarketDataFeedV3_pb2.live_feed)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _send_frames(self, websocket, subscriptions, feed_type):
+        now_ms = int(time.time() * 1000)
+        for i in range(0, len(subscriptions), self.keys_per_frame):
+            response = MarketDataFeedV3_pb2.FeedResponse(type=feed_type, currentTs=now_ms)
+            for key, mode in subscriptions[i:i + self.keys_per_frame]:
+                close, ltp = self._prices.get(key) or (round(random.uniform(50, 5000), 2),) * 2
+                ltp = max(0.05, round(ltp + random.gauss(0, ltp * 0.0005), 2))
+                self._prices[key] = (close, ltp)
+                self._fill_feed(response.feeds[key], mode, ltp, close, now_ms)
+            await websocket.send(response.SerializeToString())
+            self.stats['frames'] += 1
+            self.stats['ticks'] += len(response.feeds)
+
+
+    @staticmethod
+    def _fill_feed(feed, mode, ltp, close, now_ms):
+        if mode == 'full':
+            body = feed.fullFeed.marketFF
+            ltpc = body.ltpc
+            for level in range(5):
+                quote = body.marketLevel.bidAskQuote.add()
+                quote.bidP = round(ltp - 0.05 * (level + 1), 2)
+                quote.bidQ = random.randint(1, 50) * 25
+                quote.askP = round(ltp + 0.05 * (level + 1), 2)
+                quote.askQ = random.randint(1, 50) * 25
+            body.atp = round((ltp + close) / 2, 2)
+            body.vtt = random.randint(10000, 10000000)
+            body.oi = float(random.randint(0, 5000000))
+            body.tbq = float(random.randint(0, 1000000))
+            body.tsq = float(random.randint(0, 1000000))
+        elif mode == 'option_greeks':
+            body = feed.firstLevelWithGreeks
+            ltpc = body.ltpc
+            body.firstDepth.bidP = round(ltp - 0.05, 2)
+            body.firstDepth.bidQ = random.randint(1, 50) * 25
+            body.firstDepth.askP = round(ltp + 0.05, 2)
+            body.firstDepth.askQ = random.randint(1, 50) * 25
+            body.optionGreeks.delta = round(random.uniform(-1, 1), 4)
+            body.optionGreeks.theta = round(random.uniform(-20, 0), 4)
+            body.optionGreeks.gamma = round(random.uniform(0, 0.01), 6)
+            body.optionGreeks.vega = round(random.uniform(0, 10), 4)
+            body.vtt = random.randint(10000, 10000000)
+            body.oi = float(random.randint(0, 5000000))
+            body.iv = round(random.uniform(0.1, 0.6), 4)
+        else:
+            ltpc = feed.ltpc
+        ltpc.ltp = ltp
+        ltpc.ltt = now_ms
+        ltpc.ltq = random.choice((1, 5, 10, 25, 50, 100, 500, 1000))
+        ltpc.cp = close
+
+
+def _main(argv):
+    parser = argparse.ArgumentParser(prog='python -m app.fake_feed_server', description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between tick rounds')
+    parser.add_argument('--max-keys', type=int, default=5000, help='subscription limit per connection')
+    parser.add_argument('--keys-per-frame', type=int, default=100, help='instruments per FeedResponse')
+    args = parser.parse_args(argv)
+    server = FakeFeedServer(args.host, args.port, args.interval, args.max_keys, args.keys_per_frame)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    print(f"Fake feed stats: {server.stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
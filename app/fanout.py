@@ -0,0 +1,220 @@
+import threading
+import time
+
+from .aggregation import BAR_TIME, BUBBLE_TIME
+from .metrics import METRICS
+from .wire import BINARY_MIN_TICKS, WIRE_BINARY, WIRE_JSON, encode_ticks
+
+
+class LiveFanout:
+    """
+    Conflates live updates per Socket.IO room and sends them as one batch per
+    room every `flush_interval` seconds.
+
+    Live ticks are kept in full, in arrival order, and sent as a `live_ticks` event,
+    once per wire format that has viewers: a `ticks` list to the JSON room and one
+    binary `block` (see app/wire.py) to the binary room of the security.
+    Bar updates only keep the latest state of each bar and bubble group (later states
+    supersede earlier ones) and are sent as a `bar_updates` event. Quotes keep only
+    the latest one per room and are sent as a `quote` event. Other events queued
+with `add_event` are sent as they are, in order. The receive path
+    only appends to in-memory buffers; a background task, started with `start` when
+    the first client connects, does all the emitting.
+
+    Args:
+        socketio: The Flask-SocketIO server.
+        namespace (str): Namespace the batches are emitted on.
+        flush_interval (float): Seconds between flushes. 0 or less emits every update at once.
+        stats_log_interval (float): Seconds between log lines with the frame/update totals.
+    """
+    def __init__(self, socketio, namespace, flush_interval=0.15, stats_log_interval=60.0):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.stats_log_interval = stats_log_interval
+        self._lock = threading.Lock()
+        self._ticks = {}
+        self._bars = {}
+        self._quotes = {}
+        self._events = []
+        self._room_stats = {}
+        self._tick_viewers = {}
+        self._task = None
+
+    @staticmethod
+    def tick_room(security_id, wire=WIRE_JSON):
+        """Room receiving a security's `live_ticks` in the given wire format."""
+        return security_id if wire == WIRE_JSON else 'bin:' + security_id
+
+    def watch_ticks(self, security_id, wire, delta):
+        """Counts clients (+1/-1) in a security's tick room, so formats nobody reads are not encoded."""
+        with self._lock:
+            key = (security_id, wire)
+            count = self._tick_viewers.get(key, 0) + delta
+            if count > 0:
+                self._tick_viewers[key] = count
+            else:
+                self._tick_viewers.pop(key, None)
+
+    def add_tick(self, security_id, tick):
+        """Queues one live Tick for the rooms of its security, unless no client is in them."""
+        with self._lock:
+            if not self._buffering():
+                return
+            if (security_id, WIRE_JSON) not in self._tick_viewers and (security_id, WIRE_BINARY) not in self._tick_viewers:
+                return
+            pending = self._ticks.get(security_id)
+            if pending is None:
+                pending = self._ticks[security_id] = []
+            pending.append(tick)
+        self._after_add()
+
+    def add_bar_update(self, room, key, bar, bubble, avg_ltq):
+        """Queues the new state of a bar and bubble group for a server-side view's room."""
+        with self._lock:
+            if not self._buffering():
+                return
+            pending = self._bars.get(room)
+            if pending is None:
+                pending = self._bars[room] = {'key': key, 'bars': {}, 'bubbles': {}, 'updates': 0}
+            pending['bars'][bar[BAR_TIME]] = list(bar)
+            pending['bubbles'][bubble[BUBBLE_TIME]] = list(bubble)
+            pending['avgLtq'] = avg_ltq
+            pending['updates'] += 1
+        self._after_add()
+
+    def add_quote(self, room, security_id, quote):
+        """Queues the latest depth/OI quote (in wire shape) of a security for a room."""
+        with self._lock:
+            if not self._buffering():
+                return
+            pending = self._quotes.get(room)
+            if pending is None:
+                self._quotes[room] = {'securityId': security_id, 'quote': quote, 'updates': 1}
+            else:
+                pending['quote'] = quote
+                pending['updates'] += 1
+        self._after_add()
+
+    def add_event(self, event, data, room=None, namespace=None):
+        """
+        Queues any other event for the next flush, for code on feed or worker threads:
+        under eventlet an emit from outside the server's context never reaches the
+        client. Events are sent in order, ahead of the batch they were queued with.
+        """
+        with self._lock:
+            if not self._buffering():
+                return
+            self._events.append((event, data, room, namespace or self.namespace))
+        self._after_add()
+
+    def flush(self):
+        """Emits everything buffered so far, one event per room."""
+        with self._lock:
+            events, self._events = self._events, []
+            ticks, self._ticks = self._ticks, {}
+            bars, self._bars = self._bars, {}
+            quotes, self._quotes = self._quotes, {}
+            tick_viewers = dict(self._tick_viewers)
+        if not (events or ticks or bars or quotes):
+            return
+        start = time.perf_counter()
+
+        for event, data, room, namespace in events:
+            self.socketio.emit(event, data, room=room, namespace=namespace)
+
+        for security_id, pending in ticks.items():
+            json_ticks = None
+            if tick_viewers.get((security_id, WIRE_JSON)):
+                json_ticks = [tick.to_wire() for tick in pending]
+                self.socketio.emit('live_ticks', {'securityId': security_id, 'ticks': json_ticks},
+                                   room=security_id, namespace=self.namespace)
+                self._count(security_id, len(pending))
+            if tick_viewers.get((security_id, WIRE_BINARY)):
+                if len(pending) >= BINARY_MIN_TICKS:
+                    payload = {'securityId': security_id, 'block': encode_ticks(pending)}
+                else:
+                    payload = {'securityId': security_id, 'ticks': json_ticks or [tick.to_wire() for tick in pending]}
+                room = self.tick_room(security_id, WIRE_BINARY)
+                self.socketio.emit('live_ticks', payload, room=room, namespace=self.namespace)
+                self._count(room, len(pending))
+
+        for room, pending in bars.items():
+            security_id, candle_ms, bubble_ms, big_player_qty = pending['key']
+            self.socketio.emit('bar_updates', {
+                'securityId': security_id,
+                'candleInterval': candle_ms,
+                'bubbleInterval': bubble_ms,
+                'bigPlayerQty': big_player_qty,
+                'bars': [pending['bars'][t] for t in sorted(pending['bars'])],
+                'bubbles': list(pending['bubbles'].values()),
+                'avgLtq': pending['avgLtq'],
+            }, room=room, namespace=self.namespace)
+            self._count(room, pending['updates'])
+
+        for room, pending in quotes.items():
+            self.socketio.emit('quote', {'securityId': pending['securityId'], 'quote': pending['quote']},
+                               room=room, namespace=self.namespace)
+            self._count(room, pending['updates'])
+        METRICS.observe('fanout_flush', time.perf_counter() - start)
+
+    def stats(self):
+        """
+        Returns:
+            dict: room -> {'frames', 'updates', 'max_batch'} where `updates` counts the
+            ticks (or bar updates) folded into the room's `frames` emits.
+        """
+        with self._lock:
+            return {room: dict(counters) for room, counters in self._room_stats.items()}
+
+    def totals(self):
+        """Returns frames and updates summed over every room."""
+        stats = self.stats()
+        return {
+            'rooms': len(stats),
+            'frames': sum(counters['frames'] for counters in stats.values()),
+            'updates': sum(counters['updates'] for counters in stats.values()),
+        }
+
+    def _count(self, room, updates):
+        with self._lock:
+            counters = self._room_stats.get(room)
+            if counters is None:
+                counters = self._room_stats[room] = {'frames': 0, 'updates': 0, 'max_batch': 0}
+            counters['frames'] += 1
+            counters['updates'] += updates
+            if updates > counters['max_batch']:
+                counters['max_batch'] = updates
+
+    def start(self):
+        """
+        Starts the background flush task, once. Call it from the server's context (a
+        Socket.IO handler): under eventlet a task started from a feed thread is never
+        scheduled. Until then nobody can be in a room, so updates are not buffered.
+        """
+        with self._lock:
+            if self._task is None and self.flush_interval > 0:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def _buffering(self):
+        """True once updates have somewhere to go. Call with the lock held."""
+        return self._task is not None or self.flush_interval <= 0
+
+    def _after_add(self):
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def _run(self):
+        """Background task: flushes the buffers every `flush_interval` seconds."""
+        last_log = time.monotonic()
+        while True:
+            started = time.monotonic()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing live updates: {e}")
+            if started - last_log >= self.stats_log_interval:
+                totals = self.totals()
+                print(f"Live fan-out: {totals['updates']} updates in {totals['frames']} frames across {totals['rooms']} rooms.")
+                last_log = started
+            self.socketio.sleep(max(0.0, self.flush_interval - (time.monotonic() - started)))
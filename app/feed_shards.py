@@ -0,0 +1,484 @@
+import queue
+import ssl
+import threading
+import time
+
+import upstox_client
+import websocket
+from upstox_client.feeder.market_data_feeder_v3 import MarketDataFeederV3
+from upstox_client.feeder.proto import MarketDataFeedV3_pb2
+
+from .metrics import METRICS
+from .reconnect import ReconnectSupervisor
+from .ticks import decode_feed_response
+
+UPSTOX_FEED_URL = "wss://api.upstox.com/v3/feed/market-data-feed"
+
+# Shard connection states
+DISCONNECTED = "DISCONNECTED"
+CONNECTING = "CONNECTING"
+CONNECTED = "CONNECTED"
+
+# Instruments per subscribe request when a connection (re)opens.
+RESUBSCRIBE_BATCH_SIZE = 500
+
+# Handshake status the feed answers with when it rejects the access token.
+HTTP_UNAUTHORIZED = 401
+
+# Sentinel that stops a worker thread.
+_STOP = object()
+
+
+class RawFeedFeeder(MarketDataFeederV3):
+    """
+    MarketDataFeederV3 that connects to a configurable URL (the stock feeder
+    hard-codes the Upstox endpoint), so shards can be pointed at a local fake feed.
+    """
+    def __init__(self, feed_url=UPSTOX_FEED_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.feed_url = feed_url
+
+    def connect(self):
+        if self.ws and self.ws.sock:
+            return
+        headers = {'Authorization': self.api_client.configuration.auth_settings().get("OAUTH2")["value"]}
+        self.ws = websocket.WebSocketApp(self.feed_url,
+                                         header=headers,
+                                         on_open=self.on_open,
+                                         on_message=self.on_message,
+                                         on_error=self.on_error,
+                                         on_close=self.on_close)
+        sslopt = {"cert_reqs": ssl.CERT_NONE, "check_hostname": False}
+        threading.Thread(target=self.ws.run_forever, kwargs={"sslopt": sslopt}, daemon=True).start()
+
+
+class RawFeedStreamer(upstox_client.MarketDataStreamerV3):
+    """
+    MarketDataStreamerV3 that emits the raw protobuf frame.
+    The stock streamer decodes and runs MessageToDict on the socket thread before
+    emitting; here decoding is left to the shard's decode worker.
+    """
+    def __init__(self, api_client=None, instrumentKeys=[], mode="ltpc", feed_url=UPSTOX_FEED_URL):
+        super().__init__(api_client, instrumentKeys, mode)
+        self.feed_url = feed_url
+
+    def connect(self):
+        self.feeder = RawFeedFeeder(
+            feed_url=self.feed_url, api_client=self.api_client, instrumentKeys=self.instrumentKeys,
+            mode=self.mode, on_open=self.handle_open, on_message=self.handle_message,
+            on_error=self.handle_error, on_close=self.handle_close)
+        self.feeder.connect()
+
+    def handle_message(self, ws, message):
+        self.emit(self.Event["MESSAGE"], message)
+
+
+def default_streamer_factory(api_client, feed_url):
+    """Builds the streamer for one shard."""
+    return RawFeedStreamer(api_client, feed_url=feed_url)
+
+
+def is_unauthorized(error):
+    """True if `error` is the feed refusing the WebSocket handshake for a rejected access token."""
+    return (isinstance(error, websocket.WebSocketBadStatusException)
+            and error.status_code == HTTP_UNAUTHORIZED)
+
+
+class FeedShard:
+    """
+    One market data connection carrying a subset of the instrument keys.
+
+    The socket thread only queues raw frames; a per-shard decode worker turns them
+    into Tick records and hands them to the shared pipeline. Each shard keeps its own
+    connection state; when the connection drops, the feed's ReconnectSupervisor
+    reopens it with exponential backoff.
+
+    Every connection gets a new epoch, and frames are queued with the epoch they
+    arrived on. The first message of a new epoch is compared with the last
+    `currentTs` seen before the drop, and the difference is reported as a gap.
+
+    `keys` is changed by subscribing threads and read by the socket and decode
+    threads, so it is only touched under the shard's lock; `key_count`, `mode_of`
+    and `snapshot_keys` give other threads a consistent view.
+    """
+    def __init__(self, shard_id, feed, decode_queue_size):
+        self.shard_id = shard_id
+        self.feed = feed
+        self.keys = {}            # instrument_key -> subscription mode
+        self.connection_state = DISCONNECTED
+        self.streamer = None
+        self._lock = threading.Lock()
+        self._frames = queue.Queue(maxsize=decode_queue_size)
+        self._stopped = False
+        self._epoch = 0
+        self._decoded_epoch = 0
+        self.last_ts = None
+        self.stats = {'frames': 0, 'ticks': 0, 'dropped_frames': 0, 'decode_errors': 0, 'connects': 0,
+                      'reconnects': 0, 'gaps': 0, 'last_gap_ms': 0, 'max_gap_ms': 0}
+        self._worker = threading.Thread(target=self._decode_loop, name=f"FeedShard-{shard_id}-decode", daemon=True)
+        self._worker.start()
+
+    def is_connected(self):
+        return self.connection_state == CONNECTED
+
+    def key_count(self):
+        with self._lock:
+            return len(self.keys)
+
+    def mode_of(self, key):
+        with self._lock:
+            return self.keys.get(key)
+
+    def snapshot_keys(self):
+        """Returns a copy of {instrument_key: mode} for this shard."""
+        with self._lock:
+            return dict(self.keys)
+
+    def connect(self):
+        """Opens this shard's connection unless it is already open or opening."""
+        with self._lock:
+            if self._stopped or self.connection_state in (CONNECTED, CONNECTING):
+                return
+            self.connection_state = CONNECTING
+            streamer = self.feed.streamer_factory(self.feed.api_client, self.feed.feed_url)
+            # Reconnects are handled here, not by the SDK, so a shard never has two sockets.
+            streamer.enable_auto_reconnect = False
+            # Callbacks carry their streamer so a late close from a replaced socket is ignored.
+            self._epoch += 1
+            epoch = self._epoch
+            streamer.on("open", lambda: self._on_open(streamer))
+            streamer.on("message", lambda frame: self._on_message(epoch, frame))
+            streamer.on("close", lambda code, reason: self._on_close(streamer, code, reason))
+            streamer.on("error", lambda error: self._on_error(streamer, error))
+            self.streamer = streamer
+            self.stats['connects'] += 1
+        try:
+            print(f"Shard {self.shard_id}: connecting to {self.feed.feed_url}...")
+            streamer.connect()
+        except Exception as e:
+            print(f"Shard {self.shard_id}: error connecting: {e}")
+            self._connection_lost(streamer, f'Error connecting to Upstox: {e}.', is_unauthorized(e))
+
+    def subscribe(self, keys, mode="ltpc"):
+        """Adds keys to this shard and subscribes them now if the shard is connected."""
+        with self._lock:
+            for key in keys:
+                self.keys[key] = mode
+        streamer = self.streamer
+        if streamer is not None and self.is_connected():
+            try:
+                self._send_subscribe(streamer, list(keys), mode)
+                print(f"Shard {self.shard_id}: subscribed {len(keys)} instruments.")
+            except Exception as e:
+                print(f"Shard {self.shard_id}: failed to subscribe: {e}. They will be subscribed on (re)connect.")
+
+    def unsubscribe(self, keys):
+        """Removes keys from this shard and unsubscribes them if the shard is connected."""
+        with self._lock:
+            for key in keys:
+                self.keys.pop(key, None)
+        streamer = self.streamer
+        if streamer is not None and self.is_connected():
+            try:
+                batch_size = self.feed.subscribe_batch_size
+                for i in range(0, len(keys), batch_size):
+                    streamer.unsubscribe(keys[i:i + batch_size])
+            except Exception as e:
+                print(f"Shard {self.shard_id}: failed to unsubscribe: {e}. The connection will drop them on reconnect.")
+
+    def change_mode(self, keys, mode):
+        """Switches keys already on this shard to another subscription mode."""
+        with self._lock:
+            for key in keys:
+                self.keys[key] = mode
+        streamer = self.streamer
+        if streamer is not None and self.is_connected():
+            try:
+                batch_size = self.feed.subscribe_batch_size
+                for i in range(0, len(keys), batch_size):
+                    streamer.change_mode(keys[i:i + batch_size], mode)
+            except Exception as e:
+                print(f"Shard {self.shard_id}: failed to change mode: {e}. It will be applied on (re)connect.")
+
+    def disconnect(self):
+        """Closes the connection without reconnecting."""
+        self.feed.supervisor.cancel(self)
+        with self._lock:
+            streamer, self.streamer = self.streamer, None
+            was_open = self.connection_state != DISCONNECTED
+            self.connection_state = DISCONNECTED
+        if streamer is not None and was_open:
+            try:
+                streamer.disconnect()
+            except Exception as e:
+                print(f"Shard {self.shard_id}: error while disconnecting: {e}")
+
+    def stop(self):
+        """Disconnects for good and stops the decode worker."""
+        self._stopped = True
+        self.disconnect()
+        try:
+            self._frames.put(_STOP, timeout=1.0)
+        except queue.Full:
+            pass
+
+    def queue_depth(self):
+        return self._frames.qsize()
+
+    def _on_open(self, streamer):
+        with self._lock:
+            if streamer is not self.streamer:
+                return
+            self.connection_state = CONNECTED
+            keys = dict(self.keys)
+        self.feed.supervisor.reset(self)
+        self.feed.on_status(f'Shard {self.shard_id} connected to Upstox market data.')
+        if keys:
+            print(f"Shard {self.shard_id}: resubscribing to {len(keys)} instruments on connection open.")
+            by_mode = {}
+            for key, mode in keys.items():
+                by_mode.setdefault(mode, []).append(key)
+            try:
+                for mode, keys in by_mode.items():
+                    self._send_subscribe(streamer, keys, mode)
+            except Exception as e:
+                print(f"Shard {self.shard_id}: failed to resubscribe: {e}")
+
+    def _send_subscribe(self, streamer, keys, mode):
+        """Subscribes keys in requests of at most RESUBSCRIBE_BATCH_SIZE instruments."""
+        batch_size = self.feed.subscribe_batch_size
+        for i in range(0, len(keys), batch_size):
+            streamer.subscribe(keys[i:i + batch_size], mode)
+
+    def _on_message(self, epoch, frame):
+        try:
+            self._frames.put_nowait((epoch, frame))
+        except queue.Full:
+            self.stats['dropped_frames'] += 1
+            METRICS.inc('feed_dropped_frames', shard=self.shard_id)
+
+    def _on_close(self, streamer, code, reason):
+        print(f"Shard {self.shard_id}: connection closed: {code} - {reason}")
+        self._connection_lost(streamer, 'Disconnected from Upstox market data.')
+
+    def _on_error(self, streamer, error):
+        print(f"Shard {self.shard_id}: WebSocket error: {error}")
+        self._connection_lost(streamer, f'WebSocket Error: {error}', is_unauthorized(error))
+
+    def _connection_lost(self, streamer, message, unauthorized=False):
+        """
+        Marks the shard down and schedules a reconnect, without blocking the socket thread.
+        A shard whose token was rejected (`unauthorized`) is not reconnected.
+        """
+        with self._lock:
+            if streamer is not self.streamer or self._stopped:
+                return  # Closed on purpose, or a socket that was already replaced.
+            self.connection_state = DISCONNECTED
+            self.streamer = None
+        self.feed.on_status(f'Shard {self.shard_id}: {message}')
+        if unauthorized:
+            # Retrying with a rejected token cannot succeed; a new login reconnects.
+            print(f"Shard {self.shard_id}: access token rejected, not reconnecting.")
+            return
+        self.stats['reconnects'] += 1
+        delay = self.feed.supervisor.schedule(self)
+        print(f"Shard {self.shard_id}: reconnecting in {delay:.1f}s (attempt {self.feed.supervisor.attempts(self)}).")
+
+    def _decode_loop(self):
+        """Decode worker: raw frames -> Tick records -> shared pipeline."""
+        while True:
+            item = self._frames.get()
+            if item is _STOP:
+                return
+            epoch, frame = item
+            self.stats['frames'] += 1
+            start = time.perf_counter()
+            try:
+                message = MarketDataFeedV3_pb2.FeedResponse.FromString(frame)
+                quotes = []
+                ticks, current_ts = decode_feed_response(message, self.feed.instrument_map, quotes)
+            except Exception as e:
+                self.stats['decode_errors'] += 1
+                METRICS.inc('feed_decode_errors', shard=self.shard_id)
+                print(f"Shard {self.shard_id}: error decoding market data message: {e}")
+                continue
+            METRICS.observe('decode', time.perf_counter() - start)
+            if current_ts:
+                # Exchange/server timestamp to decoded: network plus queueing upstream of us.
+                METRICS.observe('feed_delay', max(0.0, time.time() - current_ts / 1000.0))
+            if current_ts:
+                if epoch != self._decoded_epoch:
+                    self._check_gap(current_ts)
+                    self._decoded_epoch = epoch
+                self.last_ts = current_ts
+            if ticks:
+                self.stats['ticks'] += len(ticks)
+                self.feed._publish(self.shard_id, ticks, current_ts, quotes)
+
+    def _check_gap(self, first_ts):
+        """Reports the time between the last message before a reconnect and the first one after it."""
+        if self.last_ts is None:
+            return
+        gap_ms = first_ts - self.last_ts
+        self.stats['gaps'] += 1
+        self.stats['last_gap_ms'] = gap_ms
+        self.stats['max_gap_ms'] = max(self.stats['max_gap_ms'], gap_ms)
+        keys = set(self.snapshot_keys())
+        print(f"Shard {self.shard_id}: feed gap of {gap_ms} ms for {len(keys)} instruments after reconnect.")
+        self.feed.on_gap(self.shard_id, keys, self.last_ts, first_ts)
+
+
+class ShardedFeed:
+    """
+    Spreads instrument keys over `n_shards` market data connections and merges
+    their ticks into one pipeline.
+
+    New keys go to the least loaded shard (never beyond `max_keys_per_shard`) and
+    stay there, so each instrument's ticks always come from one connection and one
+    decode worker and therefore stay in order. A single dispatcher thread drains the
+    merged queue and calls `on_ticks(ticks, current_ts, quotes)`, so downstream code
+    sees one ordered stream no matter how many shards there are.
+
+    Every key carries its own subscription mode. `quotes` holds the MarketQuote
+    records of keys in `full` or `option_greeks` mode and is empty for ltpc keys.
+
+    Args:
+        on_ticks (callable): Receives (ticks, current_ts, quotes) for every decoded message.
+        instrument_map (dict): instrument_key -> trading symbol.
+        n_shards (int): Number of connections.
+        max_keys_per_shard (int): Subscription limit per connection.
+        feed_url (str): Market data WebSocket URL (a local fake feed in tests).
+        streamer_factory (callable): (api_client, feed_url) -> streamer; see default_streamer_factory.
+        on_status (callable): Receives human readable connection status messages.
+        on_gap (callable): Receives (shard_id, keys, last_ts, first_ts) when a shard
+            reconnects, with the currentTs before and after the outage.
+        supervisor (ReconnectSupervisor): Schedules reconnects (one is created if omitted).
+        subscribe_batch_size (int): Instruments per subscribe request.
+    """
+    def __init__(self, on_ticks, instrument_map, n_shards=1, max_keys_per_shard=5000,
+                 feed_url=UPSTOX_FEED_URL, streamer_factory=default_streamer_factory,
+                 on_status=None, on_gap=None, supervisor=None, subscribe_batch_size=RESUBSCRIBE_BATCH_SIZE,
+                 decode_queue_size=10000, pipeline_queue_size=50000):
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1.")
+        self.on_ticks = on_ticks
+        self.instrument_map = instrument_map
+        self.max_keys_per_shard = max_keys_per_shard
+        self.feed_url = feed_url
+        self.streamer_factory = streamer_factory
+        self.on_status = on_status or (lambda message: None)
+        self.on_gap = on_gap or (lambda shard_id, keys, last_ts, first_ts: None)
+        self.supervisor = supervisor or ReconnectSupervisor()
+        self.subscribe_batch_size = subscribe_batch_size
+        self.api_client = None
+        self._assignments = {}
+        self._assign_lock = threading.Lock()
+        self._pipeline = queue.Queue(maxsize=pipeline_queue_size)
+        self.stats = {'messages': 0, 'dropped_messages': 0, 'unassigned_keys': 0}
+        self.shards = [FeedShard(i, self, decode_queue_size) for i in range(n_shards)]
+        METRICS.gauge('queue_depth', self._pipeline.qsize, queue='pipeline')
+        for shard in self.shards:
+            METRICS.gauge('queue_depth', shard.queue_depth, queue=f'decode_{shard.shard_id}')
+        METRICS.gauge('feed_connections', lambda: sum(shard.is_connected() for shard in self.shards))
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="ShardedFeed-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def connect(self, access_token):
+        """Connects every shard with the given access token."""
+        config = upstox_client.Configuration()
+        config.access_token = access_token
+        self.api_client = upstox_client.ApiClient(config)
+        for shard in self.shards:
+            shard.connect()
+
+    def disconnect(self):
+        for shard in self.shards:
+            shard.disconnect()
+
+    def close(self):
+        """Disconnects every shard and stops the worker threads."""
+        for shard in self.shards:
+            shard.stop()
+        self.supervisor.stop()
+        self._pipeline.put(_STOP)
+        self._dispatcher.join(timeout=5.0)
+
+    def is_connected(self):
+        """True if at least one shard is connected."""
+        return any(shard.is_connected() for shard in self.shards)
+
+    def subscribe(self, keys, mode="ltpc"):
+        """Assigns new keys to shards and subscribes them."""
+        by_shard = {}
+        with self._assign_lock:
+            for key in keys:
+                if key in self._assignments:
+                    continue
+                shard = min(self.shards, key=lambda s: s.key_count() + len(by_shard.get(s.shard_id, ())))
+                if shard.key_count() + len(by_shard.get(shard.shard_id, ())) >= self.max_keys_per_shard:
+                    self.stats['unassigned_keys'] += 1
+                    print(f"All {len(self.shards)} shards are full ({self.max_keys_per_shard} keys each); not subscribing {key}.")
+                    continue
+                self._assignments[key] = shard.shard_id
+                by_shard.setdefault(shard.shard_id, []).append(key)
+        for shard_id, shard_keys in by_shard.items():
+            self.shards[shard_id].subscribe(shard_keys, mode)
+
+    def unsubscribe(self, keys):
+        """Unsubscribes keys and frees their place on their shards."""
+        by_shard = {}
+        with self._assign_lock:
+            for key in keys:
+                shard_id = self._assignments.pop(key, None)
+                if shard_id is not None:
+                    by_shard.setdefault(shard_id, []).append(key)
+        for shard_id, shard_keys in by_shard.items():
+            self.shards[shard_id].unsubscribe(shard_keys)
+
+    def change_mode(self, keys, mode):
+        """Switches subscribed keys to another mode on the shards that carry them."""
+        by_shard = {}
+        for key in keys:
+            shard_id = self._assignments.get(key)
+            if shard_id is not None:
+                by_shard.setdefault(shard_id, []).append(key)
+        for shard_id, shard_keys in by_shard.items():
+            self.shards[shard_id].change_mode(shard_keys, mode)
+
+    def mode_of(self, key):
+        """Returns the subscription mode of a key, or None if it is not subscribed."""
+        shard_id = self._assignments.get(key)
+        return self.shards[shard_id].mode_of(key) if shard_id is not None else None
+
+    def shard_for(self, key):
+        """Returns the id of the shard carrying a key, or None."""
+        return self._assignments.get(key)
+
+    def shard_stats(self):
+        """Returns per-shard state, key count, queue depth and counters."""
+        return [
+            dict(shard.stats, shard=shard.shard_id, state=shard.connection_state,
+                 keys=shard.key_count(), queue_depth=shard.queue_depth())
+            for shard in self.shards
+        ]
+
+    def _publish(self, shard_id, ticks, current_ts, quotes):
+        """Called by decode workers: queues a decoded message for the dispatcher."""
+        try:
+            self._pipeline.put((ticks, current_ts, quotes, time.perf_counter()), timeout=1.0)
+        except queue.Full:
+            self.stats['dropped_messages'] += 1
+            METRICS.inc('feed_dropped_messages')
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._pipeline.get()
+            if item is _STOP:
+                return
+            ticks, current_ts, quotes, queued_at = item
+            self.stats['messages'] += 1
+            METRICS.observe('pipeline_wait', time.perf_counter() - queued_at)
+            try:
+                self.on_ticks(ticks, current_ts, quotes)
+            except Exception as e:
+                print(f"Error handling ticks: {e}")
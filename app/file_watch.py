@@ -0,0 +1,105 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1  # Raises AttributeError if the symbol is missing.
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirectoryWatcher:
+    """
+    Waits for files in a directory to be created or written to.
+
+    Uses inotify through ctypes on Linux, so changes are seen as soon as they happen.
+    Elsewhere, or if inotify cannot be set up, it falls back to sleeping for
+    `poll_interval` seconds and letting the caller re-check the files itself.
+
+    Args:
+        directory (str): Directory to watch (not recursive).
+        poll_interval (float): Seconds between checks in polling mode.
+    """
+    def __init__(self, directory, poll_interval=1.0):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._libc = _load_libc()
+        if self._libc is not None:
+            self._open_inotify()
+        mode = "inotify" if self._fd is not None else f"polling every {poll_interval}s"
+        print(f"Watching {directory} for changes ({mode}).")
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def wait(self, timeout=None):
+        """
+        Blocks until something in the directory changes or `timeout` seconds pass.
+
+        Returns:
+            set: Names of the files that changed, or None if the watcher cannot tell
+            (polling mode), in which case the caller should check every file it cares about.
+        """
+        if self._fd is None:
+            time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+            return None
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        return self._read_events()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open_inotify(self):
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return
+        wd = self._libc.inotify_add_watch(fd, os.fsencode(self.directory), WATCH_MASK)
+        if wd < 0:
+            print(f"inotify_add_watch on {self.directory} failed: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return
+        self._fd = fd
+
+    def _read_events(self):
+        names = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
@@ -0,0 +1,506 @@
+import os
+import re
+import json
+import mmap
+import threading
+from collections import OrderedDict
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .aggregation import MAX_LTT_MS
+from .tick_store import TickColumns, TickStore
+from .tick_journal import TickJournalReader, journal_exists, journal_record_count
+
+# Matches the instrument key of each feed object in a JSONL line without parsing the
+# JSON, whatever the separators and key order the line was written with.
+_FEED_KEY_PATTERN = re.compile(rb'"([A-Z_]+\|[^"]+)"\s*:\s*\{')
+
+_DECODER = json.JSONDecoder()
+
+# Files smaller than this are parsed in-process; a pool costs more than it saves.
+PARALLEL_PARSE_MIN_BYTES = 8 * 1024 * 1024
+
+
+def parse_jsonl_line(line, columns_by_security, only=None):
+    """
+    Parses one JSONL history line and appends its ltpc ticks to `columns_by_security`.
+
+    Args:
+        line (bytes): One line of the day file.
+        columns_by_security (dict): security_id -> TickColumns, filled in place.
+        only (str): If given, ticks for other securities are skipped.
+    """
+    data = json.loads(line)
+    for sec_id, feed_data in data.get('feeds', {}).items():
+        if only is not None and sec_id != only:
+            continue
+        ltpc = feed_data.get('ltpc')
+        if ltpc:
+            columns = columns_by_security.get(sec_id)
+            if columns is None:
+                columns = columns_by_security[sec_id] = TickColumns()
+            _append_ltpc(columns, ltpc)
+
+
+def _decode_object_at(data, start):
+    """Decodes the JSON object starting at byte `start` of a line, reading no more of the line than it needs."""
+    end = data.find(b'\n', start)
+    if end < 0:
+        end = len(data)
+    size = 512
+    while True:
+        stop = min(start + size, end)
+        try:
+            return _DECODER.raw_decode(data[start:stop].decode())[0]
+        except ValueError:
+            # Cut off mid-object (or mid-character): read more of the line.
+            if stop >= end:
+                raise
+            size *= 4
+
+
+def _append_ltpc(columns, ltpc):
+    columns.append(
+        int(ltpc.get('ltt', 0)),
+        float(ltpc.get('ltp', 0.0)),
+        int(ltpc.get('ltq', 0)),
+        float(ltpc.get('cp', 0.0)),
+    )
+
+
+class JsonlIndex:
+    """
+    Tick index of a JSONL history file: for each security, the byte offset of every
+    feed object it has in the file. It is built with one regex scan (no JSON parsing)
+    on first use, after which one security is loaded by decoding only its own small
+    feed objects instead of parsing the whole file, like the binary journal's .idx.
+    Feeds without an ltpc (e.g. other modes) are skipped as parse_jsonl_line does.
+
+    Costs 8 bytes per tick.
+
+    Args:
+        path (str): JSONL day file.
+        end_offset (int): Only lines that start before this offset are indexed
+            (default: the whole file).
+    """
+    def __init__(self, path, end_offset=None):
+        self.path = path
+        self.end_offset = os.path.getsize(path) if end_offset is None else end_offset
+        self._offsets = None
+        self._lock = threading.Lock()
+
+    def securities(self):
+        """Returns the sorted securities with feeds in the file."""
+        return sorted(self._build())
+
+    def read_columns(self, security_id):
+        """Decodes one security's ticks into a TickColumns (empty if it has none)."""
+        for _, columns in self.read_many([security_id]):
+            return columns
+
+    def read_many(self, security_ids):
+        """Yields (security_id, TickColumns) for several securities, mapping the file once."""
+        index = self._build()
+        if not any(index.get(security_id) for security_id in security_ids):
+            for security_id in security_ids:
+                yield security_id, TickColumns()
+            return
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for security_id in security_ids:
+                columns = TickColumns()
+                for start in index.get(security_id, ()):
+                    try:
+                        ltpc = _decode_object_at(data, start).get('ltpc')
+                        if ltpc:
+                            _append_ltpc(columns, ltpc)
+                    except json.JSONDecodeError as e:
+                        print(f"Error decoding JSON at byte {start}: {e}")
+                    except (TypeError, AttributeError, ValueError) as e:
+                        print(f"Error processing data at byte {start}: {e}")
+                yield security_id, columns
+
+    @property
+    def nbytes(self):
+        return sum(len(offsets) * 8 for offsets in (self._offsets or {}).values())
+
+    def _build(self):
+        with self._lock:
+            if self._offsets is None:
+                found = {}
+                offset = 0
+                with open(self.path, 'rb') as f:
+                    for line in f:
+                        if offset >= self.end_offset:
+                            break
+                        for match in _FEED_KEY_PATTERN.finditer(line):
+                            offsets = found.get(match.group(1))
+                            if offsets is None:
+                                offsets = found[match.group(1)] = array('q')
+                            offsets.append(offset + match.end() - 1)
+                        offset += len(line)
+                self._offsets = {key.decode(): offsets for key, offsets in found.items()}
+            return self._offsets
+
+
+def split_file_chunks(path, end_offset, n_chunks):
+    """
+    Splits the byte range [0, end_offset) of a file into up to `n_chunks` ranges whose
+    boundaries fall just after a newline, so every line belongs to exactly one chunk.
+
+    Returns:
+        list: (start, end) byte ranges in file order.
+    """
+    if end_offset <= 0:
+        return []
+    chunk_size = max(1, end_offset // max(1, n_chunks))
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        while boundaries[-1] < end_offset:
+            target = boundaries[-1] + chunk_size
+            if target >= end_offset:
+                boundaries.append(end_offset)
+                break
+            f.seek(target)
+            f.readline()  # Advance to the start of the next line.
+            boundaries.append(min(f.tell(), end_offset))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_jsonl_chunk(path, start, end, only=None):
+    """
+    Parses the lines in the byte range [start, end) of a JSONL history file.
+    Runs inside a worker process.
+
+    Returns:
+        dict: security_id -> TickColumns for the chunk, in file order.
+    """
+    columns_by_security = {}
+    needle = b'"' + only.encode() + b'"' if only is not None else None
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            offset += len(line)
+            if needle is not None and needle not in line:
+                continue
+            try:
+                parse_jsonl_line(line, columns_by_security, only=only)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON at byte {offset - len(line)}: {e}")
+            except (TypeError, AttributeError, ValueError) as e:
+                print(f"Error processing data at byte {offset - len(line)}: {e}")
+    return columns_by_security
+
+
+def parse_jsonl_parallel(path, end_offset=None, workers=None, only=None):
+    """
+    Parses a JSONL history file in a process pool.
+
+    The file is cut into newline-aligned byte ranges, one or more per worker, and
+    each range is parsed independently. The file is written in arrival order, so
+    concatenating each security's per-chunk columns in chunk order yields its ticks
+    in time order.
+
+    Args:
+        path (str): JSONL day file.
+        end_offset (int): Only bytes before this offset are parsed (default: whole file).
+        workers (int): Worker processes (default: os.cpu_count()). 1 parses in-process.
+        only (str): If given, only this security is parsed.
+
+    Returns:
+        dict: security_id -> TickColumns.
+    """
+    if end_offset is None:
+        end_offset = os.path.getsize(path)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or end_offset < PARALLEL_PARSE_MIN_BYTES:
+        return parse_jsonl_chunk(path, 0, end_offset, only)
+
+    # A few chunks per worker keeps them all busy when lines are unevenly sized.
+    chunks = split_file_chunks(path, end_offset, workers * 4)
+    merged = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_jsonl_chunk, path, start, end, only) for start, end in chunks]
+        for future in futures:
+            for security_id, columns in future.result().items():
+                existing = merged.get(security_id)
+                if existing is None:
+                    merged[security_id] = columns
+                else:
+                    existing.extend(columns)
+    return merged
+
+
+class HistoryStore:
+    """
+    Serves each security's tick history as (history on disk) + (live ticks since startup),
+    preceded on request by earlier days from a DayArchive.
+
+    Disk history is loaded per security on first request, from the binary journal
+    when one exists or from the legacy JSONL day file otherwise, and kept in an LRU
+    bounded by `memory_budget` bytes. The security list comes from the journal's
+    instrument index, or from a regex scan of the JSONL file, so answering it never
+    requires loading any ticks. Live ticks are always kept in memory.
+
+    Args:
+        journal_base_path (str): Base path of today's tick journal.
+        jsonl_path (str): Path of today's legacy JSONL history file.
+        memory_budget (int): Maximum bytes of disk history kept loaded, or None for no limit.
+        parse_workers (int): Processes used to parse JSONL history (default: os.cpu_count()).
+        archive (DayArchive): Optional source of the days before this session's, for
+            ranges that reach back past it.
+        disk_history (bool): False for a session that starts live at a day rollover;
+            whatever its files already hold also arrives as live ticks, so none of
+            it is read from disk.
+    """
+    def __init__(self, journal_base_path, jsonl_path, memory_budget=None, parse_workers=None, archive=None,
+                 disk_history=True):
+        self.journal_base_path = journal_base_path
+        self.archive = archive
+        self.jsonl_path = jsonl_path
+        self.memory_budget = memory_budget
+        self.parse_workers = parse_workers
+        self.live = TickStore()
+
+        # Only history written before startup comes from disk; everything after that
+        # arrives as live ticks and is appended to `live` directly.
+        self.use_journal = journal_exists(journal_base_path)
+        self.history_end_record = journal_record_count(journal_base_path) if disk_history else 0
+        self.history_end_offset = os.path.getsize(jsonl_path) if disk_history and os.path.exists(jsonl_path) else 0
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._reader = None
+        self._jsonl_index = None
+        self._disk_securities = None
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def has_disk_history(self):
+        """Returns True if there is any history on disk from before startup."""
+        return (self.use_journal and self.history_end_record > 0) or (not self.use_journal and self.history_end_offset > 0)
+
+    def append_tick(self, tick):
+        """Records a live tick."""
+        self.live.append_tick(tick)
+
+    def securities(self):
+        """Returns the sorted list of securities with disk history or live ticks."""
+        return sorted(set(self._list_disk_securities()) | set(self.live.securities()))
+
+    def to_wire(self, security_id):
+        """Returns a security's full history followed by its live ticks, in the browser's LTPC shape."""
+        return self._load_disk(security_id).to_wire() + self.live.to_wire(security_id)
+
+    def ticks_in_range(self, security_id, start_ms=None, end_ms=None, newest_window_ms=None):
+        """
+        Selects a security's ticks (archived days, disk history, then live) by trade time.
+
+        Ticks keep their arrival order; only those whose ltt (normalized to ms) falls in
+        [start_ms, end_ms) are returned. With `newest_window_ms`, start_ms is instead set
+        that far before the newest tick before end_ms, on whichever day that is. Days
+        before this session are read from the archive, one partition per day, only when
+        the range reaches back into them.
+
+        Ticks ingested since TickValidator are clean already; older day files may still
+        hold non-trades (NaN ltp, ltq <= 0) and unnormalized ltt, so those are dropped
+        and the normalized ltt is returned, and clients never have to repeat either.
+
+        Returns:
+            tuple: (TickColumns, start_ms, has_older) where `has_older` tells whether
+            any tick lies before the returned range.
+        """
+        parts = [self._load_disk(security_id), self.live.copy_columns(security_id)]
+        parts = [columns for columns in parts if columns is not None and len(columns)]
+        selected = TickColumns()
+
+        if newest_window_ms is not None:
+            newest = None
+            if parts:
+                ltt, mask = self._trade_times(parts)
+                if end_ms is not None:
+                    mask &= ltt < end_ms
+                if mask.any():
+                    newest = int(ltt[mask].max())
+            if newest is None and self.archive is not None:
+                newest = self.archive.newest_before(security_id, end_ms)
+            if newest is None:
+                return selected, start_ms, False
+            start_ms = newest - newest_window_ms + 1
+        if self.archive is not None and start_ms is not None and start_ms < self.archive.before_ms:
+            parts = self.archive.columns_between(security_id, start_ms, end_ms) + parts
+        if not parts:
+            return selected, start_ms, False
+
+        ltt, mask = self._trade_times(parts)
+        if end_ms is not None:
+            mask &= ltt < end_ms
+        if start_ms is not None:
+            has_older = bool((ltt[mask] < start_ms).any())
+            if not has_older and self.archive is not None:
+                has_older = self.archive.has_ticks_before(security_id, start_ms)
+            mask &= ltt >= start_ms
+        else:
+            has_older = False
+
+        selected.ltt = array('q', ltt[mask].tobytes())
+        for name in ('ltp', 'ltq', 'cp'):
+            typecode = getattr(selected, name).typecode
+            column = np.concatenate([np.frombuffer(getattr(columns, name), dtype=typecode) for columns in parts])
+            setattr(selected, name, array(typecode, column[mask].tobytes()))
+        return selected, start_ms, has_older
+
+    @staticmethod
+    def _trade_times(parts):
+        """Returns (normalized ltt, mask of trades: finite ltp and ltq > 0) over concatenated parts."""
+        ltt = np.concatenate([np.frombuffer(columns.ltt, dtype=np.int64) for columns in parts])
+        ltt = np.where(ltt > MAX_LTT_MS, ltt // 1000 * 1000, ltt)
+        ltp = np.concatenate([np.frombuffer(columns.ltp, dtype=np.float64) for columns in parts])
+        ltq = np.concatenate([np.frombuffer(columns.ltq, dtype=np.int32) for columns in parts])
+        return ltt, ~np.isnan(ltp) & (ltq > 0)
+
+    def disk_columns(self, security_id):
+        """Returns a security's history from before startup, loading it on first use."""
+        return self._load_disk(security_id)
+
+    def iter_disk_columns(self, security_ids):
+        """
+        Yields (security_id, TickColumns) of many securities' history from before
+        startup, in one pass over the day file, for callers that only need each once:
+        securities not loaded already are read without being added to the LRU.
+        """
+        missing = []
+        for security_id in security_ids:
+            with self._lock:
+                columns = self._cache.get(security_id)
+            if columns is not None:
+                yield security_id, columns
+            else:
+                missing.append(security_id)
+        if not missing:
+            return
+        if not self.has_disk_history():
+            for security_id in missing:
+                yield security_id, TickColumns()
+        elif self.use_journal:
+            reader = self._journal_reader()
+            for security_id in missing:
+                yield security_id, reader.read_columns(security_id)
+        else:
+            yield from self._jsonl_reader().read_many(missing)
+
+    def preload(self):
+        """Loads the disk history of every security (eager mode)."""
+        if self.use_journal or not self.has_disk_history():
+            for security_id in self._list_disk_securities():
+                self._load_disk(security_id)
+            return
+
+        # One parallel pass over the JSONL file beats a scan per security.
+        parsed = parse_jsonl_parallel(self.jsonl_path, self.history_end_offset, self.parse_workers)
+        with self._lock:
+            for security_id, columns in parsed.items():
+                if security_id not in self._cache:
+                    self._cache[security_id] = columns
+                    self._cache_bytes += columns.nbytes
+            self._evict()
+        self._disk_securities = sorted(parsed)
+
+    def memory_usage(self):
+        """
+        Returns:
+            dict: Loaded disk history and live tick sizes plus LRU counters.
+        """
+        with self._lock:
+            usage = {
+                'loaded_securities': len(self._cache),
+                'loaded_ticks': sum(len(columns) for columns in self._cache.values()),
+                'loaded_bytes': self._cache_bytes,
+                'memory_budget': self.memory_budget,
+            }
+            usage.update(self._stats)
+        live = self.live.memory_usage()
+        usage['live_ticks'] = live['ticks']
+        usage['live_bytes'] = live['bytes']
+        return usage
+
+    def _list_disk_securities(self):
+        if self._disk_securities is None:
+            if not self.has_disk_history():
+                self._disk_securities = []
+            elif self.use_journal:
+                self._disk_securities = self._journal_reader().securities()
+            else:
+                self._disk_securities = self._jsonl_reader().securities()
+        return self._disk_securities
+
+    def _journal_reader(self):
+        with self._lock:
+            if self._reader is None:
+                self._reader = TickJournalReader(self.journal_base_path, max_records=self.history_end_record)
+            return self._reader
+
+    def _jsonl_reader(self):
+        with self._lock:
+            if self._jsonl_index is None:
+                self._jsonl_index = JsonlIndex(self.jsonl_path, self.history_end_offset)
+            return self._jsonl_index
+
+    def _load_disk(self, security_id):
+        """Returns the disk history of a security, loading it into the LRU on a miss."""
+        with self._lock:
+            columns = self._cache.get(security_id)
+            if columns is not None:
+                self._cache.move_to_end(security_id)
+                self._stats['hits'] += 1
+                return columns
+            load_lock = self._load_locks.setdefault(security_id, threading.Lock())
+
+        # One loader per security; concurrent requests for it wait and then hit the cache.
+        # The lock is dropped once the load is over, so only loads in progress hold one.
+        with load_lock:
+            try:
+                with self._lock:
+                    columns = self._cache.get(security_id)
+                    if columns is not None:
+                        self._cache.move_to_end(security_id)
+                        self._stats['hits'] += 1
+                        return columns
+                    self._stats['misses'] += 1
+
+                if not self.has_disk_history():
+                    columns = TickColumns()
+                elif self.use_journal:
+                    columns = self._journal_reader().read_columns(security_id)
+                else:
+                    columns = self._read_jsonl_security(security_id)
+
+                with self._lock:
+                    self._cache[security_id] = columns
+                    self._cache_bytes += columns.nbytes
+                    self._evict()
+                return columns
+            finally:
+                with self._lock:
+                    if self._load_locks.get(security_id) is load_lock:
+                        del self._load_locks[security_id]
+
+    def _evict(self):
+        """Drops least recently used securities until the cache fits the budget. Call with the lock held."""
+        if self.memory_budget is None:
+            return
+        while self._cache_bytes > self.memory_budget and len(self._cache) > 1:
+            security_id, columns = self._cache.popitem(last=False)
+            self._cache_bytes -= columns.nbytes
+            self._stats['evictions'] += 1
+            print(f"History LRU evicted {security_id} ({len(columns)} ticks).")
+
+    def _read_jsonl_security(self, security_id):
+        """Reads one security's ticks from the JSONL file, parsing only its indexed lines."""
+        return self._jsonl_reader().read_columns(security_id)
@@ -0,0 +1,167 @@
+import csv
+import os
+import pickle
+import threading
+from collections import namedtuple
+
+# Bump when the snapshot layout changes so stale snapshots are rebuilt.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snapshot.pickle'
+
+INSTRUMENT_FIELDS = (
+    'instrument_key', 'exchange_token', 'tradingsymbol', 'name', 'last_price', 'expiry',
+    'strike', 'tick_size', 'lot_size', 'instrument_type', 'option_type', 'exchange',
+)
+
+
+class Instrument(namedtuple('Instrument', INSTRUMENT_FIELDS)):
+    """One row of instruments.csv. Fields are kept as the strings found in the file."""
+    __slots__ = ()
+
+
+class InstrumentMaster:
+    """
+    In-memory index over instruments.csv.
+
+    Lookups by instrument_key are unique; trading symbols and exchange tokens can
+    repeat across exchanges, so those return every match. Exchange and instrument
+    type filters use prebuilt indexes.
+
+    Building the index parses the CSV once and writes a pickle snapshot next to it,
+    keyed by the CSV's size and mtime; later loads read the snapshot instead, and a
+    changed CSV is picked up automatically.
+
+    Args:
+        instruments (list): Instrument records.
+    """
+    def __init__(self, instruments):
+        self.instruments = instruments
+        self._by_key = {}
+        self._by_symbol = {}
+        self._by_token = {}
+        self._by_exchange = {}
+        self._by_type = {}
+        for instrument in instruments:
+            self._by_key[instrument.instrument_key] = instrument
+            self._by_symbol.setdefault(instrument.tradingsymbol, []).append(instrument)
+            self._by_token.setdefault(instrument.exchange_token, []).append(instrument)
+            self._by_exchange.setdefault(instrument.exchange, []).append(instrument)
+            self._by_type.setdefault(instrument.instrument_type, []).append(instrument)
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def __contains__(self, instrument_key):
+        return instrument_key in self._by_key
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        """Parses instruments.csv with the csv module."""
+        instruments = []
+        with open(csv_path, newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return cls([])
+            columns = [header.index(field) if field in header else None for field in INSTRUMENT_FIELDS]
+            for row in reader:
+                if not row:
+                    continue
+                instruments.append(Instrument(*(
+                    row[i] if i is not None and i < len(row) else '' for i in columns
+                )))
+        return cls(instruments)
+
+    @classmethod
+    def load(cls, csv_path, snapshot_path=None):
+        """
+        Loads the instrument master, from its snapshot when that matches the CSV.
+
+        Args:
+            csv_path (str): Path of instruments.csv.
+            snapshot_path (str): Snapshot location (default: next to the CSV).
+        """
+        snapshot_path = snapshot_path or csv_path + SNAPSHOT_SUFFIX
+        stat = os.stat(csv_path)
+        fingerprint = (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime_ns)
+
+        try:
+            with open(snapshot_path, 'rb') as f:
+                saved_fingerprint, rows = pickle.load(f)
+            if saved_fingerprint == fingerprint:
+                return cls([Instrument._make(row) for row in rows])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable instrument snapshot {snapshot_path}: {e}")
+
+        master = cls.from_csv(csv_path)
+        try:
+            # Plain tuples keep the snapshot independent of the Instrument class.
+            tmp_path = snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((fingerprint, [tuple(i) for i in master.instruments]), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, snapshot_path)
+        except OSError as e:
+            print(f"Could not write instrument snapshot {snapshot_path}: {e}")
+        return master
+
+    def by_key(self, instrument_key):
+        """Returns the instrument with this key, or None."""
+        return self._by_key.get(instrument_key)
+
+    def by_symbol(self, tradingsymbol):
+        """Returns every instrument with this trading symbol (one per exchange)."""
+        return self._by_symbol.get(tradingsymbol, [])
+
+    def by_token(self, exchange_token, exchange=None):
+        """Returns the instruments with this exchange token, optionally on one exchange only."""
+        matches = self._by_token.get(str(exchange_token), [])
+        if exchange is not None:
+            matches = [instrument for instrument in matches if instrument.exchange == exchange]
+        return matches
+
+    def filter(self, exchange=None, instrument_type=None):
+        """Returns the instruments on an exchange and/or of an instrument type."""
+        if exchange is None and instrument_type is None:
+            return list(self.instruments)
+        if instrument_type is None:
+            return list(self._by_exchange.get(exchange, []))
+        matches = self._by_type.get(instrument_type, [])
+        if exchange is not None:
+            matches = [instrument for instrument in matches if instrument.exchange == exchange]
+        return list(matches)
+
+    def symbol_for_key(self, instrument_key, default=None):
+        """Returns the trading symbol of an instrument key."""
+        instrument = self._by_key.get(instrument_key)
+        return instrument.tradingsymbol if instrument is not None else default
+
+    def keys_for_symbol(self, tradingsymbol):
+        """Returns the instrument keys of a trading symbol."""
+        return [instrument.instrument_key for instrument in self._by_symbol.get(tradingsymbol, [])]
+
+    def key_to_symbol_map(self):
+        """Returns an instrument_key -> tradingsymbol dict (the feed decoder's instrument map)."""
+        return {key: instrument.tradingsymbol for key, instrument in self._by_key.items()}
+
+
+_masters = {}
+_masters_lock = threading.Lock()
+
+
+def get_instrument_master(csv_path):
+    """
+    Returns the shared InstrumentMaster for a CSV, reloading it when the file changes.
+
+    Raises:
+        FileNotFoundError: If the CSV does not exist.
+    """
+    mtime = os.stat(csv_path).st_mtime_ns
+    with _masters_lock:
+        cached = _masters.get(csv_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        master = InstrumentMaster.load(csv_path)
+        _masters[csv_path] = (mtime, master)
+        return master
@@ -0,0 +1,253 @@
+import math
+import threading
+
+import numpy as np
+
+from .aggregation import MAX_LTT_MS, normalize_ltt
+
+# Candle intervals whose in-progress bar is kept for every instrument (the chart's common choices).
+SNAPSHOT_INTERVALS_MS = (15000, 60000, 300000, 900000)
+
+# A trade is a big player's when its quantity reaches this (the chart's default bigPlayerQty).
+BIG_PLAYER_QTY = 50
+
+# Layout of a cached bar: [time, open, high, low, close, volume]
+SNAP_TIME, SNAP_OPEN, SNAP_HIGH, SNAP_LOW, SNAP_CLOSE, SNAP_VOLUME = range(6)
+
+
+class _Summary:
+    """
+    Last tick, day OHLC, cumulative volume, big player buy/sell volume and the newest
+    bar per interval of one instrument, over some run of its ticks.
+
+    Non-trades (NaN ltp, ltq <= 0) are skipped, as in BarAggregator and BarPyramid.
+    The first trade of the run has no earlier price and counts as a buy; `first_ltp`
+    and `first_big` (its quantity if it was a big trade, else 0) let a merge with the
+    run before it judge that trade again.
+    """
+    __slots__ = ('ltp', 'ltt', 'ltq', 'cp', 'open', 'high', 'low', 'close', 'volume', 'ticks',
+                 'big_buy', 'big_sell', 'first_ltp', 'first_big', 'bars')
+
+    def __init__(self):
+        self.ltp = None
+        self.ltt = 0
+        self.ltq = 0
+        self.cp = 0.0
+        self.open = self.high = self.low = self.close = None
+        self.volume = 0
+        self.ticks = 0
+        self.big_buy = self.big_sell = 0
+        self.first_ltp = None
+        self.first_big = 0
+        self.bars = {}
+
+    def copy(self):
+        other = _Summary()
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other.bars = {interval: list(bar) for interval, bar in self.bars.items()}
+        return other
+
+    def add(self, ltt, ltp, ltq, cp, intervals, big_player_qty):
+        if ltq <= 0 or math.isnan(ltp):
+            return
+        # A big trade is a buy on an up-tick (tick rule, the first trade counts as one), a sell otherwise.
+        if ltq >= big_player_qty:
+            if self.ltp is None or ltp > self.ltp:
+                self.big_buy += ltq
+            else:
+                self.big_sell += ltq
+        if self.ltp is None:
+            self.first_ltp, self.first_big = ltp, (ltq if ltq >= big_player_qty else 0)
+        self.ltp, self.ltt, self.ltq, self.cp = ltp, ltt, ltq, cp
+        self.ticks += 1
+        self.volume += ltq
+        if self.open is None:
+            self.open = self.high = self.low = ltp
+        elif ltp > self.high:
+            self.high = ltp
+        elif ltp < self.low:
+            self.low = ltp
+        self.close = ltp
+
+        time_ms = normalize_ltt(ltt)
+        for interval in intervals:
+            start = time_ms // interval * interval
+            bar = self.bars.get(interval)
+            if bar is None or start > bar[SNAP_TIME]:
+                self.bars[interval] = [start, ltp, ltp, ltp, ltp, ltq]
+            elif start == bar[SNAP_TIME]:
+                if ltp > bar[SNAP_HIGH]:
+                    bar[SNAP_HIGH] = ltp
+                if ltp < bar[SNAP_LOW]:
+                    bar[SNAP_LOW] = ltp
+                bar[SNAP_CLOSE] = ltp
+                bar[SNAP_VOLUME] += ltq
+            # Late ticks for an already closed bar only count towards the day.
+
+    @classmethod
+    def from_columns(cls, columns, intervals, big_player_qty):
+        """Summarizes a TickColumns in one vectorized pass."""
+        summary = cls()
+        if columns is None or not len(columns):
+            return summary
+        ltt = np.frombuffer(columns.ltt, dtype=np.int64)
+        ltp = np.frombuffer(columns.ltp, dtype=np.float64)
+        ltq = np.frombuffer(columns.ltq, dtype=np.int32).astype(np.int64)
+        cp = np.frombuffer(columns.cp, dtype=np.float64)
+        valid = (ltq > 0) & ~np.isnan(ltp)
+        if not valid.any():
+            return summary
+        ltt, ltp, ltq, cp = ltt[valid], ltp[valid], ltq[valid], cp[valid]
+
+        summary.ltp, summary.ltt, summary.ltq, summary.cp = float(ltp[-1]), int(ltt[-1]), int(ltq[-1]), float(cp[-1])
+        summary.ticks = len(ltp)
+        summary.volume = int(ltq.sum())
+        summary.open, summary.high = float(ltp[0]), float(ltp.max())
+        summary.low, summary.close = float(ltp.min()), float(ltp[-1])
+
+        is_big = ltq >= big_player_qty
+        is_buy = np.empty(len(ltp), dtype=bool)
+        is_buy[0] = True
+        np.greater(ltp[1:], ltp[:-1], out=is_buy[1:])
+        summary.big_buy = int(ltq[is_big & is_buy].sum())
+        summary.big_sell = int(ltq[is_big & ~is_buy].sum())
+        summary.first_ltp, summary.first_big = float(ltp[0]), (int(ltq[0]) if is_big[0] else 0)
+
+        time_ms = np.where(ltt > MAX_LTT_MS, ltt // 1000 * 1000, ltt)
+        newest = int(time_ms.max())
+        for interval in intervals:
+            start = newest // interval * interval
+            in_bar = time_ms >= start
+            prices = ltp[in_bar]
+            summary.bars[interval] = [start, float(prices[0]), float(prices.max()), float(prices.min()),
+                                      float(prices[-1]), int(ltq[in_bar].sum())]
+        return summary
+
+
+def _merge_bars(older, newer):
+    """Combines the newest bar of the disk history with the newest live bar."""
+    if older is None or (newer is not None and newer[SNAP_TIME] > older[SNAP_TIME]):
+        return newer
+    if newer is None or newer[SNAP_TIME] < older[SNAP_TIME]:
+        return older
+    return [older[SNAP_TIME], older[SNAP_OPEN], max(older[SNAP_HIGH], newer[SNAP_HIGH]),
+            min(older[SNAP_LOW], newer[SNAP_LOW]), newer[SNAP_CLOSE], older[SNAP_VOLUME] + newer[SNAP_VOLUME]]
+
+
+class LastValueCache:
+    """
+    Per-instrument last-value cache: the last LTPC, the day's OHLC and cumulative
+    volume, big player buy/sell volume (trades of at least `big_player_qty`, the same
+    rule as BarAggregator's), and the in-progress bar for each of SNAPSHOT_INTERVALS_MS.
+
+    Live ticks are folded in as they arrive with `update`. The history written
+    before startup is summarized once per instrument, on its first snapshot, from
+    the columns the HistoryStore loads anyway for the history stream; the two parts
+    never overlap, so they are merged without double counting.
+
+    Args:
+        history (HistoryStore): Source of the pre-startup tick history.
+        intervals (tuple): Candle intervals (ms) whose current bar is kept.
+        big_player_qty (int): Smallest quantity counted as a big player's trade.
+    """
+    def __init__(self, history, intervals=SNAPSHOT_INTERVALS_MS, big_player_qty=BIG_PLAYER_QTY):
+        self.history = history
+        self.intervals = tuple(intervals)
+        self.big_player_qty = big_player_qty
+        self._live = {}
+        self._disk = {}
+        self._lock = threading.Lock()
+
+    def update(self, tick):
+        """Folds one live tick into its instrument's summary."""
+        with self._lock:
+            summary = self._live.get(tick.instrument_key)
+            if summary is None:
+                summary = self._live[tick.instrument_key] = _Summary()
+            summary.add(tick.ltt, tick.ltp, tick.ltq, tick.cp, self.intervals, self.big_player_qty)
+
+    def snapshot(self, security_id):
+        """
+        Returns the cached state of an instrument in wire shape, or None if it has no ticks.
+
+        The result has the last tick ({ltp, ltt, ltq, cp}, int64 fields as strings like
+        live ticks), `day` [open, high, low, close], `volume`, `ticks` and `bars`:
+        interval ms -> [time, open, high, low, close, volume] of the newest bar.
+        """
+        summary = self._merged(security_id)
+        if summary is None:
+            return None
+        return {
+            'securityId': security_id,
+            'tick': {'ltp': summary.ltp, 'ltt': str(summary.ltt), 'ltq': str(summary.ltq), 'cp': summary.cp},
+            'day': [summary.open, summary.high, summary.low, summary.close],
+            'volume': summary.volume,
+            'ticks': summary.ticks,
+            'bars': {str(interval): bar for interval, bar in summary.bars.items() if bar is not None},
+        }
+
+    def watch_summary(self, security_id):
+        """
+        Returns the compact watchlist row of an instrument, or None if it has no ticks:
+        [securityId, ltp, changePct (against cp, None without one), volume,
+        bigBuyVolume, bigSellVolume, imbalance ((big buy - big sell) / their sum, 0
+        without big trades), ltt].
+        """
+        summary = self._merged(security_id)
+        if summary is None:
+            return None
+        change_pct = round((summary.ltp - summary.cp) / summary.cp * 100, 2) if summary.cp else None
+        big = summary.big_buy + summary.big_sell
+        imbalance = round((summary.big_buy - summary.big_sell) / big, 3) if big else 0
+        return [security_id, summary.ltp, change_pct, summary.volume, summary.big_buy, summary.big_sell,
+                imbalance, str(summary.ltt)]
+
+    def preload(self, security_ids):
+        """
+        Summarizes the disk history of the instruments that have no summary yet, in one
+        pass over the day file rather than one load per instrument (a watchlist's first rows).
+        """
+        with self._lock:
+            missing = [security_id for security_id in security_ids if security_id not in self._disk]
+        for security_id, columns in self.history.iter_disk_columns(missing):
+            summary = _Summary.from_columns(columns, self.intervals, self.big_player_qty)
+            with self._lock:
+                self._disk.setdefault(security_id, summary)
+
+    def _merged(self, security_id):
+        """Returns the summary of the disk history and the live ticks combined, or None if it has no ticks."""
+        with self._lock:
+            disk = self._disk.get(security_id)
+        if disk is None:
+            # Summarized outside the lock; a summary stored meanwhile by another thread wins.
+            disk = _Summary.from_columns(self.history.disk_columns(security_id), self.intervals, self.big_player_qty)
+            with self._lock:
+                disk = self._disk.setdefault(security_id, disk)
+        with self._lock:
+            live = self._live.get(security_id)
+            live = live.copy() if live is not None else None
+
+        if live is None or live.ltp is None:
+            summary = disk
+        elif disk.ltp is None:
+            summary = live
+        else:
+            summary = live
+            summary.open = disk.open
+            summary.high = max(disk.high, live.high)
+            summary.low = min(disk.low, live.low)
+            summary.volume += disk.volume
+            summary.ticks += disk.ticks
+            summary.big_buy += disk.big_buy
+            summary.big_sell += disk.big_sell
+            if live.first_big and not live.first_ltp > disk.ltp:
+                # The first live big trade was a buy only for want of the disk history's last price.
+                summary.big_buy -= live.first_big
+                summary.big_sell += live.first_big
+            summary.first_ltp, summary.first_big = disk.first_ltp, disk.first_big
+            summary.bars = {interval: _merge_bars(disk.bars.get(interval), live.bars.get(interval))
+                            for interval in self.intervals}
+        if summary.ltp is None:
+            return None
+        return summary
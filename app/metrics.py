@@ -0,0 +1,219 @@
+"""
+In-process pipeline metrics: counters, gauges and latency histograms, exported in
+the Prometheus text format.
+
+Every stage of the tick pipeline records into the shared `METRICS` registry:
+
+    start = time.perf_counter()
+    ...
+    METRICS.observe('decode', time.perf_counter() - start)
+
+Histograms use HDR-style log-linear buckets (16 per power of two, so any recorded
+value is off by at most ~6%) over microseconds. Recording is an integer
+bit_length and a list increment, so it is cheap enough for the per-message path.
+"""
+import threading
+import time
+from collections import Counter
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_VALUE_US = 1 << 36                      # ~19 hours; larger values are clamped
+_BUCKET_COUNT = SUB_BUCKETS + (MAX_VALUE_US.bit_length() - SUB_BUCKET_BITS) * SUB_BUCKETS
+
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+METRIC_PREFIX = 'bubble_'
+
+
+def _bucket_index(value_us):
+    if value_us < SUB_BUCKETS:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+    return SUB_BUCKETS + shift * SUB_BUCKETS + ((value_us >> shift) - SUB_BUCKETS)
+
+
+def _bucket_upper_us(index):
+    if index < SUB_BUCKETS:
+        return index
+    shift, offset = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+    return ((SUB_BUCKETS + offset + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of durations in seconds, recorded with microsecond resolution.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        value_us = int(seconds * 1e6)
+        if value_us < 0:
+            value_us = 0
+        elif value_us >= MAX_VALUE_US:
+            value_us = MAX_VALUE_US - 1
+        index = _bucket_index(value_us)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, fraction):
+        """Returns the value (seconds) below which `fraction` of the recordings fall."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, int(fraction * self.count + 0.5))
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return min(_bucket_upper_us(index) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """Returns count, mean and p50/p90/p99/max in milliseconds."""
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            'count': self.count,
+            'mean_ms': round(mean * 1000, 3),
+            'p50_ms': round(self.percentile(0.5) * 1000, 3),
+            'p90_ms': round(self.percentile(0.9) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class Metrics:
+    """
+    Registry of counters, gauges, per-stage latency histograms and per-instrument
+    tick counts.
+
+    Gauges are callables read at export time (e.g. queue depths), so registering
+    one costs nothing on the hot path.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.instrument_ticks = Counter()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, read, **labels):
+        """Registers (or replaces) a gauge whose value is `read()` at export time."""
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = read
+
+    def observe(self, stage, seconds):
+        """Records one duration for a pipeline stage."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(seconds)
+
+    def count_ticks(self, ticks):
+        """Counts ticks per instrument."""
+        with self._lock:
+            self.instrument_ticks.update(tick.instrument_key for tick in ticks)
+
+    def tick_counts(self):
+        with self._lock:
+            return dict(self.instrument_ticks)
+
+    def gauge_values(self):
+        values = {}
+        for key, read in list(self.gauges.items()):
+            try:
+                values[key] = float(read())
+            except Exception:
+                continue
+        return values
+
+    def stage_summaries(self):
+        return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def snapshot(self):
+        """
+        Returns a JSON-friendly view: uptime, stage summaries, and gauges and counters
+        keyed by name, then by their label values joined with ','.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+        gauges = {}
+        for (name, labels), value in self.gauge_values().items():
+            gauges.setdefault(name, {})[','.join(str(v) for _, v in labels)] = value
+        counter_values = {}
+        for (name, labels), value in counters.items():
+            counter_values.setdefault(name, {})[','.join(str(v) for _, v in labels)] = value
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'stages': self.stage_summaries(),
+            'gauges': gauges,
+            'counters': counter_values,
+        }
+
+    def render_prometheus(self):
+        """Returns every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            f'# TYPE {METRIC_PREFIX}uptime_seconds gauge',
+            f'{METRIC_PREFIX}uptime_seconds {time.time() - self.started:.3f}',
+        ]
+        with self._lock:
+            counters = dict(self.counters)
+            instrument_ticks = dict(self.instrument_ticks)
+
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            lines.append(f'# TYPE {METRIC_PREFIX}{name}_total counter')
+            for labels, value in sorted(by_name[name]):
+                lines.append(f'{METRIC_PREFIX}{name}_total{_label_text(labels)} {value}')
+
+        lines.append(f'# TYPE {METRIC_PREFIX}instrument_ticks_total counter')
+        for key in sorted(instrument_ticks):
+            lines.append(f'{METRIC_PREFIX}instrument_ticks_total{_label_text((("instrument", key),))} {instrument_ticks[key]}')
+
+        by_name = {}
+        for (name, labels), value in self.gauge_values().items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} gauge')
+            for labels, value in sorted(by_name[name]):
+                lines.append(f'{METRIC_PREFIX}{name}{_label_text(labels)} {value:g}')
+
+        lines.append(f'# TYPE {METRIC_PREFIX}stage_seconds summary')
+        for stage, histogram in sorted(self.histograms.items()):
+            for quantile in SUMMARY_QUANTILES:
+                labels = (('stage', stage), ('quantile', quantile))
+                lines.append(f'{METRIC_PREFIX}stage_seconds{_label_text(labels)} {histogram.percentile(quantile):.6f}')
+            lines.append(f'{METRIC_PREFIX}stage_seconds_sum{_label_text((("stage", stage),))} {histogram.total:.6f}')
+            lines.append(f'{METRIC_PREFIX}stage_seconds_count{_label_text((("stage", stage),))} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+# The registry every module records into.
+METRICS = Metrics()
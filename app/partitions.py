@@ -0,0 +1,550 @@
+"""
+Day-partitioned tick history.
+
+Ticks are written to one journal per trading day (local date of the feed's
+currentTs), under the same names as before, e.g. `static/UpstoxWSS_08_10_25.ticks`.
+A DailySink rolls the writer over to the next day's files at midnight, so a server
+left running overnight no longer appends to yesterday's journal.
+
+Once a day is closed, HistoryCompactor rewrites it as a directory of compressed
+columnar archives, one per instrument:
+
+    static/UpstoxWSS_08_10_25.cols/<quoted instrument key>.npz
+        ltt_delta  int64    ltt minus the previous tick's ltt (the first is absolute)
+        ltp, cp    float64
+        ltq        int32
+    static/UpstoxWSS_08_10_25.cols/bars/<quoted instrument key>.npz
+        the instrument's BarPyramid for the day (see bar_pyramid)
+
+The directory is built under a temporary name and renamed into place, so it is
+either complete or absent. DayArchive serves an instrument's ticks for a past day
+from that directory when it exists, falling back to the day's journal or JSONL file.
+
+Usage:
+    python -m app.partitions info [static]
+    python -m app.partitions compact [static] [--remove-sources]
+"""
+import os
+import re
+import sys
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+import numpy as np
+
+from .aggregation import MAX_LTT_MS
+from .bar_pyramid import BarPyramid
+from .history_store import JsonlIndex, parse_jsonl_parallel
+from .metrics import METRICS
+from .tick_journal import TickJournalReader, journal_exists, TICKS_SUFFIX
+from .tick_store import TickColumns
+
+HISTORY_DIR = 'static'                  # Relative to the project root (or absolute)
+FILE_PREFIX = 'UpstoxWSS_'
+DAY_FORMAT = '%d_%m_%y'
+JSONL_SUFFIX = '.txt'
+COMPACTED_SUFFIX = '.cols'
+PARTITION_SUFFIX = '.npz'
+PYRAMID_SUBDIR = 'bars'
+
+# A closed day's sink stays open this long after the next day's first record,
+# for ticks still in flight from other connections.
+ROLLOVER_GRACE = 60.0
+
+# Compaction of closed days
+COMPACT_INTERVAL = 15 * 60              # Seconds between passes (a rollover triggers one at once)
+COMPACT_REMOVE_SOURCES = False          # Delete a day's journal/JSONL files once it is compacted
+
+# Past-day partitions kept loaded by a DayArchive
+ARCHIVE_CACHE_PARTITIONS = 64
+
+_DAY_PATTERN = re.compile(re.escape(FILE_PREFIX) + r'(\d\d_\d\d_\d\d)(\.ticks|\.txt|\.cols)$')
+
+
+def day_of(epoch_ms=None):
+    """Returns the local date of an epoch-ms timestamp (default: now)."""
+    if epoch_ms is None:
+        return date.today()
+    return datetime.fromtimestamp(epoch_ms / 1000.0).date()
+
+
+def day_bounds_ms(day):
+    """Returns [start, end) of a local date in epoch milliseconds."""
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def day_base_path(directory, day):
+    """Base path of a day's journal files, e.g. static/UpstoxWSS_08_10_25."""
+    return os.path.join(directory, FILE_PREFIX + day.strftime(DAY_FORMAT))
+
+
+def day_jsonl_path(directory, day):
+    return day_base_path(directory, day) + JSONL_SUFFIX
+
+
+def compacted_dir(directory, day):
+    return day_base_path(directory, day) + COMPACTED_SUFFIX
+
+
+def partition_path(directory, day, security_id):
+    return os.path.join(compacted_dir(directory, day), quote(security_id, safe='') + PARTITION_SUFFIX)
+
+
+def pyramid_path(directory, day, security_id):
+    return os.path.join(compacted_dir(directory, day), PYRAMID_SUBDIR, quote(security_id, safe='') + PARTITION_SUFFIX)
+
+
+def list_days(directory):
+    """Returns the sorted dates that have a journal, a JSONL file or a compacted directory."""
+    days = set()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    for name in names:
+        match = _DAY_PATTERN.match(name)
+        if match:
+            days.add(datetime.strptime(match.group(1), DAY_FORMAT).date())
+    return sorted(days)
+
+
+def is_compacted(directory, day):
+    return os.path.isdir(compacted_dir(directory, day))
+
+
+def write_partition(path, columns):
+    """Writes one instrument-day as a compressed columnar archive."""
+    ltt = np.frombuffer(columns.ltt, dtype=np.int64)
+    np.savez_compressed(
+        path,
+        ltt_delta=np.diff(ltt, prepend=np.int64(0)),
+        ltp=np.frombuffer(columns.ltp, dtype=np.float64),
+        ltq=np.frombuffer(columns.ltq, dtype=np.int32),
+        cp=np.frombuffer(columns.cp, dtype=np.float64),
+    )
+
+
+def read_partition(path):
+    """Reads an archive written by `write_partition` into a TickColumns."""
+    columns = TickColumns()
+    with np.load(path) as data:
+        columns.ltt.frombytes(np.cumsum(data['ltt_delta'], dtype=np.int64).tobytes())
+        columns.ltp.frombytes(data['ltp'].astype(np.float64).tobytes())
+        columns.ltq.frombytes(data['ltq'].astype(np.int32).tobytes())
+        columns.cp.frombytes(data['cp'].astype(np.float64).tobytes())
+    return columns
+
+
+class DailySink:
+    """
+    TickWriter sink that routes each (payload, current_ts) record to the sink of its
+    day, opening `make_sink(day)` on the first record of a new day.
+
+    When a newer day starts, older days' sinks are synced and closed ROLLOVER_GRACE
+    seconds later and `on_rollover(day)` is called for each. Records that arrive for
+    a day already closed (or an older day that was never opened) are dropped, logged
+    and counted as `history_late_records`, so a closed day's files never change again
+    and no day's files hold another day's ticks.
+
+    Args:
+        make_sink (callable): day -> sink (TickJournal, JsonlSink, QuoteJournal...).
+        on_rollover (callable): Optional; called with each day that was closed.
+        grace (float): Seconds an older day stays open after a newer one starts.
+    """
+    def __init__(self, make_sink, on_rollover=None, grace=ROLLOVER_GRACE):
+        self.make_sink = make_sink
+        self.on_rollover = on_rollover
+        self.grace = grace
+        self._sinks = OrderedDict()
+        self._closed = set()
+        self._newest = None
+        self._newest_since = None
+        self._lock = threading.Lock()
+
+    def open_days(self):
+        """Returns the days whose sinks are currently open."""
+        with self._lock:
+            return set(self._sinks)
+
+    def write_batch(self, batch):
+        """
+        Splits a batch by day (keeping order within each day) and writes each part.
+
+        Returns:
+            int: Number of records written.
+        """
+        by_day = OrderedDict()
+        late = {}
+        for record in batch:
+            day = day_of(record[1])
+            if day in self._closed or (self._newest is not None and day < self._newest
+                                       and day not in self._sinks):
+                late[day] = late.get(day, 0) + 1
+                continue
+            by_day.setdefault(day, []).append(record)
+        for day, count in late.items():
+            METRICS.inc('history_late_records', count)
+            print(f"Dropped {count} late records for {day}, which is no longer written.")
+
+        written = 0
+        for day, records in by_day.items():
+            sink = self._sinks.get(day)
+            if sink is None:
+                sink = self.make_sink(day)
+                with self._lock:
+                    self._sinks[day] = sink
+                if self._newest is None or day > self._newest:
+                    if self._newest is not None:
+                        print(f"History rolled over from {self._newest} to {day}.")
+                    self._newest, self._newest_since = day, time.monotonic()
+            written += sink.write_batch(records)
+        self._close_old_days()
+        return written
+
+    def _close_old_days(self):
+        if self._newest_since is None or time.monotonic() - self._newest_since < self.grace:
+            return
+        for day in [day for day in self._sinks if day != self._newest]:
+            sink = self._sinks[day]
+            sink.flush()
+            sink.sync()
+            sink.close()
+            with self._lock:
+                del self._sinks[day]
+            self._closed.add(day)
+            if self.on_rollover is not None:
+                try:
+                    self.on_rollover(day)
+                except Exception as e:
+                    print(f"Error handling rollover of {day}: {e}")
+
+    def flush(self):
+        for sink in list(self._sinks.values()):
+            sink.flush()
+
+    def sync(self):
+        for sink in list(self._sinks.values()):
+            sink.sync()
+
+    def close(self):
+        for sink in list(self._sinks.values()):
+            sink.close()
+        with self._lock:
+            self._sinks.clear()
+
+
+class DayArchive:
+    """
+    Read access to the closed days before `before_day`, one (day, instrument)
+    partition at a time, with the most recently used partitions kept loaded.
+
+    Args:
+        directory (str): History directory.
+        before_day (date): Only days before this one are served (the HistoryStore
+            serves its own session from the journal and live ticks).
+        cache_partitions (int): Partitions kept in memory.
+    """
+    def __init__(self, directory, before_day, cache_partitions=ARCHIVE_CACHE_PARTITIONS):
+        self.directory = directory
+        self.before_day = before_day
+        self.before_ms = day_bounds_ms(before_day)[0]
+        self.cache_partitions = cache_partitions
+        self._cache = OrderedDict()
+        self._readers = OrderedDict()
+        self._jsonl_indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def days(self):
+        """Returns the archived days, oldest first."""
+        return [day for day in list_days(self.directory) if day < self.before_day]
+
+    def columns_between(self, security_id, start_ms, end_ms=None):
+        """Returns the non-empty TickColumns of every day overlapping [start_ms, end_ms), oldest first."""
+        parts = []
+        for day in self.days():
+            day_start, day_end = day_bounds_ms(day)
+            if day_end <= start_ms or (end_ms is not None and day_start >= end_ms):
+                continue
+            columns = self.read(day, security_id)
+            if len(columns):
+                parts.append(columns)
+        return parts
+
+    def newest_before(self, security_id, end_ms=None):
+        """Returns the normalized ltt of the instrument's newest trade before end_ms, or None."""
+        for day in reversed(self.days()):
+            if end_ms is not None and day_bounds_ms(day)[0] >= end_ms:
+                continue
+            if not self.has_ticks(day, security_id):
+                continue
+            ltt = self._trade_times(self.read(day, security_id))
+            if end_ms is not None:
+                ltt = ltt[ltt < end_ms]
+            if len(ltt):
+                return int(ltt.max())
+        return None
+
+    def has_ticks_before(self, security_id, ms):
+        """True if the instrument has any archived trade before `ms`."""
+        for day in reversed(self.days()):
+            day_start, day_end = day_bounds_ms(day)
+            if day_start >= ms or not self.has_ticks(day, security_id):
+                continue
+            if day_end <= ms or (self._trade_times(self.read(day, security_id)) < ms).any():
+                return True
+        return False
+
+    @staticmethod
+    def _trade_times(columns):
+        """Normalized ltt of the trades (finite ltp, ltq > 0) in a TickColumns."""
+        ltt = np.frombuffer(columns.ltt, dtype=np.int64)
+        valid = ~np.isnan(np.frombuffer(columns.ltp, dtype=np.float64)) & (np.frombuffer(columns.ltq, dtype=np.int32) > 0)
+        ltt = ltt[valid]
+        return np.where(ltt > MAX_LTT_MS, ltt // 1000 * 1000, ltt)
+
+    def bars_between(self, security_id, interval, start_ms, end_ms=None):
+        """
+        Returns the instrument's `interval` bars (lists in the bar_pyramid layout) with
+        time in [start_ms, end_ms) from every day overlapping it, oldest first.
+        """
+        bars = []
+        for day in self.days():
+            day_start, day_end = day_bounds_ms(day)
+            if day_end <= start_ms or (end_ms is not None and day_start >= end_ms):
+                continue
+            if self.has_ticks(day, security_id):
+                bars.extend(self.read_pyramid(day, security_id).levels[interval].between(start_ms, end_ms))
+        return bars
+
+    def read_pyramid(self, day, security_id):
+        """
+        Returns an instrument's BarPyramid for one day: the one written by the
+        compactor, or built from the day's ticks for days compacted without one.
+        """
+        key = (day, security_id, PYRAMID_SUBDIR)
+        with self._lock:
+            pyramid = self._cache.get(key)
+            if pyramid is not None:
+                self._cache.move_to_end(key)
+                return pyramid
+
+        path = pyramid_path(self.directory, day, security_id)
+        if is_compacted(self.directory, day) and os.path.exists(path):
+            pyramid = BarPyramid.load(path)
+        else:
+            pyramid = BarPyramid.from_columns([self.read(day, security_id)])
+        with self._lock:
+            self._cache[key] = pyramid
+            while len(self._cache) > self.cache_partitions:
+                self._cache.popitem(last=False)
+        return pyramid
+
+    def has_ticks(self, day, security_id):
+        """True if the instrument traded on that day; a file check for compacted days."""
+        if is_compacted(self.directory, day):
+            return os.path.exists(partition_path(self.directory, day, security_id))
+        return len(self.read(day, security_id)) > 0
+
+    def read(self, day, security_id):
+        """Returns an instrument's ticks for one day (empty if it has none)."""
+        key = (day, security_id)
+        with self._lock:
+            columns = self._cache.get(key)
+            if columns is not None:
+                self._cache.move_to_end(key)
+                return columns
+
+        columns = self._load(day, security_id)
+        with self._lock:
+            self._cache[key] = columns
+            while len(self._cache) > self.cache_partitions:
+                self._cache.popitem(last=False)
+        return columns
+
+    def _load(self, day, security_id):
+        start = time.perf_counter()
+        if is_compacted(self.directory, day):
+            path = partition_path(self.directory, day, security_id)
+            columns = read_partition(path) if os.path.exists(path) else TickColumns()
+        elif journal_exists(day_base_path(self.directory, day)):
+            columns = self._journal_reader(day).read_columns(security_id)
+        elif os.path.exists(day_jsonl_path(self.directory, day)):
+            columns = self._jsonl_index(day).read_columns(security_id)
+        else:
+            columns = TickColumns()
+        METRICS.observe('archive_load', time.perf_counter() - start)
+        return columns
+
+    def _journal_reader(self, day):
+        with self._lock:
+            reader = self._readers.get(day)
+            if reader is None:
+                reader = self._readers[day] = TickJournalReader(day_base_path(self.directory, day))
+                # Closed journals never change; a few stay mapped.
+                while len(self._readers) > 4:
+                    self._readers.popitem(last=False)[1].close()
+            return reader
+
+    def _jsonl_index(self, day):
+        with self._lock:
+            index = self._jsonl_indexes.get(day)
+            if index is None:
+                index = self._jsonl_indexes[day] = JsonlIndex(day_jsonl_path(self.directory, day))
+                while len(self._jsonl_indexes) > 4:
+                    self._jsonl_indexes.popitem(last=False)
+            return index
+
+
+class HistoryCompactor:
+    """
+    Background thread that compacts closed days into per-instrument compressed
+    archives (see the module docstring).
+
+    A day is closed once it is before today and no writer still has it open. Passes
+    run every `interval` seconds and right after a rollover (`wake`).
+
+    Args:
+        directory (str): History directory.
+        is_open (callable): day -> True while a writer may still append to it.
+        interval (float): Seconds between passes.
+        remove_sources (bool): Delete a day's journal and JSONL files after compacting it.
+        keep_sources_from (date): Never delete the sources of this day or later (the
+            day a running HistoryStore reads its session from).
+    """
+    def __init__(self, directory, is_open=None, interval=COMPACT_INTERVAL,
+                 remove_sources=COMPACT_REMOVE_SOURCES, keep_sources_from=None):
+        self.directory = directory
+        self.is_open = is_open or (lambda day: False)
+        self.interval = interval
+        self.remove_sources = remove_sources
+        self.keep_sources_from = keep_sources_from
+        self.stats = {'days': 0, 'instruments': 0, 'ticks': 0, 'source_bytes': 0, 'compacted_bytes': 0, 'errors': 0}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="HistoryCompactor", daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self, day=None):
+        """Asks for a pass now, e.g. from DailySink's on_rollover."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.compact_closed_days()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"History compaction failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def closed_days(self):
+        today = day_of()
+        return [day for day in list_days(self.directory)
+                if day < today and not self.is_open(day) and not is_compacted(self.directory, day)]
+
+    def compact_closed_days(self):
+        """Compacts every closed day that is not compacted yet. Returns the days done."""
+        done = []
+        for day in self.closed_days():
+            if self._stop.is_set():
+                break
+            self.compact_day(day)
+            done.append(day)
+        return done
+
+    def compact_day(self, day):
+        """Writes a day's ticks as one compressed archive per instrument."""
+        start = time.perf_counter()
+        base_path = day_base_path(self.directory, day)
+        jsonl_path = day_jsonl_path(self.directory, day)
+        target = compacted_dir(self.directory, day)
+        building = target + '.tmp'
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(os.path.join(building, PYRAMID_SUBDIR))
+
+        sources = []
+        instruments = ticks = 0
+        if journal_exists(base_path):
+            sources = [base_path + suffix for suffix in (TICKS_SUFFIX, '.instruments', '.idx')]
+            reader = TickJournalReader(base_path)
+            try:
+                for security_id in reader.securities():
+                    columns = reader.read_columns(security_id)
+                    self._write_instrument(building, security_id, columns)
+                    instruments += 1
+                    ticks += len(columns)
+            finally:
+                reader.close()
+        elif os.path.exists(jsonl_path):
+            sources = [jsonl_path]
+            for security_id, columns in parse_jsonl_parallel(jsonl_path).items():
+                self._write_instrument(building, security_id, columns)
+                instruments += 1
+                ticks += len(columns)
+        os.rename(building, target)
+
+        source_bytes = sum(os.path.getsize(path) for path in sources if os.path.exists(path))
+        compacted_bytes = sum(os.path.getsize(os.path.join(root, name))
+                              for root, _, names in os.walk(target) for name in names)
+        for name, value in (('days', 1), ('instruments', instruments), ('ticks', ticks),
+                            ('source_bytes', source_bytes), ('compacted_bytes', compacted_bytes)):
+            self.stats[name] += value
+        METRICS.observe('compact_day', time.perf_counter() - start)
+        METRICS.inc('compacted_days')
+        print(f"Compacted {day}: {ticks} ticks of {instruments} instruments, "
+              f"{source_bytes / 1e6:.1f} MB -> {compacted_bytes / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s.")
+
+        if self.remove_sources and (self.keep_sources_from is None or day < self.keep_sources_from):
+            for path in sources:
+                os.remove(path)
+        return target
+
+    @staticmethod
+    def _write_instrument(building, security_id, columns):
+        """Writes an instrument's tick partition and its bar pyramid into a day directory being built."""
+        name = quote(security_id, safe='') + PARTITION_SUFFIX
+        write_partition(os.path.join(building, name), columns)
+        BarPyramid.from_columns([columns]).save(os.path.join(building, PYRAMID_SUBDIR, name))
+
+
+def _main(argv):
+    remove_sources = '--remove-sources' in argv
+    argv = [arg for arg in argv if arg != '--remove-sources']
+    if argv and argv[0] in ('info', 'compact'):
+        directory = argv[1] if len(argv) > 1 else HISTORY_DIR
+        if argv[0] == 'info':
+            for day in list_days(directory):
+                if is_compacted(directory, day):
+                    partitions = [name for name in os.listdir(compacted_dir(directory, day)) if name.endswith(PARTITION_SUFFIX)]
+                    kind = f"compacted, {len(partitions)} instruments"
+                elif journal_exists(day_base_path(directory, day)):
+                    kind = "journal"
+                else:
+                    kind = "jsonl"
+                print(f"  {day}: {kind}")
+            return 0
+        compactor = HistoryCompactor(directory, remove_sources=remove_sources)
+        days = compactor.compact_closed_days()
+        print(f"Compacted {len(days)} day(s): {compactor.stats}")
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
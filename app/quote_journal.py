@@ -0,0 +1,126 @@
+"""
+Append-only journal of market quotes (depth, OI, greeks) next to the tick journal.
+
+Only instruments subscribed in `full` or `option_greeks` mode produce quotes, so a
+day with nothing but ltpc subscriptions never creates these files.
+
+- `<base>.quotes`             a 16-byte header followed by fixed-width records.
+- `<base>.quote_instruments`  "id<TAB>instrument_key<TAB>" lines, like `.instruments`.
+"""
+import os
+import struct
+
+import numpy as np
+
+from .tick_journal import _read_instruments
+
+MAGIC = b'UPXQUOT1'
+VERSION = 1
+HEADER = struct.Struct('<8sII')   # magic, version, record size
+# instrument id, ts, oi, vtt, atp, iv, tbq, tsq, bid price, bid qty, ask price, ask qty, delta, theta, gamma, vega
+RECORD = struct.Struct('<Iqdqdddddqdqdddd')
+
+RECORD_DTYPE = np.dtype([
+    ('instrument', '<u4'), ('ts', '<i8'), ('oi', '<f8'), ('vtt', '<i8'), ('atp', '<f8'), ('iv', '<f8'),
+    ('tbq', '<f8'), ('tsq', '<f8'), ('bid_price', '<f8'), ('bid_qty', '<i8'), ('ask_price', '<f8'),
+    ('ask_qty', '<i8'), ('delta', '<f8'), ('theta', '<f8'), ('gamma', '<f8'), ('vega', '<f8'),
+])
+
+QUOTES_SUFFIX = '.quotes'
+INSTRUMENTS_SUFFIX = '.quote_instruments'
+
+
+class QuoteJournal:
+    """
+    TickWriter sink for batches of (quotes, current_ts) records. Files are opened
+    on the first non-empty batch.
+    """
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self._ids = {}
+        self._quotes_file = None
+        self._instruments_file = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.base_path) or '.', exist_ok=True)
+        for instrument_id, (key, _) in enumerate(_read_instruments(self.base_path + INSTRUMENTS_SUFFIX)):
+            self._ids[key] = instrument_id
+
+        quotes_path = self.base_path + QUOTES_SUFFIX
+        self._quotes_file = open(quotes_path, 'ab')
+        size = self._quotes_file.tell()
+        if size < HEADER.size:
+            self._quotes_file.truncate(0)
+            self._quotes_file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            aligned = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+            if aligned != size:
+                self._quotes_file.truncate(aligned)
+        self._instruments_file = open(self.base_path + INSTRUMENTS_SUFFIX, 'a')
+
+    def write_batch(self, batch):
+        """
+        Appends a batch of (quotes, current_ts) records.
+
+        Returns:
+            int: Number of records written.
+        """
+        if not any(quotes for quotes, _ in batch):
+            return len(batch)
+        if self._quotes_file is None:
+            self._open()
+
+        packed = []
+        new_instruments = []
+        for quotes, _ in batch:
+            for quote in quotes:
+                instrument_id = self._ids.get(quote.instrument_key)
+                if instrument_id is None:
+                    instrument_id = self._ids[quote.instrument_key] = len(self._ids)
+                    new_instruments.append(f"{instrument_id}\t{quote.instrument_key}\t\n")
+                packed.append(RECORD.pack(instrument_id, *quote[1:]))
+        if new_instruments:
+            self._instruments_file.write(''.join(new_instruments))
+            self._instruments_file.flush()
+        self._quotes_file.write(b''.join(packed))
+        return len(batch)
+
+    def flush(self):
+        for f in (self._instruments_file, self._quotes_file):
+            if f is not None:
+                f.flush()
+
+    def sync(self):
+        for f in (self._instruments_file, self._quotes_file):
+            if f is not None:
+                os.fsync(f.fileno())
+
+    def close(self):
+        for f in (self._instruments_file, self._quotes_file):
+            if f is not None:
+                f.close()
+        self._quotes_file = self._instruments_file = None
+
+
+def read_quotes(base_path, instrument_key=None):
+    """
+    Reads a quote journal into a NumPy structured array (RECORD_DTYPE).
+
+    Args:
+        base_path (str): Journal base path.
+        instrument_key (str): Only return this instrument's quotes.
+
+    Returns:
+        tuple: (records, list of instrument keys by id).
+    """
+    instruments = [key for key, _ in _read_instruments(base_path + INSTRUMENTS_SUFFIX)]
+    path = base_path + QUOTES_SUFFIX
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=RECORD_DTYPE), instruments
+    count = max(0, (os.path.getsize(path) - HEADER.size) // RECORD.size)
+    records = np.fromfile(path, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+    if instrument_key is not None:
+        if instrument_key not in instruments:
+            return records[:0], instruments
+        records = records[records['instrument'] == instruments.index(instrument_key)]
+    return records, instruments
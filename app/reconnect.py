@@ -0,0 +1,111 @@
+import heapq
+import random
+import threading
+import time
+
+# Reconnect backoff defaults
+RECONNECT_BASE_DELAY = 1.0    # Seconds before the first retry
+RECONNECT_MAX_DELAY = 60.0    # Ceiling for the backoff
+RECONNECT_JITTER = 0.5        # Fraction of each delay that is randomized
+
+
+def backoff_delay(attempt, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY,
+                  jitter=RECONNECT_JITTER, rng=random):
+    """
+    Returns the delay before retry number `attempt` (0 for the first retry).
+
+    The delay doubles with every attempt up to `max_delay`, and the last `jitter`
+    fraction of it is random so connections dropped together do not all come back
+    in the same instant.
+    """
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return delay * (1.0 - jitter) + delay * jitter * rng.random()
+
+
+class ReconnectSupervisor:
+    """
+    Schedules reconnect attempts on its own thread.
+
+    Connection callbacks only call `schedule`, which returns immediately, so a
+    socket thread never sleeps or holds a lock while it waits for the next attempt.
+    Each target keeps its own attempt count; `reset` clears it once a connection
+    opens. When an attempt is due the supervisor calls `target.connect()`.
+
+    Args:
+        base_delay (float): Delay before the first retry.
+        max_delay (float): Upper bound of the delay.
+        jitter (float): Fraction of each delay that is randomized (0 to 1).
+    """
+    def __init__(self, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY, jitter=RECONNECT_JITTER):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._condition = threading.Condition()
+        self._queue = []          # (due time, sequence, target)
+        self._pending = {}        # target -> due time of its scheduled attempt
+        self._attempts = {}
+        self._sequence = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="ReconnectSupervisor", daemon=True)
+        self._thread.start()
+
+    def schedule(self, target):
+        """
+        Schedules the next reconnect attempt for a target, unless one is already pending.
+
+        Returns:
+            float: Seconds until the attempt.
+        """
+        with self._condition:
+            if target in self._pending:
+                return max(0.0, self._pending[target] - time.monotonic())
+            attempt = self._attempts.get(target, 0)
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay, self.jitter)
+            self._attempts[target] = attempt + 1
+            due = time.monotonic() + delay
+            self._pending[target] = due
+            self._sequence += 1
+            heapq.heappush(self._queue, (due, self._sequence, target))
+            self._condition.notify()
+            return delay
+
+    def cancel(self, target):
+        """Drops a pending attempt for a target."""
+        with self._condition:
+            self._pending.pop(target, None)
+
+    def reset(self, target):
+        """Starts the backoff over after a successful connection."""
+        with self._condition:
+            self._attempts.pop(target, None)
+
+    def attempts(self, target):
+        with self._condition:
+            return self._attempts.get(target, 0)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+        self._thread.join(timeout=5.0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    now = time.monotonic()
+                    if self._queue and self._queue[0][0] <= now:
+                        due, _, target = heapq.heappop(self._queue)
+                        if self._pending.get(target) == due:
+                            del self._pending[target]
+                            break
+                        continue  # Cancelled or superseded.
+                    self._condition.wait(self._queue[0][0] - now if self._queue else None)
+                if self._stopped:
+                    return
+            try:
+                target.connect()
+            except Exception as e:
+                print(f"Reconnect attempt failed: {e}")
+                self.schedule(target)
@@ -0,0 +1,173 @@
+"""
+Replays a recorded market data day file (or a synthetic feed) through the live
+tick pipeline, without an Upstox login.
+
+Messages are decoded with the same `decode_feed_response` the feed workers use
+and handed to `WSSClient.on_ticks`, so they are journaled, aggregated and fanned
+out to Socket.IO clients exactly like live data.
+
+Usage (from Python):
+    engine = ReplayEngine(read_day_file('static/UpstoxWSS_08_10_25.txt'),
+                          wss_client.on_ticks, speed=10)
+    engine.start()
+"""
+import json
+import random
+import threading
+import time
+
+from .ticks import decode_feed_response
+
+
+def read_day_file(path, limit=None):
+    """
+    Yields the messages of a recorded `UpstoxWSS_<date>.txt` day file, one at a time.
+
+    Args:
+        path (str): Path to the line-delimited JSON day file.
+        limit (int): Stop after this many messages.
+    """
+    count = 0
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield message
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def synthetic_messages(n_messages, n_instruments=40, keys_per_message=20, interval_ms=100,
+                       start_ms=None, seed=7):
+    """
+    Yields a feed shaped like the live ltpc stream: every message carries a random
+    subset of the instruments, each with a small random walk in price.
+
+    Args:
+        n_messages (int): Number of messages (None for an endless feed).
+        n_instruments (int): Distinct instruments.
+        keys_per_message (int): Instruments per message.
+        interval_ms (int): Feed time between messages.
+        start_ms (int): Feed time of the first message (default: now).
+    """
+    rng = random.Random(seed)
+    keys = [f"NSE_EQ|INE{i:06d}01018" for i in range(n_instruments)]
+    prices = {key: rng.uniform(50, 2000) for key in keys}
+    close = dict(prices)
+    last_ltt = {}
+    now = start_ms if start_ms is not None else int(time.time() * 1000)
+    sent = 0
+    while n_messages is None or sent < n_messages:
+        now += interval_ms
+        feeds = {}
+        for key in rng.sample(keys, min(keys_per_message, n_instruments)):
+            prices[key] = round(max(1.0, prices[key] + rng.gauss(0, 0.5)), 2)
+            # Trade times lag the message but never go backwards for one instrument.
+            last_ltt[key] = max(last_ltt.get(key, 0), now - rng.randint(0, interval_ms))
+            feeds[key] = {'ltpc': {
+                'ltp': prices[key],
+                'ltt': str(last_ltt[key]),
+                'ltq': str(rng.choice((1, 1, 2, 5, 10, 25, 50, 100, 500))),
+                'cp': round(close[key], 2),
+            }, 'ticker': key.split('|')[-1]}
+        yield {'type': 'live_feed', 'feeds': feeds, 'currentTs': str(now)}
+        sent += 1
+
+
+def _message_time(message, ticks, current_ts):
+    if current_ts:
+        return current_ts
+    return max((tick.ltt for tick in ticks), default=None)
+
+
+class ReplayEngine:
+    """
+    Injects recorded or synthetic messages into a tick handler at a chosen speed.
+
+    Args:
+        messages (iterable): MessageToDict-style feed messages, in feed order.
+        on_ticks (callable): Receives (ticks, current_ts, quotes), e.g. WSSClient.on_ticks.
+        speed (float): 1 replays in real time, N replays N times faster, None (or 0)
+            injects as fast as the handler accepts.
+        instrument_map (dict): instrument_key -> trading symbol; tickers recorded in
+            the file are used for keys it does not know.
+        restamp (bool): Stamp every tick (ltt and currentTs) with the wall clock at
+            injection, so receivers can measure tick-to-client latency.
+    """
+    def __init__(self, messages, on_ticks, speed=1.0, instrument_map=None, restamp=False):
+        self.messages = messages
+        self.on_ticks = on_ticks
+        self.speed = speed or None
+        self.instrument_map = dict(instrument_map or {})
+        self.restamp = restamp
+        self.stats = {'messages': 0, 'ticks': 0, 'errors': 0, 'elapsed': 0.0, 'max_lag': 0.0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Replays on a background thread."""
+        self._thread = threading.Thread(target=self.run, name="ReplayEngine", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self):
+        """
+        Replays every message, pacing them by their feed time.
+
+        Returns:
+            dict: messages, ticks, errors, elapsed seconds and the largest lag (seconds)
+            behind the requested pace.
+        """
+        started = time.monotonic()
+        first_feed_ms = None
+        for message in self.messages:
+            if self._stop.is_set():
+                break
+            for key, feed in message.get('feeds', {}).items():
+                if key not in self.instrument_map and 'ticker' in feed:
+                    self.instrument_map[key] = feed['ticker']
+            try:
+                ticks, current_ts = decode_feed_response(message, self.instrument_map)
+            except (TypeError, ValueError, AttributeError) as e:
+                self.stats['errors'] += 1
+                print(f"Skipping unreadable message {self.stats['messages'] + 1}: {e}")
+                continue
+
+            feed_ms = _message_time(message, ticks, current_ts)
+            if self.speed and feed_ms is not None:
+                if first_feed_ms is None:
+                    first_feed_ms = feed_ms
+                due = started + (feed_ms - first_feed_ms) / 1000.0 / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    if self._stop.wait(delay):
+                        break
+                else:
+                    self.stats['max_lag'] = max(self.stats['max_lag'], -delay)
+
+            if self.restamp:
+                now_ms = int(time.time() * 1000)
+                ticks = [tick._replace(ltt=now_ms) for tick in ticks]
+                current_ts = now_ms
+            if ticks:
+                self.on_ticks(ticks, current_ts, [])
+            self.stats['messages'] += 1
+            self.stats['ticks'] += len(ticks)
+        self.stats['elapsed'] = time.monotonic() - started
+        return self.stats
@@ -0,0 +1,59 @@
+import threading
+from bisect import insort
+
+
+class SecurityRegistry:
+    """
+    The set of securities clients can choose from, kept sorted.
+
+    Membership is a set lookup, so the live feed can check every tick cheaply, and a
+    new security is inserted in place instead of re-sorting the list. Every change
+    bumps `version`; clients are sent the additions (`securities_added`) together
+    with the version they apply to, and only ask for the full list if they fall out
+    of step.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = set()
+        self._sorted = []
+        self.version = 0
+        self.loaded = False
+
+    def __contains__(self, security_id):
+        return security_id in self._members
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def load(self, securities):
+        """Adds the initial securities in one go and marks the registry as loaded."""
+        with self._lock:
+            new = set(securities) - self._members
+            if new:
+                self._members.update(new)
+                self._sorted = sorted(self._members)
+                self.version += 1
+            self.loaded = True
+
+    def add_many(self, securities):
+        """
+        Adds securities that are not registered yet.
+
+        Returns:
+            tuple: (base_version, version, added) where `added` is the sorted list of
+            securities that were new, and `base_version` the version before them.
+        """
+        with self._lock:
+            base_version = self.version
+            added = sorted(set(security_id for security_id in securities if security_id not in self._members))
+            for security_id in added:
+                self._members.add(security_id)
+                insort(self._sorted, security_id)
+            if added:
+                self.version += 1
+            return base_version, self.version, added
+
+    def snapshot(self):
+        """Returns (version, sorted list of securities)."""
+        with self._lock:
+            return self.version, list(self._sorted)
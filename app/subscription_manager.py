@@ -0,0 +1,122 @@
+import threading
+import time
+
+# Subscription policy defaults
+SUBSCRIPTION_TTL = 60 * 60       # Seconds a BBSCAN hit keeps its instrument subscribed
+MAX_SUBSCRIPTIONS = 5000         # Instruments subscribed at most
+
+
+class SubscriptionManager:
+    """
+    Decides which instruments should be subscribed and applies the difference.
+
+    The target set is built from three sources, in priority order:
+
+    - pinned instruments, always subscribed;
+    - instruments someone is viewing (from the Socket.IO rooms);
+    - instruments found in BBSCAN files in the last `ttl` seconds, newest first.
+
+    When the sources add up to more than `cap` instruments, the oldest BBSCAN hits
+    are left out. `reconcile` compares the target with what is subscribed and calls
+    `apply(added, removed)` with the difference, so instruments nobody is watching
+    and that have not been scanned for a while are unsubscribed again.
+
+    Args:
+        apply (callable): Receives (keys to subscribe, keys to unsubscribe).
+        ttl (float): Seconds a BBSCAN hit stays in the target set.
+        cap (int): Maximum number of subscribed instruments.
+        pinned (iterable): Instrument keys that are always subscribed.
+        clock (callable): Time source in seconds (for tests).
+    """
+    def __init__(self, apply, ttl=SUBSCRIPTION_TTL, cap=MAX_SUBSCRIPTIONS, pinned=(), clock=time.monotonic):
+        self.apply = apply
+        self.ttl = ttl
+        self.cap = cap
+        self.clock = clock
+        self.pinned = set(pinned)
+        self.viewed = set()
+        self.last_scanned = {}
+        self.subscribed = set()
+        self.stats = {'reconciles': 0, 'added': 0, 'removed': 0, 'capped': 0}
+        self._lock = threading.RLock()
+
+    def note_scanned(self, keys):
+        """Records that these instruments were just found in a BBSCAN file."""
+        now = self.clock()
+        with self._lock:
+            for key in keys:
+                self.last_scanned[key] = now
+
+    def set_viewed(self, key, viewed):
+        with self._lock:
+            if viewed:
+                self.viewed.add(key)
+            else:
+                self.viewed.discard(key)
+
+    def pin(self, keys):
+        with self._lock:
+            self.pinned.update(keys)
+
+    def unpin(self, keys):
+        with self._lock:
+            self.pinned.difference_update(keys)
+
+    def target(self):
+        """Returns the set of instruments that should be subscribed right now."""
+        now = self.clock()
+        with self._lock:
+            # Forget hits past their TTL so the dict does not grow all day.
+            expired = [key for key, seen in self.last_scanned.items() if now - seen > self.ttl]
+            for key in expired:
+                del self.last_scanned[key]
+
+            target = set(list(self.pinned)[:self.cap])
+            for key in self.viewed:
+                if len(target) >= self.cap:
+                    break
+                target.add(key)
+            if len(target) + len(self.last_scanned) <= self.cap:
+                target.update(self.last_scanned)
+            else:
+                by_recency = sorted(self.last_scanned, key=self.last_scanned.get, reverse=True)
+                for key in by_recency:
+                    if len(target) >= self.cap:
+                        break
+                    target.add(key)
+            return target
+
+    def reconcile(self):
+        """
+        Subscribes and unsubscribes whatever it takes to reach the target set.
+
+        Returns:
+            tuple: (added, removed) lists of instrument keys.
+        """
+        with self._lock:
+            target = self.target()
+            added = sorted(target - self.subscribed)
+            removed = sorted(self.subscribed - target)
+            wanted = len(self.pinned | self.viewed | set(self.last_scanned))
+            self.stats['reconciles'] += 1
+            self.stats['capped'] = max(0, wanted - len(target))
+            if not added and not removed:
+                return added, removed
+            self.subscribed = target
+            self.stats['added'] += len(added)
+            self.stats['removed'] += len(removed)
+            self.apply(added, removed)
+            return added, removed
+
+    def summary(self):
+        """Returns the sizes of the target sources and of the subscribed set."""
+        with self._lock:
+            return {
+                'subscribed': len(self.subscribed),
+                'pinned': len(self.pinned),
+                'viewed': len(self.viewed),
+                'scanned': len(self.last_scanned),
+                'capped': self.stats['capped'],
+                'cap': self.cap,
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,390 @@
+"""
+Binary, append-only tick journal.
+
+A journal is three files sharing a base path (e.g. `static/UpstoxWSS_08_10_25`):
+
+- `<base>.ticks`        a 16-byte header followed by fixed-width 32-byte records
+                        (instrument id, ltt, ltp, ltq, cp), little-endian.
+- `<base>.instruments`  the per-file instrument dictionary, one
+                        "id<TAB>instrument_key<TAB>ticker" line per instrument.
+- `<base>.idx`          the per-instrument offset index: one (instrument id,
+                        first record, record count) run per instrument per commit.
+
+Every group commit is written sorted by instrument, so each instrument's ticks form
+contiguous runs that a reader can slice out of a memory map without copying.
+
+Usage:
+    python -m app.tick_journal convert static/UpstoxWSS_08_10_25.txt [base_path]
+    python -m app.tick_journal info static/UpstoxWSS_08_10_25
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+from operator import itemgetter
+
+import numpy as np
+
+from .tick_store import TickColumns
+from .ticks import decode_feed_response
+
+MAGIC = b'UPXTICK1'
+VERSION = 1
+HEADER = struct.Struct('<8sII')      # magic, version, record size
+RECORD = struct.Struct('<IqdId')     # instrument id, ltt, ltp, ltq, cp
+RUN = struct.Struct('<III')          # instrument id, first record, record count
+
+RECORD_DTYPE = np.dtype([
+    ('instrument', '<u4'),
+    ('ltt', '<i8'),
+    ('ltp', '<f8'),
+    ('ltq', '<i4'),
+    ('cp', '<f8'),
+])
+RUN_DTYPE = np.dtype([('instrument', '<u4'), ('first', '<u4'), ('count', '<u4')])
+
+TICKS_SUFFIX = '.ticks'
+INSTRUMENTS_SUFFIX = '.instruments'
+INDEX_SUFFIX = '.idx'
+
+
+def journal_exists(base_path):
+    """Returns True if a journal with this base path has been started."""
+    return os.path.exists(base_path + TICKS_SUFFIX)
+
+
+def journal_record_count(base_path):
+    """Returns the number of complete records currently in a journal (0 if absent)."""
+    try:
+        size = os.path.getsize(base_path + TICKS_SUFFIX)
+    except OSError:
+        return 0
+    return max(0, (size - HEADER.size) // RECORD.size)
+
+
+def _derive_runs(instrument_ids, first):
+    """Returns (instrument id, first record, record count) runs of consecutive records, numbered from `first`."""
+    if not len(instrument_ids):
+        return []
+    boundaries = np.flatnonzero(np.diff(instrument_ids)) + 1
+    starts = np.concatenate(([0], boundaries)).tolist()
+    ends = np.concatenate((boundaries, [len(instrument_ids)])).tolist()
+    return [(int(instrument_ids[start]), first + start, end - start) for start, end in zip(starts, ends)]
+
+
+def _read_instruments(path):
+    """Reads an instrument dictionary file into a list of (instrument_key, ticker) by id."""
+    instruments = []
+    if not os.path.exists(path):
+        return instruments
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # Torn final line; the records using it were never committed.
+            instrument_id, key, ticker = line.rstrip('\n').split('\t')
+            if int(instrument_id) != len(instruments):
+                raise ValueError(f"Instrument dictionary {path} is out of sequence at id {instrument_id}.")
+            instruments.append((key, ticker))
+    return instruments
+
+
+class TickJournal:
+    """
+    Append-only writer for the binary tick journal. Implements the TickWriter sink
+    interface, taking batches of (ticks, current_ts) records.
+    """
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self._ids = {}
+        self._record_count = 0
+        self._ticks_file = None
+        self._instruments_file = None
+        self._index_file = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.base_path) or '.', exist_ok=True)
+        ticks_path = self.base_path + TICKS_SUFFIX
+
+        for instrument_id, (key, _) in enumerate(_read_instruments(self.base_path + INSTRUMENTS_SUFFIX)):
+            self._ids[key] = instrument_id
+
+        self._ticks_file = open(ticks_path, 'ab')
+        size = self._ticks_file.tell()
+        if size < HEADER.size:
+            self._ticks_file.truncate(0)
+            self._ticks_file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            with open(ticks_path, 'rb') as f:
+                magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or record_size != RECORD.size:
+                raise ValueError(f"{ticks_path} is not a version {VERSION} tick journal.")
+            # Drop a torn trailing record left behind by a crash.
+            aligned = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+            if aligned != size:
+                self._ticks_file.truncate(aligned)
+        self._record_count = (self._ticks_file.tell() - HEADER.size) // RECORD.size
+
+        self._instruments_file = open(self.base_path + INSTRUMENTS_SUFFIX, 'a')
+        self._index_file = open(self.base_path + INDEX_SUFFIX, 'ab')
+        self._repair_index()
+
+    def _repair_index(self):
+        """
+        Indexes records a crash left on disk without their runs (the index is written
+        last), so appending after them cannot leave an unindexed gap. A torn trailing
+        run entry is dropped first.
+        """
+        size = self._index_file.tell()
+        if size % RUN.size:
+            self._index_file.truncate(size - size % RUN.size)
+            size -= size % RUN.size
+        covered = 0
+        if size:
+            with open(self.base_path + INDEX_SUFFIX, 'rb') as f:
+                f.seek(size - RUN.size)
+                _, first, run_count = RUN.unpack(f.read(RUN.size))
+            covered = first + run_count
+        if covered >= self._record_count:
+            return
+        with open(self.base_path + TICKS_SUFFIX, 'rb') as f:
+            f.seek(HEADER.size + covered * RECORD.size)
+            records = np.frombuffer(f.read((self._record_count - covered) * RECORD.size), dtype=RECORD_DTYPE)
+        runs = _derive_runs(records['instrument'], covered)
+        self._index_file.write(b''.join(RUN.pack(*run) for run in runs))
+        self._index_file.flush()
+        print(f"Indexed {self._record_count - covered} records of {self.base_path} left unindexed by a crash.")
+
+    def write_batch(self, batch):
+        """
+        Appends a batch of (ticks, current_ts) records as one sorted group commit.
+
+        Returns:
+            int: Number of records written.
+        """
+        if self._ticks_file is None:
+            self._open()
+
+        entries = []
+        new_instruments = []
+        for ticks, _ in batch:
+            for tick in ticks:
+                instrument_id = self._ids.get(tick.instrument_key)
+                if instrument_id is None:
+                    instrument_id = self._ids[tick.instrument_key] = len(self._ids)
+                    new_instruments.append(f"{instrument_id}\t{tick.instrument_key}\t{tick.ticker}\n")
+                entries.append((instrument_id, tick))
+        if not entries:
+            return len(batch)
+
+        # A stable sort keeps each instrument's ticks in arrival order within its run.
+        entries.sort(key=itemgetter(0))
+        packed = []
+        runs = []
+        run_id, run_start = entries[0][0], self._record_count
+        for position, (instrument_id, tick) in enumerate(entries):
+            if instrument_id != run_id:
+                runs.append(RUN.pack(run_id, run_start, self._record_count + position - run_start))
+                run_id, run_start = instrument_id, self._record_count + position
+            packed.append(RECORD.pack(instrument_id, tick.ltt, tick.ltp, tick.ltq, tick.cp))
+        runs.append(RUN.pack(run_id, run_start, self._record_count + len(entries) - run_start))
+
+        # Dictionary first, then records, then the index, so a reader never sees an
+        # index entry pointing at missing records or an id it cannot resolve.
+        if new_instruments:
+            self._instruments_file.write(''.join(new_instruments))
+            self._instruments_file.flush()
+        self._ticks_file.write(b''.join(packed))
+        self._ticks_file.flush()
+        self._index_file.write(b''.join(runs))
+        self._record_count += len(entries)
+        return len(batch)
+
+    def flush(self):
+        for f in (self._instruments_file, self._ticks_file, self._index_file):
+            if f is not None:
+                f.flush()
+
+    def sync(self):
+        for f in (self._instruments_file, self._ticks_file, self._index_file):
+            if f is not None:
+                os.fsync(f.fileno())
+
+    def close(self):
+        for f in (self._instruments_file, self._ticks_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._ticks_file = self._instruments_file = self._index_file = None
+
+
+class TickJournalReader:
+    """
+    Memory-maps a tick journal and serves per-instrument slices of it.
+
+    Args:
+        base_path (str): Journal base path.
+        max_records (int): Optional cap on the records read, e.g. the count at startup.
+    """
+    def __init__(self, base_path, max_records=None):
+        self.base_path = base_path
+        self.instruments = _read_instruments(base_path + INSTRUMENTS_SUFFIX)
+        self.ids = {key: instrument_id for instrument_id, (key, _) in enumerate(self.instruments)}
+
+        count = journal_record_count(base_path)
+        if max_records is not None:
+            count = min(count, max_records)
+
+        self._file = open(base_path + TICKS_SUFFIX, 'rb')
+        magic, version, record_size = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.size:
+            self._file.close()
+            raise ValueError(f"{base_path + TICKS_SUFFIX} is not a version {VERSION} tick journal.")
+
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        if self._mmap is not None:
+            self.records = np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+        self.runs = self._load_runs(count)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _load_runs(self, count):
+        """
+        Builds {instrument id: [(first, count), ...]} from the index, re-deriving runs
+        from the records themselves for any stretch the index does not cover: the
+        tail not indexed yet, or a gap a crash left in a journal written since.
+        """
+        runs = {}
+        covered = 0
+
+        def add(instrument_id, first, run_count):
+            runs.setdefault(instrument_id, []).append((first, run_count))
+
+        index_path = self.base_path + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                data = f.read()
+            entries = np.frombuffer(data, dtype=RUN_DTYPE, count=len(data) // RUN.size)
+            for instrument_id, first, run_count in entries.tolist():
+                if first + run_count > count:
+                    break
+                if first > covered:
+                    for run in _derive_runs(self.records['instrument'][covered:first], covered):
+                        add(*run)
+                add(instrument_id, first, run_count)
+                covered = first + run_count
+
+        if covered < count:
+            for run in _derive_runs(self.records['instrument'][covered:count], covered):
+                add(*run)
+        return runs
+
+    def securities(self):
+        """Returns the sorted instrument keys that have at least one record."""
+        return sorted(self.instruments[instrument_id][0] for instrument_id in self.runs)
+
+    def tick_count(self, instrument_key):
+        """Returns the number of records for an instrument."""
+        instrument_id = self.ids.get(instrument_key)
+        return sum(run_count for _, run_count in self.runs.get(instrument_id, ()))
+
+    def slices(self, instrument_key):
+        """
+        Returns the instrument's records as a list of zero-copy structured-array views
+        into the memory map, in time order.
+        """
+        instrument_id = self.ids.get(instrument_key)
+        return [self.records[first:first + run_count] for first, run_count in self.runs.get(instrument_id, ())]
+
+    def read_columns(self, instrument_key):
+        """Copies an instrument's records into a TickColumns for the in-memory store."""
+        columns = TickColumns()
+        parts = self.slices(instrument_key)
+        if not parts:
+            return columns
+        records = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        columns.ltt.frombytes(np.ascontiguousarray(records['ltt']).tobytes())
+        columns.ltp.frombytes(np.ascontiguousarray(records['ltp']).tobytes())
+        columns.ltq.frombytes(np.ascontiguousarray(records['ltq']).tobytes())
+        columns.cp.frombytes(np.ascontiguousarray(records['cp']).tobytes())
+        return columns
+
+    def close(self):
+        self.records = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+def convert_jsonl(jsonl_path, base_path=None, batch_messages=50000):
+    """
+    Imports a line-delimited JSON day file into a new binary journal.
+
+    Args:
+        jsonl_path (str): Path to an `UpstoxWSS_<date>.txt` file.
+        base_path (str): Journal base path; defaults to the JSONL path without extension.
+        batch_messages (int): Messages per commit. Larger batches give longer runs.
+
+    Returns:
+        tuple: (messages converted, ticks written).
+    """
+    if base_path is None:
+        base_path = os.path.splitext(jsonl_path)[0]
+    if journal_exists(base_path):
+        raise FileExistsError(f"Journal {base_path + TICKS_SUFFIX} already exists.")
+
+    journal = TickJournal(base_path)
+    tickers = {}
+    batch = []
+    messages = ticks = 0
+    with open(jsonl_path, 'r') as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                for key, feed_data in data.get('feeds', {}).items():
+                    if 'ticker' in feed_data:
+                        tickers[key] = feed_data['ticker']
+                record = decode_feed_response(data, tickers)
+            except (json.JSONDecodeError, TypeError, AttributeError, ValueError) as e:
+                print(f"Skipping line {i+1}: {e}")
+                continue
+            batch.append(record)
+            messages += 1
+            ticks += len(record[0])
+            if len(batch) >= batch_messages:
+                journal.write_batch(batch)
+                batch = []
+    if batch:
+        journal.write_batch(batch)
+    journal.sync()
+    journal.close()
+    return messages, ticks
+
+
+def _main(argv):
+    if len(argv) >= 2 and argv[0] == 'convert':
+        jsonl_path = argv[1]
+        base_path = argv[2] if len(argv) > 2 else None
+        messages, ticks = convert_jsonl(jsonl_path, base_path)
+        print(f"Converted {messages} messages ({ticks} ticks) from {jsonl_path}.")
+        return 0
+    if len(argv) == 2 and argv[0] == 'info':
+        reader = TickJournalReader(argv[1])
+        print(f"{len(reader)} records, {len(reader.instruments)} instruments, "
+              f"{sum(len(r) for r in reader.runs.values())} runs")
+        for key in reader.securities():
+            print(f"  {key}: {reader.tick_count(key)} ticks")
+        reader.close()
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
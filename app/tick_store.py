@@ -0,0 +1,125 @@
+import threading
+from array import array
+
+# array typecodes for each column
+LTT_TYPECODE = 'q'   # int64 epoch milliseconds
+LTP_TYPECODE = 'd'   # float64 last traded price
+LTQ_TYPECODE = 'i'   # int32 last traded quantity
+CP_TYPECODE = 'd'    # float64 previous close
+
+
+class TickColumns:
+    """
+    Columnar tick storage for a single instrument.
+
+    Each field lives in its own typed `array`, so a tick costs 28 bytes instead of a
+    dict of strings, and appends are amortized O(1) like a list.
+    """
+    __slots__ = ('ltt', 'ltp', 'ltq', 'cp')
+
+    def __init__(self):
+        self.ltt = array(LTT_TYPECODE)
+        self.ltp = array(LTP_TYPECODE)
+        self.ltq = array(LTQ_TYPECODE)
+        self.cp = array(CP_TYPECODE)
+
+    def __len__(self):
+        return len(self.ltt)
+
+    def append(self, ltt, ltp, ltq, cp):
+        """Appends one tick."""
+        self.ltt.append(ltt)
+        self.ltp.append(ltp)
+        self.ltq.append(ltq)
+        self.cp.append(cp)
+
+    def extend(self, other):
+        """Appends every tick of another TickColumns, in order."""
+        self.ltt.extend(other.ltt)
+        self.ltp.extend(other.ltp)
+        self.ltq.extend(other.ltq)
+        self.cp.extend(other.cp)
+
+    def copy(self):
+        """Returns an independent copy of the columns."""
+        columns = TickColumns()
+        columns.extend(self)
+        return columns
+
+    @property
+    def nbytes(self):
+        """Bytes used by the column buffers (excluding over-allocation)."""
+        return sum(len(column) * column.itemsize for column in (self.ltt, self.ltp, self.ltq, self.cp))
+
+    def to_wire(self, start=0, stop=None):
+        """
+        Returns ticks in the LTPC dict shape the browser expects, for the slice [start:stop].
+        """
+        ltt, ltp, ltq, cp = self.ltt[start:stop], self.ltp[start:stop], self.ltq[start:stop], self.cp[start:stop]
+        return [
+            {'ltp': ltp[i], 'ltt': str(ltt[i]), 'ltq': str(ltq[i]), 'cp': cp[i]}
+            for i in range(len(ltt))
+        ]
+
+
+class TickStore:
+    """
+    Thread-safe map of security_id -> TickColumns for ticks received live.
+    """
+    def __init__(self):
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, security_id):
+        return security_id in self._columns
+
+    def __len__(self):
+        return len(self._columns)
+
+    def append(self, security_id, ltt, ltp, ltq, cp):
+        """Appends one tick for a security, creating its columns on first use."""
+        with self._lock:
+            columns = self._columns.get(security_id)
+            if columns is None:
+                columns = self._columns[security_id] = TickColumns()
+            columns.append(ltt, ltp, ltq, cp)
+
+    def append_tick(self, tick):
+        """Appends a decoded Tick record."""
+        self.append(tick.instrument_key, tick.ltt, tick.ltp, tick.ltq, tick.cp)
+
+    def get(self, security_id):
+        """Returns the TickColumns for a security, or None if it has no ticks."""
+        return self._columns.get(security_id)
+
+    def copy_columns(self, security_id):
+        """Returns a consistent copy of a security's columns, or None if it has no ticks."""
+        with self._lock:
+            columns = self._columns.get(security_id)
+            return columns.copy() if columns is not None else None
+
+    def to_wire(self, security_id):
+        """Returns a consistent copy of a security's ticks in the browser's LTPC shape."""
+        with self._lock:
+            columns = self._columns.get(security_id)
+            return columns.to_wire() if columns is not None else []
+
+    def securities(self):
+        """Returns the sorted list of securities that have ticks."""
+        with self._lock:
+            return sorted(self._columns)
+
+    def memory_usage(self):
+        """
+        Returns:
+            dict: Tick count, column bytes and bytes per tick across all securities.
+        """
+        with self._lock:
+            ticks = sum(len(columns) for columns in self._columns.values())
+            nbytes = sum(columns.nbytes for columns in self._columns.values())
+        return {
+            'securities': len(self._columns),
+            'ticks': ticks,
+            'bytes': nbytes,
+            'bytes_per_tick': nbytes / ticks if ticks else 0.0,
+        }
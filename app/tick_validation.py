@@ -0,0 +1,109 @@
+import math
+import time
+from collections import Counter
+
+from .aggregation import normalize_ltt
+from .metrics import METRICS
+
+# Ticks stamped further than this ahead of the feed's clock (currentTs) are rejected.
+MAX_FUTURE_SKEW_MS = 5 * 60 * 1000
+
+# Rejection reasons, as counted in `stats` and the ticks_rejected metric
+REJECT_INVALID = "invalid"            # ltp/ltq/ltt not numbers, NaN/infinite ltp or ltt <= 0
+REJECT_NO_QUANTITY = "no_quantity"    # ltq <= 0: not a trade
+REJECT_FUTURE = "future"              # ltt past currentTs + MAX_FUTURE_SKEW_MS, even after normalization
+REJECT_OUT_OF_ORDER = "out_of_order"  # ltt older than the instrument's last accepted tick
+REJECT_DUPLICATE = "duplicate"        # Same ltt, ltp and ltq as an accepted tick of the instrument
+REJECT_REASONS = (REJECT_INVALID, REJECT_NO_QUANTITY, REJECT_FUTURE, REJECT_OUT_OF_ORDER, REJECT_DUPLICATE)
+
+
+class TickValidator:
+    """
+    Ingest-time validation of decoded ticks, before they are journaled, aggregated
+    or broadcast, so every later stage (and every client) only sees clean ticks:
+
+    - ltt is an int in epoch milliseconds, normalized with `normalize_ltt`;
+    - ltp and cp are finite floats, ltq a positive int;
+    - per instrument, ltt never decreases and no tick is repeated.
+
+    A repeat is a tick with the same ltt, ltp and ltq as one already accepted at that
+    ltt, which the feed sends again e.g. after a reconnect or in the snapshot of a
+    mode change. Trades at the same millisecond with a different price or quantity
+    are kept.
+
+    Not thread-safe: WSSClient calls it from its single tick handler thread.
+
+    Args:
+        max_future_skew_ms (int): How far ahead of currentTs an ltt may be.
+    """
+    def __init__(self, max_future_skew_ms=MAX_FUTURE_SKEW_MS):
+        self.max_future_skew_ms = max_future_skew_ms
+        # instrument_key -> (last accepted ltt, set of (ltp, ltq) accepted at that ltt)
+        self._last = {}
+        self.stats = Counter({'accepted': 0, 'normalized_ltt': 0})
+        for reason in REJECT_REASONS:
+            self.stats[reason] = 0
+
+    def validate(self, ticks, current_ts=None):
+        """
+        Returns the valid ticks of a batch, normalized and in arrival order.
+
+        Args:
+            ticks (list): Tick records from decode_feed_response.
+            current_ts (int): The message's currentTs (epoch ms); wall clock if None.
+        """
+        reference_ms = current_ts if current_ts else int(time.time() * 1000)
+        newest_allowed = reference_ms + self.max_future_skew_ms
+        accepted = []
+        rejected = Counter()
+        normalized = 0
+        for tick in ticks:
+            try:
+                ltt = int(tick.ltt)
+                ltp = float(tick.ltp)
+                ltq = int(tick.ltq)
+                cp = float(tick.cp)
+            except (TypeError, ValueError, OverflowError):
+                rejected[REJECT_INVALID] += 1
+                continue
+            if ltt <= 0 or not math.isfinite(ltp):
+                rejected[REJECT_INVALID] += 1
+                continue
+            if ltq <= 0:
+                rejected[REJECT_NO_QUANTITY] += 1
+                continue
+            time_ms = normalize_ltt(ltt)
+            if time_ms > newest_allowed:
+                rejected[REJECT_FUTURE] += 1
+                continue
+
+            last = self._last.get(tick.instrument_key)
+            if last is not None and time_ms <= last[0]:
+                if time_ms < last[0]:
+                    rejected[REJECT_OUT_OF_ORDER] += 1
+                    continue
+                if (ltp, ltq) in last[1]:
+                    rejected[REJECT_DUPLICATE] += 1
+                    continue
+                last[1].add((ltp, ltq))
+            else:
+                self._last[tick.instrument_key] = (time_ms, {(ltp, ltq)})
+
+            if time_ms != ltt:
+                normalized += 1
+            if not math.isfinite(cp):
+                cp = 0.0
+            if ((time_ms, ltp, ltq, cp) != (tick.ltt, tick.ltp, tick.ltq, tick.cp)
+                    or type(tick.ltt) is not int or type(tick.ltq) is not int
+                    or type(tick.ltp) is not float or type(tick.cp) is not float):
+                tick = tick._replace(ltt=time_ms, ltp=ltp, ltq=ltq, cp=cp)
+            accepted.append(tick)
+
+        self.stats['accepted'] += len(accepted)
+        self.stats['normalized_ltt'] += normalized
+        if normalized:
+            METRICS.inc('ticks_normalized', normalized)
+        for reason, count in rejected.items():
+            self.stats[reason] += count
+            METRICS.inc('ticks_rejected', count, reason=reason)
+        return accepted
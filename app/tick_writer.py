@@ -0,0 +1,275 @@
+import os
+import json
+import queue
+import threading
+import time
+
+from .metrics import METRICS
+
+# fsync policies
+FSYNC_NEVER = "never"          # Leave durability to the OS page cache.
+FSYNC_BATCH = "batch"          # fsync after every group commit.
+FSYNC_INTERVAL = "interval"    # fsync at most once every `fsync_interval` seconds.
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_BATCH, FSYNC_INTERVAL)
+
+# Sentinel used to ask the writer thread to flush and exit.
+_STOP = object()
+
+
+class JsonlSink:
+    """
+    History sink that appends one JSON line per record (the original day-file format).
+    """
+    def __init__(self, file_path, serializer=json.dumps):
+        self.file_path = file_path
+        self.serializer = serializer
+        self._file = None
+
+    def write_batch(self, batch):
+        """
+        Serializes and writes a batch with a single write call.
+
+        Returns:
+            int: Number of records written.
+        """
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.serializer(record))
+            except Exception as e:
+                print(f"JsonlSink could not serialize record: {e}")
+        if not lines:
+            return 0
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            self._file = open(self.file_path, 'a')
+        self._file.write('\n'.join(lines) + '\n')
+        return len(lines)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def sync(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TickWriter:
+    """
+    Buffered, batched writer for the tick history.
+
+    The WebSocket receive path only calls `enqueue`, which puts the record on a
+    bounded queue. A dedicated background thread drains the queue and group-commits
+    records to disk whenever `batch_size` records are pending or `flush_interval`
+    seconds have passed since the first pending record, whichever comes first.
+    When the queue is full the record is dropped (after an optional short wait)
+    and counted, so a slow disk can never stall the live feed.
+
+    The on-disk format is delegated to a sink exposing `write_batch(batch)`,
+    `flush()`, `sync()` and `close()`, such as JsonlSink or TickJournal.
+
+    Commit times are recorded in METRICS as the `<name>_commit` stage, and the
+    queue depth is exported as the `queue_depth{queue="<name>"}` gauge.
+    """
+    def __init__(self, sink, max_queue_size=10000, batch_size=500, flush_interval=0.2,
+                 fsync_policy=FSYNC_INTERVAL, fsync_interval=1.0, enqueue_timeout=0.0, name="tick_writer"):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync policy '{fsync_policy}'. Expected one of {FSYNC_POLICIES}.")
+
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        # Held while a record is put, so none is queued after close() has started.
+        self._enqueue_lock = threading.Lock()
+        self._sink_closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'errors': 0,
+            'batches': 0,
+            'fsyncs': 0,
+            'max_batch': 0,
+            'max_queue_depth': 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        METRICS.gauge('queue_depth', self.queue_depth, queue=name)
+
+    def enqueue(self, record):
+        """
+        Queues a record for writing. Never blocks longer than `enqueue_timeout`.
+
+        Returns:
+            bool: True if the record was queued, False if it was dropped.
+        """
+        with self._enqueue_lock:
+            if self._closed:
+                self._count('dropped')
+                return False
+            try:
+                if self.enqueue_timeout > 0:
+                    self._queue.put(record, timeout=self.enqueue_timeout)
+                else:
+                    self._queue.put_nowait(record)
+            except queue.Full:
+                self._count('dropped')
+                return False
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return True
+
+    def close(self, timeout=5.0):
+        """
+        Stops accepting records, flushes everything still queued and closes the sink.
+        """
+        with self._enqueue_lock:
+            if self._closed:
+                return
+            # The writer thread stops by itself once closed and drained; the stop marker
+            # only wakes it up when it is idle, and cannot be queued while the queue is full.
+            self._closed = True
+        deadline = time.monotonic() + timeout
+        try:
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                print(f"TickWriter queue still full after {timeout}s; waiting for the writer to drain it.")
+            self._thread.join(max(0.0, deadline - time.monotonic()))
+        finally:
+            if self._thread.is_alive():
+                print(f"TickWriter did not finish flushing within {timeout}s.")
+            elif not self._sink_closed:
+                # The writer thread is gone without closing the sink: commit what is left here.
+                self._commit([item for item in self._drain() if item is not _STOP])
+                self._close_sink()
+
+    def stats(self):
+        """Returns a snapshot of the writer counters plus the current queue depth."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+        if name == 'dropped':
+            METRICS.inc('writer_dropped_records', amount, writer=self.name)
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _run(self):
+        """Writer thread: collects records into batches and commits them."""
+        batch = []
+        batch_started = None
+        while True:
+            if batch:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - batch_started))
+            elif self._closed and self._queue.empty():
+                # Closed, but the stop marker did not fit into the full queue.
+                self._close_sink()
+                return
+            else:
+                timeout = None
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stopping = item is _STOP
+            if item is not None and not stopping:
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append(item)
+                # Drain whatever else is already waiting, up to the batch size.
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+            if batch and (stopping or len(batch) >= self.batch_size
+                          or time.monotonic() - batch_started >= self.flush_interval):
+                self._commit(batch)
+                batch = []
+
+            if stopping:
+                self._close_sink()
+                return
+
+    def _commit(self, batch):
+        """Hands a batch to the sink as one group commit."""
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            written = self.sink.write_batch(batch)
+            self.sink.flush()
+            self._maybe_fsync()
+        except Exception as e:
+            self._count('errors')
+            self._count('dropped', len(batch))
+            print(f"TickWriter failed to write batch of {len(batch)} records: {e}")
+            return
+        METRICS.observe(self.name + '_commit', time.perf_counter() - start)
+
+        with self._stats_lock:
+            self._stats['written'] += written
+            self._stats['errors'] += len(batch) - written
+            self._stats['batches'] += 1
+            if written > self._stats['max_batch']:
+                self._stats['max_batch'] = written
+
+    def _maybe_fsync(self, force=False):
+        if self.fsync_policy == FSYNC_NEVER and not force:
+            return
+        now = time.monotonic()
+        if (force or self.fsync_policy == FSYNC_BATCH
+                or now - self._last_fsync >= self.fsync_interval):
+            self.sink.sync()
+            self._last_fsync = now
+            self._count('fsyncs')
+
+    def _close_sink(self):
+        self._sink_closed = True
+        try:
+            self.sink.flush()
+            self._maybe_fsync(force=self.fsync_policy != FSYNC_NEVER)
+            self.sink.close()
+        except Exception as e:
+            print(f"TickWriter failed to close its sink: {e}")
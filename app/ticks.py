@@ -0,0 +1,167 @@
+import json
+from collections import namedtuple
+
+# Oneof branches of a Feed that carry an LTPC block, in the order they are checked.
+_FULL_FEED_BRANCHES = ('marketFF', 'indexFF')
+
+
+class Tick(namedtuple('Tick', ['instrument_key', 'ticker', 'ltp', 'ltt', 'ltq', 'cp'])):
+    """
+    Compact, immutable record for a single last-traded-price update.
+
+    Numeric fields are stored as numbers (ltt in epoch milliseconds), so the
+    persistence and fan-out paths never have to re-parse strings.
+    """
+    __slots__ = ()
+
+    def to_wire(self):
+        """
+        Returns the tick in the LTPC shape the browser and the history file use,
+        with int64 fields rendered as strings exactly like protobuf's MessageToDict.
+        """
+        return {'ltp': self.ltp, 'ltt': str(self.ltt), 'ltq': str(self.ltq), 'cp': self.cp}
+
+
+QUOTE_FIELDS = (
+    'instrument_key', 'ts', 'oi', 'vtt', 'atp', 'iv', 'tbq', 'tsq',
+    'bid_price', 'bid_qty', 'ask_price', 'ask_qty', 'delta', 'theta', 'gamma', 'vega',
+)
+
+
+class MarketQuote(namedtuple('MarketQuote', QUOTE_FIELDS)):
+    """
+    Depth, open interest and greeks of one instrument, decoded only from feeds
+    subscribed in `full` or `option_greeks` mode. Fields a mode does not carry are 0
+    (e.g. tbq/tsq/atp in option_greeks mode, greeks for non-options).
+    """
+    __slots__ = ()
+
+    def to_wire(self):
+        return {
+            'ts': self.ts, 'oi': self.oi, 'vtt': self.vtt, 'atp': self.atp, 'iv': self.iv,
+            'tbq': self.tbq, 'tsq': self.tsq,
+            'bid': [self.bid_price, self.bid_qty], 'ask': [self.ask_price, self.ask_qty],
+            'greeks': [self.delta, self.theta, self.gamma, self.vega],
+        }
+
+
+def _quote_from_proto(key, feed, ts):
+    """Returns a MarketQuote for a full or option_greeks Feed, or None for ltpc-only feeds."""
+    branch = feed.WhichOneof('FeedUnion')
+    if branch == 'fullFeed':
+        if feed.fullFeed.WhichOneof('FullFeedUnion') != 'marketFF':
+            return None  # Index feeds carry no depth or OI.
+        full = feed.fullFeed.marketFF
+        depth = full.marketLevel.bidAskQuote
+        best = depth[0] if depth else None
+        greeks = full.optionGreeks
+        return MarketQuote(
+            key, ts, full.oi, full.vtt, full.atp, full.iv, full.tbq, full.tsq,
+            best.bidP if best else 0.0, best.bidQ if best else 0,
+            best.askP if best else 0.0, best.askQ if best else 0,
+            greeks.delta, greeks.theta, greeks.gamma, greeks.vega,
+        )
+    if branch == 'firstLevelWithGreeks':
+        first = feed.firstLevelWithGreeks
+        best = first.firstDepth
+        greeks = first.optionGreeks
+        return MarketQuote(
+            key, ts, first.oi, first.vtt, 0.0, first.iv, 0.0, 0.0,
+            best.bidP, best.bidQ, best.askP, best.askQ,
+            greeks.delta, greeks.theta, greeks.gamma, greeks.vega,
+        )
+    return None
+
+
+def _ltpc_from_proto(feed):
+    """Returns the LTPC message carried by a protobuf Feed, or None."""
+    branch = feed.WhichOneof('FeedUnion')
+    if branch == 'ltpc':
+        return feed.ltpc
+    if branch == 'fullFeed':
+        full_branch = feed.fullFeed.WhichOneof('FullFeedUnion')
+        if full_branch in _FULL_FEED_BRANCHES:
+            return getattr(feed.fullFeed, full_branch).ltpc
+    elif branch == 'firstLevelWithGreeks':
+        return feed.firstLevelWithGreeks.ltpc
+    return None
+
+
+def _ltpc_from_dict(feed):
+    """Returns the LTPC dict carried by a MessageToDict-style feed, or None."""
+    ltpc = feed.get('ltpc')
+    if ltpc is not None:
+        return ltpc
+    full_feed = feed.get('fullFeed')
+    if full_feed:
+        for branch in _FULL_FEED_BRANCHES:
+            if branch in full_feed:
+                return full_feed[branch].get('ltpc')
+    greeks = feed.get('firstLevelWithGreeks')
+    if greeks:
+        return greeks.get('ltpc')
+    return None
+
+
+def decode_feed_response(message, instrument_map, quotes=None):
+    """
+    Decodes one market data message into Tick records, exactly once.
+
+    Accepts either a protobuf `FeedResponse` (what the streamer receives on the wire)
+    or its MessageToDict form (what recorded day files and the stock SDK streamer
+    produce), so live and replayed data share the same pipeline.
+
+    Args:
+        message: A `FeedResponse` protobuf or an equivalent dict.
+        instrument_map (dict): Maps instrument_key to tradingsymbol.
+        quotes (list): If given, a MarketQuote is appended for every `full` or
+            `option_greeks` feed in a protobuf message. ltpc feeds never build one.
+
+    Returns:
+        tuple: (list of Tick, currentTs in epoch milliseconds or None).
+    """
+    ticks = []
+    if isinstance(message, dict):
+        for key, feed in message.get('feeds', {}).items():
+            ltpc = _ltpc_from_dict(feed)
+            if not ltpc:
+                continue
+            ticks.append(Tick(
+                key,
+                instrument_map.get(key, 'UNKNOWN'),
+                float(ltpc.get('ltp', 0.0)),
+                int(ltpc.get('ltt', 0)),
+                int(ltpc.get('ltq', 0)),
+                float(ltpc.get('cp', 0.0)),
+            ))
+        current_ts = message.get('currentTs')
+        return ticks, int(current_ts) if current_ts is not None else None
+
+    current_ts = message.currentTs or None
+    for key, feed in message.feeds.items():
+        ltpc = _ltpc_from_proto(feed)
+        if ltpc is None:
+            continue
+        ticks.append(Tick(key, instrument_map.get(key, 'UNKNOWN'), ltpc.ltp, ltpc.ltt, ltpc.ltq, ltpc.cp))
+        if quotes is not None and feed.WhichOneof('FeedUnion') != 'ltpc':
+            quote = _quote_from_proto(key, feed, current_ts or ltpc.ltt)
+            if quote is not None:
+                quotes.append(quote)
+    return ticks, current_ts
+
+
+def ticks_to_json_line(record):
+    """
+    Serializes a (ticks, current_ts) record into one line of the daily history file.
+
+    The layout matches the MessageToDict output the file has always contained,
+    so existing readers keep working.
+    """
+    ticks, current_ts = record
+    feeds = {}
+    for tick in ticks:
+        feeds[tick.instrument_key] = {'ltpc': tick.to_wire(), 'ticker': tick.ticker}
+    data = {'type': 'live_feed', 'feeds': feeds}
+    if current_ts is not None:
+        data['currentTs'] = str(current_ts)
+    return json.dumps(data)
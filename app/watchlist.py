@@ -0,0 +1,121 @@
+import threading
+import time
+
+from .metrics import METRICS
+
+
+class WatchlistStream:
+    """
+    Periodic summaries of many instruments per client, for watchlists and heatmaps.
+
+    A client sets its watchlist (any number of symbols, on top of the one chart it may
+    be viewing) and gets a `watchlist_summary` event with the rows of every symbol at
+    once, then every `interval` seconds one with the rows of the symbols that traded
+    since. Rows come from LastValueCache.watch_summary:
+
+        [securityId, ltp, changePct, volume, bigBuyVolume, bigSellVolume, imbalance, ltt]
+
+    Each changed symbol's row is computed once per interval however many clients
+    watch it; the per-client work is only picking rows out of that result.
+
+    Args:
+        socketio: The Flask-SocketIO server.
+        namespace (str): Namespace the summaries are emitted on.
+        last_values (LastValueCache): Source of the summaries.
+        interval (float): Seconds between updates.
+    """
+    def __init__(self, socketio, namespace, last_values, interval=1.0):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.last_values = last_values
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watchlists = {}
+        self._watchers = {}
+        self._changed = set()
+        self._task = None
+        METRICS.gauge('watchlist_clients', lambda: len(self._watchlists))
+        METRICS.gauge('watchlist_symbols', lambda: len(self._watchers))
+
+    def set_watchlist(self, sid, symbols):
+        """Replaces a client's watchlist; an empty one stops its updates."""
+        with self._lock:
+            self._unwatch(sid)
+            if symbols:
+                self._watchlists[sid] = tuple(symbols)
+                for symbol in symbols:
+                    self._watchers.setdefault(symbol, set()).add(sid)
+            if self._task is None and self._watchlists:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def remove(self, sid):
+        with self._lock:
+            self._unwatch(sid)
+
+    def mark(self, security_id):
+        """Notes that a watched instrument traded; called for every live tick."""
+        if security_id in self._watchers:
+            with self._lock:
+                self._changed.add(security_id)
+
+    def send_full(self, sid):
+        """Sends a client the rows of its whole watchlist (symbols without ticks are left out)."""
+        with self._lock:
+            symbols = self._watchlists.get(sid, ())
+        try:
+            self.last_values.preload(symbols)
+        except Exception as e:
+            print(f"Error loading watchlist history: {e}")
+        rows = []
+        for symbol in symbols:
+            try:
+                row = self.last_values.watch_summary(symbol)
+            except Exception as e:
+                print(f"Error summarizing {symbol} for the watchlist: {e}")
+                continue
+            if row is not None:
+                rows.append(row)
+        self.socketio.emit('watchlist_summary', {'full': True, 'summaries': rows}, room=sid, namespace=self.namespace)
+
+    def flush(self):
+        """Summarizes the instruments that traded since the last flush and sends each watcher its rows."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            recipients = {}
+            for symbol in changed:
+                for sid in self._watchers.get(symbol, ()):
+                    recipients.setdefault(sid, []).append(symbol)
+        if not recipients:
+            return
+        start = time.perf_counter()
+        self.last_values.preload(changed)
+        rows = {}
+        for symbol in changed:
+            row = self.last_values.watch_summary(symbol)
+            if row is not None:
+                rows[symbol] = row
+        for sid, symbols in recipients.items():
+            summaries = [rows[symbol] for symbol in symbols if symbol in rows]
+            if summaries:
+                self.socketio.emit('watchlist_summary', {'full': False, 'summaries': summaries},
+                                   room=sid, namespace=self.namespace)
+        METRICS.observe('watchlist_flush', time.perf_counter() - start)
+
+    def _unwatch(self, sid):
+        """Drops a client's watchlist. Call with the lock held."""
+        for symbol in self._watchlists.pop(sid, ()):
+            watchers = self._watchers.get(symbol)
+            if watchers is not None:
+                watchers.discard(sid)
+                if not watchers:
+                    del self._watchers[symbol]
+
+    def _run(self):
+        """Background task: sends the changed summaries every `interval` seconds."""
+        while True:
+            started = time.monotonic()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error sending watchlist summaries: {e}")
+            self.socketio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,109 @@
+"""
+Binary wire format for tick events on the /bubble namespace.
+
+Clients that connect with `auth={'wire': 'binary'}` receive `live_ticks` and
+`historical_chunk` events with a `block` (a Socket.IO binary attachment) instead of
+a `ticks` list of JSON objects with string-encoded numbers. A block is columnar,
+little-endian and laid out so every column can be viewed as a typed array in place:
+
+    header   16 bytes   uint8 version, uint8 flags, uint16 reserved, uint32 count,
+                        float64 base ltt (epoch ms)
+    ltp      float64[count]
+    cp       float64[count]
+    ltt      int32[count] deltas from the previous tick (the first from the base)
+             when FLAG_LTT_DELTA is set, otherwise float64[count] absolute values
+    ltq      int32[count]
+
+The decoder in BubbleChart.html (decodeTickBlock) mirrors `decode_tick_block`.
+Binary clients also accept `ticks`, which they are sent for batches of fewer than
+BINARY_MIN_TICKS ticks: a one-tick block plus its attachment framing is larger
+than the same tick as JSON.
+"""
+import struct
+
+import numpy as np
+
+WIRE_JSON = "json"
+WIRE_BINARY = "binary"
+WIRE_FORMATS = (WIRE_JSON, WIRE_BINARY)
+
+WIRE_VERSION = 1
+HEADER = struct.Struct('<BBHId')
+FLAG_LTT_DELTA = 1
+BINARY_MIN_TICKS = 2
+
+_INT32_MIN, _INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def encode_tick_block(ltt, ltp, ltq, cp):
+    """
+    Packs tick columns (sequences or NumPy arrays of equal length) into one block.
+
+    Returns:
+        bytes: The encoded block.
+    """
+    ltt = np.asarray(ltt, dtype='<i8')
+    count = len(ltt)
+    base = int(ltt[0]) if count else 0
+    flags = 0
+    if count:
+        deltas = np.diff(ltt, prepend=base)
+        if deltas.min() >= _INT32_MIN and deltas.max() <= _INT32_MAX:
+            flags = FLAG_LTT_DELTA
+            ltt_bytes = deltas.astype('<i4').tobytes()
+        else:
+            ltt_bytes = ltt.astype('<f8').tobytes()
+    else:
+        ltt_bytes = b''
+    return b''.join((
+        HEADER.pack(WIRE_VERSION, flags, 0, count, float(base)),
+        np.asarray(ltp, dtype='<f8').tobytes(),
+        np.asarray(cp, dtype='<f8').tobytes(),
+        ltt_bytes,
+        np.asarray(ltq, dtype='<i4').tobytes(),
+    ))
+
+
+def encode_columns(columns, start=0, stop=None):
+    """Encodes the slice [start:stop] of a TickColumns without copying it into Python objects."""
+    stop = len(columns) if stop is None else min(stop, len(columns))
+    start = min(start, stop)
+    return encode_tick_block(
+        np.frombuffer(columns.ltt, dtype=np.int64)[start:stop],
+        np.frombuffer(columns.ltp, dtype=np.float64)[start:stop],
+        np.frombuffer(columns.ltq, dtype=np.int32)[start:stop],
+        np.frombuffer(columns.cp, dtype=np.float64)[start:stop],
+    )
+
+
+def encode_ticks(ticks):
+    """Encodes a list of Tick records."""
+    return encode_tick_block(
+        [tick.ltt for tick in ticks], [tick.ltp for tick in ticks],
+        [tick.ltq for tick in ticks], [tick.cp for tick in ticks],
+    )
+
+
+def decode_tick_block(data):
+    """
+    Decodes a block back into NumPy columns.
+
+    Returns:
+        dict: ltt (int64), ltp (float64), ltq (int32) and cp (float64) arrays.
+    """
+    version, flags, _, count, base = HEADER.unpack_from(data)
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported tick block version {version}.")
+    offset = HEADER.size
+    ltp = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+    offset += 8 * count
+    cp = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+    offset += 8 * count
+    if flags & FLAG_LTT_DELTA:
+        ltt = int(base) + np.cumsum(np.frombuffer(data, dtype='<i4', count=count, offset=offset), dtype=np.int64)
+        offset += 4 * count
+    else:
+        ltt = np.frombuffer(data, dtype='<f8', count=count, offset=offset).astype(np.int64)
+        offset += 8 * count
+    ltq = np.frombuffer(data, dtype='<i4', count=count, offset=offset)
+    return {'ltt': ltt, 'ltp': ltp, 'ltq': ltq, 'cp': cp}
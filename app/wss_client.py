@@ -1,8 +1,6 @@
 import os
 import json
-import pandas as pd
 import upstox_client
-from google.protobuf.json_format import MessageToDict
 import threading
 from flask_socketio import SocketIO, join_room, leave_room
 import configparser
@@ -12,38 +10,141 @@ import rel
 import time
 import json
 import upstox_client
-from datetime import datetime
 
-UpstoxWSS_JSONFilename = 'UpstoxWSS_' + datetime.now().strftime('%d_%m_%y') + '.txt'
-FILEPATH = 'static/'+UpstoxWSS_JSONFilename
+from .tick_writer import TickWriter, JsonlSink, FSYNC_INTERVAL
+from .tick_journal import TickJournal
+from .quote_journal import QuoteJournal
+from .ticks import ticks_to_json_line
+from .feed_shards import ShardedFeed, UPSTOX_FEED_URL
+from .reconnect import RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, ReconnectSupervisor
+from .subscription_manager import SUBSCRIPTION_TTL, SubscriptionManager
+from .instruments import get_instrument_master
+from .metrics import METRICS
+from .tick_validation import TickValidator
+from .partitions import HISTORY_DIR, DailySink, HistoryCompactor, day_base_path, day_jsonl_path, day_of
 
-# Connection states
-DISCONNECTED = "DISCONNECTED"
-CONNECTING = "CONNECTING"
-CONNECTED = "CONNECTED"
+# History formats
+HISTORY_FORMAT_JOURNAL = "journal"   # Fixed-width binary journal with a per-instrument index
+HISTORY_FORMAT_JSONL = "jsonl"       # Legacy line-delimited JSON day file
+HISTORY_FORMAT = HISTORY_FORMAT_JOURNAL
+
+# History writer settings
+TICK_WRITER_QUEUE_SIZE = 10000     # Records buffered before new ticks are dropped
+TICK_WRITER_BATCH_SIZE = 500       # Records per group commit
+TICK_WRITER_FLUSH_INTERVAL = 0.2   # Seconds before a partial batch is committed
+TICK_WRITER_FSYNC_POLICY = FSYNC_INTERVAL
+
+# Market data feed settings
+FEED_URL = UPSTOX_FEED_URL    # Point at app.fake_feed_server (e.g. "ws://127.0.0.1:8765") for local testing
+FEED_SHARDS = 1               # Connections the subscribed instruments are spread across
+MAX_KEYS_PER_SHARD = 5000     # Instruments subscribed on one connection at most
+
+# Subscription modes
+MODE_LTPC = "ltpc"                      # Last trade only
+MODE_FULL = "full"                      # Plus 5-level depth, OI, ATP, volume
+MODE_OPTION_GREEKS = "option_greeks"    # Plus first level depth, OI, IV and greeks
+BASE_MODE = MODE_LTPC                   # Instruments nobody is viewing
+VIEWED_MODE = MODE_FULL                 # Instruments with at least one viewer
+VIEWED_OPTION_MODE = MODE_OPTION_GREEKS # Option contracts with at least one viewer
+OPTION_TYPES = ('CE', 'PE')
+
+# Subscription policy: pinned + viewed + recent BBSCAN hits, capped
+PINNED_INSTRUMENTS = []                              # Instrument keys that are always subscribed
+MAX_SUBSCRIPTIONS = FEED_SHARDS * MAX_KEYS_PER_SHARD # Instruments subscribed at most
+SUBSCRIPTION_REVIEW_INTERVAL = 30.0                  # Seconds between TTL checks and rate reports
 
 class WSSClient:
     """
     Handles the WebSocket connection to Upstox for live market data.
     It manages subscriptions, handles incoming ticks, and saves data to a file.
+
+    The connection itself is a ShardedFeed: with FEED_SHARDS > 1 the subscribed
+    instruments are spread across that many connections, each decoding on its own
+    worker, and their ticks are merged back into the single handler below.
+
+    Each instrument is subscribed in the cheapest mode that serves it: BASE_MODE
+    while nobody views it, VIEWED_MODE (VIEWED_OPTION_MODE for options) while at
+    least one chart does. BubbleChartLogic reports viewer counts through
+    `update_viewers`. Quotes (depth, OI, greeks) are only decoded and written for
+    instruments in the richer modes.
+
+    Which instruments are subscribed at all is decided by a SubscriptionManager:
+    pinned instruments, instruments with viewers and recent BBSCAN hits, up to
+    MAX_SUBSCRIPTIONS. BBSCAN hits older than SUBSCRIPTION_TTL without viewers are
+    unsubscribed by `run_subscription_review`.
     """
     def __init__(self, socketio, bubble_chart):
         self.socketio = socketio
         self.bubble_chart = bubble_chart
-        self.upstox_streamer = None
         self.subscribed_instrument_keys = set()
-        self.connection_state = DISCONNECTED
-        self.connection_lock = threading.Lock()
         self.access_token = None
+        self.instruments = None
+        self.viewer_counts = {}
+        self.modes_lock = threading.Lock()
+        self.subscriptions = SubscriptionManager(
+            self._apply_subscriptions,
+            ttl=SUBSCRIPTION_TTL,
+            cap=MAX_SUBSCRIPTIONS,
+            pinned=PINNED_INSTRUMENTS,
+        )
 
-        # Define file paths relative to the project root
+        # History is written to one set of files per day (see app/partitions.py),
+        # relative to the project root.
         self.project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.history_file_path = os.path.join(self.project_root, FILEPATH)
+        self.history_dir = os.path.join(self.project_root, HISTORY_DIR)
+        # Closed days are compacted in the background; a rollover starts a pass at once.
+        self.compactor = HistoryCompactor(self.history_dir, is_open=self._is_day_open, keep_sources_from=day_of())
+
+        # Ticks are persisted by a background writer so the receive path only enqueues.
+        if HISTORY_FORMAT == HISTORY_FORMAT_JOURNAL:
+            make_sink = lambda day: TickJournal(day_base_path(self.history_dir, day))
+        else:
+            make_sink = lambda day: JsonlSink(day_jsonl_path(self.history_dir, day), serializer=ticks_to_json_line)
+        self.tick_sink = DailySink(make_sink, on_rollover=self.compactor.wake)
+        self.tick_writer = TickWriter(
+            self.tick_sink,
+            max_queue_size=TICK_WRITER_QUEUE_SIZE,
+            batch_size=TICK_WRITER_BATCH_SIZE,
+            flush_interval=TICK_WRITER_FLUSH_INTERVAL,
+            fsync_policy=TICK_WRITER_FSYNC_POLICY,
+        )
+        # Quotes from full/option_greeks subscriptions go to their own journal.
+        self.quote_sink = DailySink(lambda day: QuoteJournal(day_base_path(self.history_dir, day)))
+        self.quote_writer = TickWriter(
+            self.quote_sink,
+            max_queue_size=TICK_WRITER_QUEUE_SIZE,
+            batch_size=TICK_WRITER_BATCH_SIZE,
+            flush_interval=TICK_WRITER_FLUSH_INTERVAL,
+            fsync_policy=TICK_WRITER_FSYNC_POLICY,
+            name='quote_writer',
+        )
+
+        # Every decoded batch is validated before it is written or broadcast.
+        self.validator = TickValidator()
 
         # Initialize and cache the instrument-to-symbol mapping
         self.instrument_map = self._initialize_instrument_map()
         self.symbol_to_key_map = {value: key for key, value in self.instrument_map.items()}
 
+        self.feed = ShardedFeed(
+            self.on_ticks,
+            self.instrument_map,
+            n_shards=FEED_SHARDS,
+            max_keys_per_shard=MAX_KEYS_PER_SHARD,
+            feed_url=FEED_URL,
+            on_status=self._emit_status,
+            on_gap=self.on_feed_gap,
+            supervisor=ReconnectSupervisor(RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY),
+        )
+        self.compactor.start()
+        # Pinned instruments are queued now and sent when the feed connects.
+        self.subscriptions.reconcile()
+        METRICS.gauge('subscribed_instruments', lambda: len(self.subscriptions.subscribed))
+
+    def _is_day_open(self, day):
+        """True while either history writer may still append to that day's files."""
+        return day in self.tick_sink.open_days() or day in self.quote_sink.open_days()
+
     def _initialize_instrument_map(self):
         """
         Creates and returns a mapping from instrument_key to tradingsymbol.
@@ -54,8 +155,8 @@ class WSSClient:
 
         print(f"Creating instrument map from: {instruments_file_path}")
         try:
-            df = pd.read_csv(instruments_file_path)
-            return pd.Series(df.tradingsymbol.values, index=df.instrument_key).to_dict()
+            self.instruments = get_instrument_master(instruments_file_path)
+            return self.instruments.key_to_symbol_map()
         except FileNotFoundError:
             print(f"ERROR: The file {instruments_file_path} was not found.")
             return {}
@@ -66,138 +167,175 @@ class WSSClient:
     def start_websocket_connection(self, access_token):
         """
         Initializes and starts the connection to the Upstox WebSocket API.
-        This is the single entry point for managing the connection lifecycle.
+        This is the single entry point for managing the connection lifecycle;
+        shards that are already connected or connecting are left alone.
         """
-        with self.connection_lock:
-            if self.connection_state in [CONNECTED, CONNECTING]:
-                print(f"WebSocket connection attempt ignored. State: {self.connection_state}")
-                return
+        if not access_token:
+            self._emit_status('Upstox Access Token not available.')
+            return
+        self.access_token = access_token
+        print(f"Connecting to market data feed with {len(self.feed.shards)} connection(s)...")
+        self.feed.connect(access_token)
 
-            self.connection_state = CONNECTING
-            self.access_token = access_token
+    def disconnect(self):
+        """
+        Disconnects every feed connection without reconnecting.
+        """
+        print("Disconnecting from Upstox WebSocket...")
+        self.feed.disconnect()
 
-        if not self.access_token:
-            self.socketio.emit('backend_status', {'message': 'Upstox Access Token not available.'})
-            self.connection_state = DISCONNECTED
-            return
+    def shutdown(self):
+        """
+        Disconnects from Upstox and flushes any ticks still waiting to be written.
+        """
+        self.feed.close()
+        self.compactor.stop()
+        print(f"Feed stopped: {self.feed.stats}, shards: {self.feed.shard_stats()}")
+        self.tick_writer.close()
+        print(f"Tick writer closed: {self.tick_writer.stats()}")
+        self.quote_writer.close()
+        print(f"Quote writer closed: {self.quote_writer.stats()}")
+        print(f"Tick validation: {dict(self.validator.stats)}")
 
-        print("Configuring Upstox API client...")
-        config = upstox_client.Configuration()
-        config.access_token = self.access_token
-        api_client = upstox_client.ApiClient(config)
+    def on_ticks(self, ticks, current_ts, quotes=()):
+        """
+        Handler for decoded ticks from every feed connection, called on one thread.
+        Ticks are validated first (see TickValidator); the surviving Tick records feed
+        both the history writer and the live broadcast. Quotes of instruments in
+        full/option_greeks mode are written and sent alongside.
+        """
+        start = time.perf_counter()
+        ticks = self.validator.validate(ticks, current_ts)
+        METRICS.observe('validate', time.perf_counter() - start)
+        if not ticks and not quotes:
+            return
+        METRICS.count_ticks(ticks)
+        if ticks:
+            self._append_tick_to_file(ticks, current_ts)
+        if quotes:
+            self.quote_writer.enqueue((quotes, current_ts))
+        appended = time.perf_counter()
+        METRICS.observe('append_to_file', appended - start)
+        if ticks:
+            self.bubble_chart.broadcast_live_tick(ticks, current_ts)
+        if quotes:
+            self.bubble_chart.broadcast_quotes(quotes)
+        METRICS.observe('on_ticks', time.perf_counter() - start)
 
-        self.upstox_streamer = upstox_client.MarketDataStreamerV3(api_client)
-        self.upstox_streamer.on("open", self.on_open)
-        self.upstox_streamer.on("message", self.on_message)
-        self.upstox_streamer.on("close", self.on_close)
-        self.upstox_streamer.on("error", self.on_error)
+    def mode_for(self, instrument_key):
+        """Returns the subscription mode an instrument should have right now."""
+        if not self.viewer_counts.get(instrument_key):
+            return BASE_MODE
+        instrument = self.instruments.by_key(instrument_key) if self.instruments is not None else None
+        if instrument is not None and instrument.option_type in OPTION_TYPES:
+            return VIEWED_OPTION_MODE
+        return VIEWED_MODE
 
-        try:
-            print("Connecting to Upstox WebSocket...")
-            self.upstox_streamer.connect()
-        except Exception as e:
-            print(f"Error connecting to Upstox WebSocket: {e}")
-            self.socketio.emit('backend_status', {'message': f'Error connecting to Upstox: {e}.'})
-            self.connection_state = DISCONNECTED
+    def update_viewers(self, instrument_key, viewer_count):
+        """
+        Records how many charts view an instrument and upgrades or downgrades its
+        subscription mode when that crosses zero.
+        """
+        with self.modes_lock:
+            if viewer_count > 0:
+                self.viewer_counts[instrument_key] = viewer_count
+            else:
+                self.viewer_counts.pop(instrument_key, None)
+        # A viewed instrument is subscribed even if no scan asked for it; one that
+        # lost its last viewer may drop out if its BBSCAN hit has expired.
+        self.subscriptions.set_viewed(instrument_key, viewer_count > 0)
+        self.subscriptions.reconcile()
+        with self.modes_lock:
+            current = self.feed.mode_of(instrument_key)
+            wanted = self.mode_for(instrument_key)
+            if current is None or current == wanted:
+                return
+            print(f"Switching {instrument_key} from {current} to {wanted} mode ({viewer_count} viewers).")
+            self.feed.change_mode([instrument_key], wanted)
 
-    def disconnect(self):
+    def on_feed_gap(self, shard_id, instrument_keys, last_ts, first_ts):
+        """
+        Handler for a reconnect that lost data: ticks of these instruments between
+        last_ts and first_ts (epoch ms) were never received.
         """
-        Disconnects the WebSocket client and resets the state.
-        """
-        with self.connection_lock:
-            if self.upstox_streamer and self.connection_state != DISCONNECTED:
-                print("Disconnecting from Upstox WebSocket...")
-                self.upstox_streamer.disconnect()
-            self.connection_state = DISCONNECTED
-            self.upstox_streamer = None
-
-    def on_open(self):
-        """Handler for when the WebSocket connection is opened."""
-        with self.connection_lock:
-            self.connection_state = CONNECTED
-        self.socketio.emit('backend_status', {'message': 'Connected to Upstox market data.'})
-        if self.subscribed_instrument_keys:
-            print(f"Resubscribing to {len(self.subscribed_instrument_keys)} instruments on connection open.")
-            self.upstox_streamer.subscribe(list(self.subscribed_instrument_keys), "ltpc")
-
-    def on_message(self, message):
-        """Handler for incoming messages (ticks) from the WebSocket."""
-        messageWithTickerNAme = self._append_tick_to_file(message)
-        if(messageWithTickerNAme):
-            self.bubble_chart.broadcast_live_tick(messageWithTickerNAme)
-
-    def on_close(self, code, reason):
-        """Handler for when the WebSocket connection is closed."""
-        self.socketio.emit('backend_status', {'message': 'Disconnected from Upstox market data.'})
-        print(f"Upstox WebSocket connection closed: {code} - {reason}")
-        self.disconnect()
-        self.reconnect()
-
-    def on_error(self, error):
-        """Handler for any WebSocket errors."""
-        print(f"Upstox WebSocket error: {error}")
-        self.socketio.emit('backend_status', {'message': f'WebSocket Error: {error}'})
-        self.disconnect()
-        self.reconnect()
-
-    def reconnect(self):
-        """
-        Initiates a reconnection attempt after a delay.
-        """
-        with self.connection_lock:
-            if self.connection_state == DISCONNECTED:
-                print("Attempting to reconnect...")
-                time.sleep(5)  # Wait for 5 seconds before reconnecting
-                self.start_websocket_connection(self.access_token)
+        gap_seconds = (first_ts - last_ts) / 1000.0
+        print(f"Market data gap of {gap_seconds:.1f}s on connection {shard_id} ({len(instrument_keys)} instruments).")
+        self._emit_status(f'Market data resumed after a {gap_seconds:.1f}s gap.')
+
+    def _emit_status(self, message):
+        # Called on feed threads; the fan-out emits it from the server's context.
+        self.bubble_chart.fanout.add_event('backend_status', {'message': message}, namespace='/')
 
     def subscribe(self, instrument_keys: list):
-        """Subscribes to a list of new instrument keys."""
-        
+        """
+        Records BBSCAN hits (trading symbols or instrument keys) and subscribes
+        the ones that are not subscribed yet.
+        """
         # Use the key itself as the default value GETTING INVERSE OF SYMBOLS INTO KEYS FOR UPSTOX TO UNDERSTAND 
-        symbols_list = [self.symbol_to_key_map.get(key, key) for key in instrument_keys]
-        instrument_keys=symbols_list
-        print(" instrument_keys ===> "+instrument_keys)
+        instrument_keys = [self.symbol_to_key_map.get(key, key) for key in instrument_keys]
+        self.subscriptions.note_scanned(instrument_keys)
+        self.subscriptions.reconcile()
 
-        new_keys_to_subscribe = list(set(instrument_keys) - self.subscribed_instrument_keys)
+    def pin(self, instrument_keys):
+        """Keeps instruments subscribed regardless of viewers and BBSCAN hits."""
+        self.subscriptions.pin(instrument_keys)
+        self.subscriptions.reconcile()
 
-        if not new_keys_to_subscribe:
-            print("No new instruments to subscribe.")
-            return
+    def unpin(self, instrument_keys):
+        self.subscriptions.unpin(instrument_keys)
+        self.subscriptions.reconcile()
 
-        self.subscribed_instrument_keys.update(new_keys_to_subscribe)
-        print(f"Requesting subscription for new instruments: {new_keys_to_subscribe}")
+    def _apply_subscriptions(self, added, removed):
+        """Sends the subscription changes decided by the SubscriptionManager to the feed."""
+        if removed:
+            print(f"Unsubscribing {len(removed)} instruments nobody is watching: {removed}")
+            self.feed.unsubscribe(removed)
+            self.subscribed_instrument_keys.difference_update(removed)
+        if added:
+            print(f"Requesting subscription for new instruments: {added}")
+            self.subscribed_instrument_keys.update(added)
+            # Each key is pinned to one shard; shards that are not connected yet subscribe it on open.
+            with self.modes_lock:
+                by_mode = {}
+                for key in added:
+                    by_mode.setdefault(self.mode_for(key), []).append(key)
+                for mode, keys in by_mode.items():
+                    self.feed.subscribe(keys, mode)
 
-        if self.upstox_streamer and self.is_connected():
+    def run_subscription_review(self):
+        """
+        Background loop: expires old BBSCAN hits and reports the subscription
+        count and the feed's message rate every SUBSCRIPTION_REVIEW_INTERVAL seconds.
+        """
+        last_time = time.monotonic()
+        last_messages = self.feed.stats['messages']
+        last_ticks = sum(shard.stats['ticks'] for shard in self.feed.shards)
+        while True:
+            time.sleep(SUBSCRIPTION_REVIEW_INTERVAL)
             try:
-                self.upstox_streamer.subscribe(new_keys_to_subscribe, "ltpc")
-                print(f"Successfully sent subscription request for {len(new_keys_to_subscribe)} instruments.")
+                self.subscriptions.reconcile()
+                now = time.monotonic()
+                messages = self.feed.stats['messages']
+                ticks = sum(shard.stats['ticks'] for shard in self.feed.shards)
+                elapsed = max(now - last_time, 1e-9)
+                summary = self.subscriptions.summary()
+                summary['messagesPerSec'] = round((messages - last_messages) / elapsed, 1)
+                summary['ticksPerSec'] = round((ticks - last_ticks) / elapsed, 1)
+                last_time, last_messages, last_ticks = now, messages, ticks
+                print(f"Subscriptions: {summary['subscribed']} instruments ({summary['pinned']} pinned, "
+                      f"{summary['viewed']} viewed, {summary['scanned']} recently scanned), "
+                      f"{summary['messagesPerSec']} messages/s, {summary['ticksPerSec']} ticks/s.")
+                self.bubble_chart.fanout.add_event('subscription_stats', summary)
             except Exception as e:
-                print(f"Failed to subscribe to instruments: {e}. They will be subscribed on (re)connect.")
-        else:
-            print("Streamer not connected. Keys will be subscribed automatically upon connection.")
+                print(f"Error reviewing subscriptions: {e}")
 
-    def _append_tick_to_file(self, tick_data):
+    def _append_tick_to_file(self, ticks, current_ts=None):
         """
-        Appends a processed tick to the history file.
+        Queues decoded ticks for the background history writer, which serializes them.
         """
-        try:
-            data_to_dump = MessageToDict(tick_data)
-    
-            # Add the 'ticker' symbol to each feed for easier identification
-            if 'feeds' in data_to_dump:
-                for key, feed_data in data_to_dump['feeds'].items():
-                    feed_data['ticker'] = self.instrument_map.get(key, 'UNKNOWN')
-
-                with open(self.history_file_path, 'a') as f:
-                    json.dump(data_to_dump, f)
-                    f.write('\n')
-            
-                return json.dumps(data_to_dump)
-            
-        except Exception as e:
-            print(f"Error writing tick to file: {e}")
+        self.tick_writer.enqueue((ticks, current_ts))
 
     def is_connected(self):
-        """Returns the custom connection status flag."""
-        return self.connection_state == CONNECTED
+        """True if at least one feed connection is open."""
+        return self.feed.is_connected()
     
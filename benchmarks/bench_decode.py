@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for the per-message decode cost on the live receive path.
+
+Compares the old path (MessageToDict, ticker annotation and two json.dumps calls
+per message) with the single decode into Tick records.
+
+Usage:
+    python -m benchmarks.bench_decode [static/UpstoxWSS_<date>.txt] [--limit N]
+"""
+import argparse
+import json
+import time
+
+from google.protobuf.json_format import MessageToDict, ParseDict
+from upstox_client.feeder.proto import MarketDataFeedV3_pb2
+
+from app.ticks import decode_feed_response, ticks_to_json_line
+from benchmarks.common import load_recorded_feed, synthetic_feed
+
+
+def old_receive_path(message, instrument_map):
+    """The previous `_append_tick_to_file` work, minus the file write."""
+    data_to_dump = MessageToDict(message)
+    if 'feeds' in data_to_dump:
+        for key, feed_data in data_to_dump['feeds'].items():
+            feed_data['ticker'] = instrument_map.get(key, 'UNKNOWN')
+        json.dumps(data_to_dump)
+        return json.dumps(data_to_dump)
+
+
+def new_receive_path(message, instrument_map):
+    return decode_feed_response(message, instrument_map)
+
+
+def time_per_message(func, messages, instrument_map, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            func(message, instrument_map)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', help="Recorded day file. A synthetic feed is used if omitted.")
+    parser.add_argument('--limit', type=int, default=5000, help="Maximum number of messages to use.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing repetitions; the best run is reported.")
+    args = parser.parse_args()
+
+    if args.feed_file:
+        recorded = load_recorded_feed(args.feed_file, args.limit)
+        source = args.feed_file
+    else:
+        recorded = synthetic_feed(args.limit)
+        source = "synthetic feed"
+
+    # Rebuild the protobuf frames the streamer would have received.
+    messages = [ParseDict(m, MarketDataFeedV3_pb2.FeedResponse(), ignore_unknown_fields=True) for m in recorded]
+    instrument_map = {key: key.split('|')[-1] for m in recorded for key in m.get('feeds', {})}
+    feeds = sum(len(m.feeds) for m in messages)
+    print(f"{len(messages)} messages / {feeds} feeds from {source}")
+
+    old_us = time_per_message(old_receive_path, messages, instrument_map, args.repeat)
+    new_us = time_per_message(new_receive_path, messages, instrument_map, args.repeat)
+    decoded = [decode_feed_response(m, instrument_map) for m in messages]
+    start = time.perf_counter()
+    for record in decoded:
+        ticks_to_json_line(record)
+    serialize_us = (time.perf_counter() - start) / len(decoded) * 1e6
+
+    print(f"before: {old_us:8.1f} us/message on the receive thread (MessageToDict + 2x json.dumps)")
+    print(f"after:  {new_us:8.1f} us/message on the receive thread (single decode to Tick records)")
+    print(f"        {serialize_us:8.1f} us/message serialized later on the writer thread")
+    print(f"speedup: {old_us / new_us:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
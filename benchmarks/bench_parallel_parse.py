@@ -0,0 +1,66 @@
+"""
+Benchmarks JSONL history loading time against the number of parser processes.
+
+Writes a synthetic day-sized `UpstoxWSS_<date>.txt` file (or uses the one given)
+and times `parse_jsonl_parallel` with 1, 2, 4, ... workers up to the core count.
+
+Usage:
+    python -m benchmarks.bench_parallel_parse [static/UpstoxWSS_<date>.txt] [--messages N] [--max-workers N]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app.history_store import parse_jsonl_parallel
+from benchmarks.common import synthetic_feed
+
+
+def write_synthetic_day(path, n_messages, n_instruments):
+    """Writes the synthetic feed in batches so the generator never holds a whole day in memory."""
+    batch = 10000
+    with open(path, 'w') as f:
+        for start in range(0, n_messages, batch):
+            messages = synthetic_feed(min(batch, n_messages - start), n_instruments,
+                                      start_ms=1759895100000 + start * 200, seed=start)
+            f.write(''.join(json.dumps(m) + '\n' for m in messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', help="Day file to parse. A synthetic one is written if omitted.")
+    parser.add_argument('--messages', type=int, default=110000,
+                        help="Messages in the synthetic file (about one trading day at 5 msg/s).")
+    parser.add_argument('--instruments', type=int, default=40)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    tmpdir = None
+    path = args.feed_file
+    if path is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'UpstoxWSS_synthetic.txt')
+        print(f"Writing synthetic day file ({args.messages} messages)...")
+        write_synthetic_day(path, args.messages, args.instruments)
+
+    size = os.path.getsize(path)
+    print(f"{path}: {size / 1e6:.0f} MB, {os.cpu_count()} cores")
+
+    workers = 1
+    baseline = None
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        parsed = parse_jsonl_parallel(path, workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        ticks = sum(len(columns) for columns in parsed.values())
+        print(f"workers={workers:3d}  {elapsed:7.2f}s  {ticks / elapsed / 1e6:6.2f} M ticks/s  speedup {baseline / elapsed:4.1f}x")
+        workers *= 2
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+End-to-end benchmark of the live pipeline: replayed feed -> WSSClient.on_ticks ->
+journal + BubbleChartLogic -> Socket.IO fan-out -> a swarm of headless clients.
+
+A throwaway server is started per run with its journal in a temporary directory.
+It uses the same Flask-SocketIO async mode the app picks (eventlet when it is
+installed) unless --async-mode says otherwise, e.g. `threading` to compare. The ReplayEngine restamps every tick with the
+wall clock when it is injected, and every client records how long each tick took
+to reach it, giving tick-to-client latency percentiles and delivered throughput.
+The server's own log lines go to a file in the temporary directory (--verbose
+prints them).
+
+Usage:
+    python -m benchmarks.bench_pipeline [static/UpstoxWSS_<date>.txt]
+        [--viewers 1 10 100] [--speed 0] [--messages 3000] [--symbols 4]
+        [--async-mode eventlet|threading]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import socketio as socketio_client
+from flask import Flask
+from flask_socketio import SocketIO
+
+from app import bubble_chart_logic, wss_client
+from app.replay import ReplayEngine, read_day_file, synthetic_messages
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, async_mode=None):
+    """
+    Builds the Socket.IO side of the app and the tick pipeline, and serves it on a
+    free port. `async_mode` None lets Flask-SocketIO choose, as app/__init__.py does.
+    """
+    bubble_chart_logic.HISTORY_DIR = wss_client.HISTORY_DIR = workdir
+    wss_client.PINNED_INSTRUMENTS = []
+
+    app = Flask(__name__)
+    sio = SocketIO(app, async_mode=async_mode, cors_allowed_origins="*")
+    bubble_chart = bubble_chart_logic.BubbleChartLogic(sio)
+    bubble_chart.register_handlers()
+    client = wss_client.WSSClient(sio, bubble_chart)
+
+    port = free_port()
+    thread = threading.Thread(
+        target=sio.run, args=(app,),
+        kwargs={'port': port, 'allow_unsafe_werkzeug': True, 'log_output': False}, daemon=True)
+    thread.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", client, sio.async_mode
+
+
+class Viewer:
+    """A headless chart: connects, opens one symbol in browser mode and times each live tick."""
+    def __init__(self, url, symbol):
+        self.symbol = symbol
+        self.latencies_ms = []
+        self.frames = 0
+        self.ready = threading.Event()
+        self.sio = socketio_client.Client(reconnection=False)
+        self.sio.on('live_ticks', self._on_live_ticks, namespace='/bubble')
+        self.sio.on('historical_chunk', self._on_history, namespace='/bubble')
+        self.sio.connect(url, namespaces=['/bubble'], transports=['websocket'])
+        self.sio.emit('request_initial_data', {'symbol': symbol}, namespace='/bubble')
+
+    def _on_history(self, msg):
+        if msg.get('final'):
+            self.ready.set()
+
+    def _on_live_ticks(self, msg):
+        now_ms = time.time() * 1000
+        self.frames += 1
+        self.latencies_ms.extend(now_ms - int(tick['ltt']) for tick in msg['ticks'])
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def close_all(viewers):
+    threads = [threading.Thread(target=viewer.close) for viewer in viewers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+
+def run(n_viewers, messages, speed, symbols, verbose=False, async_mode=None):
+    with tempfile.TemporaryDirectory() as workdir:
+        log = open(os.path.join(workdir, 'server.log'), 'w')
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            url, client, async_mode = start_server(workdir, async_mode)
+            viewers = [Viewer(url, symbols[i % len(symbols)]) for i in range(n_viewers)]
+            for viewer in viewers:
+                viewer.ready.wait(10)
+
+            engine = ReplayEngine(messages, client.on_ticks, speed=speed, instrument_map=client.instrument_map,
+                                  restamp=True)
+            stats = engine.run()
+            time.sleep(1.0)  # Let the last fan-out batches arrive.
+
+            latencies = sorted(latency for viewer in viewers for latency in viewer.latencies_ms)
+            frames = sum(viewer.frames for viewer in viewers)
+            close_all(viewers)
+            time.sleep(0.5)  # Let the server log the disconnects before stdout is restored.
+            client.shutdown()
+        log.close()
+
+    print(f"{n_viewers:>4} viewers ({async_mode})  injected {stats['messages']} msgs / {stats['ticks']} ticks in "
+          f"{stats['elapsed']:.2f}s ({stats['ticks'] / max(stats['elapsed'], 1e-9):,.0f} ticks/s)  "
+          f"delivered {len(latencies):,} ticks in {frames:,} frames  latency ms "
+          f"p50 {percentile(latencies, 0.50):.0f}  p90 {percentile(latencies, 0.90):.0f}  "
+          f"p99 {percentile(latencies, 0.99):.0f}  max {latencies[-1] if latencies else float('nan'):.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', help="Recorded day file (default: synthetic feed).")
+    parser.add_argument('--viewers', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--speed', type=float, default=0, help="Replay speed; 0 injects as fast as possible.")
+    parser.add_argument('--messages', type=int, default=3000)
+    parser.add_argument('--symbols', type=int, default=4, help="Distinct symbols the viewers spread over.")
+    parser.add_argument('--async-mode', choices=['eventlet', 'threading'], default=None,
+                        help="Socket.IO async mode of the server (default: the one the app uses).")
+    parser.add_argument('--verbose', action='store_true', help="Print the server's log lines.")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger('werkzeug').setLevel(logging.CRITICAL)
+
+    for n_viewers in args.viewers:
+        if args.feed_file:
+            messages = list(read_day_file(args.feed_file, limit=args.messages))
+        else:
+            messages = list(synthetic_messages(args.messages))
+        counts = {}
+        for message in messages:
+            for key in message.get('feeds', {}):
+                counts[key] = counts.get(key, 0) + 1
+        symbols = sorted(counts, key=counts.get, reverse=True)[:args.symbols]
+        run(n_viewers, messages, args.speed, symbols, args.verbose, args.async_mode)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
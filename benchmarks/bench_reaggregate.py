@@ -0,0 +1,73 @@
+"""
+Benchmarks re-aggregating one instrument's history when the view parameters change.
+
+Compares feeding every tick through BarAggregator.add (what the server and the
+browser did per parameter change) with the vectorized BarAggregator.from_columns,
+and checks both produce the same bars and bubbles.
+
+Usage:
+    python -m benchmarks.bench_reaggregate [static/UpstoxWSS_<date>.txt] [--ticks N]
+"""
+import argparse
+import random
+import time
+
+from app.aggregation import BarAggregator
+from app.history_store import parse_jsonl_parallel
+from app.tick_store import TickColumns
+
+# (candle interval ms, bubble interval ms, big player qty) combinations a user flips between.
+PARAMETER_SETS = [
+    (1000, 1000, 50),
+    (60000, 5000, 50),
+    (60000, 60000, 500),
+    (300000, 10000, 100),
+]
+
+
+def synthetic_columns(n_ticks, seed=7):
+    """One instrument's ticks: a random walk with a few ticks per second."""
+    rng = random.Random(seed)
+    columns = TickColumns()
+    now = 1759895100000
+    price = 1000.0
+    for _ in range(n_ticks):
+        now += rng.randint(20, 400)
+        price = round(max(1.0, price + rng.gauss(0, 0.5)), 2)
+        columns.append(now, price, rng.choice((1, 1, 2, 5, 10, 25, 50, 100, 500)), 1000.0)
+    return columns
+
+
+def time_it(build):
+    start = time.perf_counter()
+    result = build()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', help="Day file; its busiest instrument is used.")
+    parser.add_argument('--ticks', type=int, default=1000000, help="Synthetic ticks when no file is given.")
+    args = parser.parse_args()
+
+    if args.feed_file:
+        parsed = parse_jsonl_parallel(args.feed_file)
+        security_id, columns = max(parsed.items(), key=lambda item: len(item[1]))
+        print(f"{security_id}: {len(columns)} ticks")
+    else:
+        columns = synthetic_columns(args.ticks)
+        print(f"synthetic instrument: {len(columns)} ticks")
+
+    for candle_ms, bubble_ms, big_player_qty in PARAMETER_SETS:
+        looped = BarAggregator(candle_ms, bubble_ms, big_player_qty)
+        _, loop_time = time_it(lambda: looped.add_columns(columns))
+        vectorized, vector_time = time_it(
+            lambda: BarAggregator.from_columns(candle_ms, bubble_ms, big_player_qty, [columns]))
+        same = looped.snapshot() == vectorized.snapshot() and looped.bubbles == vectorized.bubbles
+        print(f"candle={candle_ms:>6}ms bubble={bubble_ms:>6}ms big={big_player_qty:>4}  "
+              f"per-tick {loop_time * 1000:8.1f} ms  vectorized {vector_time * 1000:7.1f} ms  "
+              f"speedup {loop_time / vector_time:5.1f}x  {'match' if same else 'MISMATCH'}")
+
+
+if __name__ == '__main__':
+    main()
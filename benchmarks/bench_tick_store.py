@@ -0,0 +1,72 @@
+"""
+Measures memory per tick for the historical tick cache.
+
+Compares the old cache layout (a list of LTPC dicts with string fields per security)
+with the columnar TickStore.
+
+Usage:
+    python -m benchmarks.bench_tick_store [static/UpstoxWSS_<date>.txt] [--limit N]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from app.tick_store import TickStore
+from benchmarks.common import load_recorded_feed, synthetic_feed
+
+
+def measure(build, lines):
+    gc.collect()
+    tracemalloc.start()
+    store = build(lines)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, current
+
+
+def build_dict_cache(lines):
+    """The previous file_data_cache: a list of parsed LTPC dicts per security."""
+    cache = {}
+    for line in lines:
+        data = json.loads(line)
+        for sec_id, feed_data in data['feeds'].items():
+            if 'ltpc' in feed_data:
+                cache.setdefault(sec_id, []).append(feed_data['ltpc'])
+    return cache
+
+
+def build_tick_store(lines):
+    store = TickStore()
+    for line in lines:
+        data = json.loads(line)
+        for sec_id, feed_data in data['feeds'].items():
+            ltpc = feed_data.get('ltpc')
+            if ltpc:
+                store.append(sec_id, int(ltpc.get('ltt', 0)), float(ltpc.get('ltp', 0.0)),
+                             int(ltpc.get('ltq', 0)), float(ltpc.get('cp', 0.0)))
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', help="Recorded day file. A synthetic feed is used if omitted.")
+    parser.add_argument('--limit', type=int, default=20000, help="Maximum number of messages to load.")
+    args = parser.parse_args()
+
+    messages = load_recorded_feed(args.feed_file, args.limit) if args.feed_file else synthetic_feed(args.limit)
+    lines = [json.dumps(m) for m in messages]
+    ticks = sum(len(m.get('feeds', {})) for m in messages)
+
+    _, dict_bytes = measure(build_dict_cache, lines)
+    store, store_bytes = measure(build_tick_store, lines)
+    usage = store.memory_usage()
+
+    print(f"{ticks} ticks across {usage['securities']} securities")
+    print(f"dict cache:   {dict_bytes / ticks:8.1f} bytes/tick (traced allocations)")
+    print(f"tick store:   {store_bytes / ticks:8.1f} bytes/tick (traced allocations, incl. array over-allocation)")
+    print(f"              {usage['bytes_per_tick']:8.1f} bytes/tick (column payload)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Compares the JSON and binary wire formats of the tick events on /bubble.
+
+For live batches of several sizes and for history chunks it reports:
+
+- bytes per tick of the complete Socket.IO packet(s), as python-socketio encodes them;
+- server-side encode time per tick (TickColumns/Tick records -> packet);
+- browser-side decode time per tick, measured with node (when installed) running
+  the decoder copied out of templates/BubbleChart.html: JSON.parse plus the
+  Number() conversions the chart does, against decodeTickBlock
+  read as typed arrays and as tick objects (blockToTicks).
+
+Formats are compared as-is; in the server, batches smaller than BINARY_MIN_TICKS
+go to binary clients as JSON anyway.
+
+Usage:
+    python -m benchmarks.bench_wire [static/UpstoxWSS_<date>.txt] [--limit N]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from socketio.packet import EVENT, Packet
+
+from app.tick_store import TickColumns
+from app.ticks import decode_feed_response
+from app.wire import encode_columns, encode_ticks
+from benchmarks.common import load_recorded_feed, synthetic_feed
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'BubbleChart.html')
+DECODER_BEGIN = '// BEGIN tick wire decoder'
+DECODER_END = '// END tick wire decoder'
+
+NODE_HARNESS = r"""
+const fs = require('fs');
+const [jsonPath, binPath, repeat] = [process.argv[2], process.argv[3], Number(process.argv[4])];
+const jsonTexts = JSON.parse(fs.readFileSync(jsonPath, 'utf8'));
+const raw = fs.readFileSync(binPath);
+const blocks = [];
+for (let offset = 0; offset < raw.length;) {
+    const size = raw.readUInt32LE(offset);
+    blocks.push(raw.buffer.slice(raw.byteOffset + offset + 4, raw.byteOffset + offset + 4 + size));
+    offset += 4 + size;
+}
+function best(fn) {
+    let fastest = Infinity, sink = 0;
+    for (let r = 0; r < repeat; r++) {
+        const start = process.hrtime.bigint();
+        sink += fn();
+        fastest = Math.min(fastest, Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    return [fastest, sink];
+}
+const results = {
+    json: best(() => {
+        let sum = 0;
+        for (const text of jsonTexts) {
+            for (const tick of JSON.parse(text).ticks) {
+                sum += Number(tick.ltt) + Number(tick.ltp) + Number(tick.ltq);
+            }
+        }
+        return sum;
+    })[0],
+    binaryColumns: best(() => {
+        let sum = 0;
+        for (const block of blocks) {
+            const { count, ltt, ltp, ltq } = decodeTickBlock(block);
+            for (let i = 0; i < count; i++) sum += ltt[i] + ltp[i] + ltq[i];
+        }
+        return sum;
+    })[0],
+    binaryObjects: best(() => {
+        let sum = 0;
+        for (const block of blocks) {
+            for (const tick of blockToTicks(decodeTickBlock(block))) {
+                sum += Number(tick.ltt) + Number(tick.ltp) + Number(tick.ltq);
+            }
+        }
+        return sum;
+    })[0],
+};
+console.log(JSON.stringify(results));
+"""
+
+
+def packet_bytes(event, payload):
+    """Bytes of the Socket.IO packet(s) python-socketio sends for an event on /bubble."""
+    encoded = Packet(EVENT, data=[event, payload], namespace='/bubble').encode()
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(part.encode('utf-8')) if isinstance(part, str) else len(part) for part in parts)
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def extract_decoder():
+    with open(TEMPLATE_PATH, 'r') as f:
+        html = f.read()
+    start, end = html.index(DECODER_BEGIN), html.index(DECODER_END)
+    return html[start:end]
+
+
+def node_decode_times(json_texts, blocks, repeat):
+    """Runs the page's decoder under node; returns ms for the JSON and binary paths, or None."""
+    node = shutil.which('node')
+    if node is None:
+        return None
+    with tempfile.TemporaryDirectory() as workdir:
+        script, json_path, bin_path = (os.path.join(workdir, name) for name in ('bench.js', 'ticks.json', 'ticks.bin'))
+        with open(script, 'w') as f:
+            f.write(extract_decoder() + NODE_HARNESS)
+        with open(json_path, 'w') as f:
+            json.dump(json_texts, f)
+        with open(bin_path, 'wb') as f:
+            for block in blocks:
+                f.write(len(block).to_bytes(4, 'little') + block)
+        output = subprocess.run([node, script, json_path, bin_path, str(repeat)],
+                                capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def compare(label, batches, repeat):
+    """
+    Args:
+        batches (list): TickColumns, each sent as one event.
+    """
+    n_ticks = sum(len(columns) for columns in batches)
+    json_payloads = [{'securityId': 'NSE_EQ|X', 'ticks': columns.to_wire()} for columns in batches]
+    blocks = [encode_columns(columns) for columns in batches]
+    json_bytes = sum(packet_bytes('live_ticks', payload) for payload in json_payloads)
+    binary_bytes = sum(packet_bytes('live_ticks', {'securityId': 'NSE_EQ|X', 'block': block}) for block in blocks)
+
+    json_encode = best_time(lambda: [Packet(EVENT, data=['live_ticks', {'securityId': 'NSE_EQ|X', 'ticks': columns.to_wire()}],
+                                            namespace='/bubble').encode() for columns in batches], repeat)
+    binary_encode = best_time(lambda: [Packet(EVENT, data=['live_ticks', {'securityId': 'NSE_EQ|X', 'block': encode_columns(columns)}],
+                                              namespace='/bubble').encode() for columns in batches], repeat)
+
+    line = (f"{label:<22} bytes/tick json {json_bytes / n_ticks:6.1f}  binary {binary_bytes / n_ticks:6.1f} "
+            f"({binary_bytes / json_bytes:5.1%})   encode us/tick json {json_encode / n_ticks * 1e6:5.2f}  "
+            f"binary {binary_encode / n_ticks * 1e6:5.2f}")
+    decode = node_decode_times([json.dumps(payload, separators=(',', ':')) for payload in json_payloads], blocks, repeat)
+    if decode is not None:
+        line += (f"   browser decode us/tick json {decode['json'] / n_ticks * 1e3:5.3f}  "
+                 f"binary {decode['binaryColumns'] / n_ticks * 1e3:5.3f} (as objects {decode['binaryObjects'] / n_ticks * 1e3:5.3f})")
+    print(line)
+
+
+def split(columns, size):
+    batches = []
+    for start in range(0, len(columns), size):
+        batch = TickColumns()
+        batch.ltt.extend(columns.ltt[start:start + size])
+        batch.ltp.extend(columns.ltp[start:start + size])
+        batch.ltq.extend(columns.ltq[start:start + size])
+        batch.cp.extend(columns.cp[start:start + size])
+        batches.append(batch)
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', help="Recorded day file (default: synthetic feed).")
+    parser.add_argument('--limit', type=int, default=5000, help="Messages to read.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    messages = load_recorded_feed(args.feed_file, args.limit) if args.feed_file else synthetic_feed(args.limit)
+    by_security = {}
+    for message in messages:
+        for tick in decode_feed_response(message, {})[0]:
+            by_security.setdefault(tick.instrument_key, TickColumns()).append(tick.ltt, tick.ltp, tick.ltq, tick.cp)
+    # One instrument's ticks in arrival order, as a room would receive them.
+    columns = max(by_security.values(), key=len)
+    print(f"{len(columns)} ticks of the busiest of {len(by_security)} instruments"
+          f"{'' if shutil.which('node') else ' (node not found: browser decode times skipped)'}")
+
+    for size in (1, 10, 100):
+        compare(f"live batch of {size}", split(columns, size), args.repeat)
+    compare("history chunk of 5000", split(columns, 5000), args.repeat)
+
+    # Live batches are encoded from Tick records rather than columns.
+    ticks = [tick for message in messages[:1000] for tick in decode_feed_response(message, {})[0]]
+    elapsed = best_time(lambda: encode_ticks(ticks), args.repeat)
+    print(f"encode_ticks: {elapsed / len(ticks) * 1e6:.2f} us/tick over {len(ticks)} Tick records")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
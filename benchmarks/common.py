@@ -0,0 +1,60 @@
+import json
+import random
+
+
+def load_recorded_feed(path, limit=None):
+    """
+    Reads messages from a recorded `UpstoxWSS_<date>.txt` day file.
+
+    Args:
+        path (str): Path to the line-delimited JSON day file.
+        limit (int): Optional maximum number of messages to read.
+
+    Returns:
+        list: One MessageToDict-style dict per recorded message.
+    """
+    messages = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+            if limit and len(messages) >= limit:
+                break
+    return messages
+
+
+def synthetic_feed(n_messages, n_instruments=40, start_ms=1759895100000, seed=7):
+    """
+    Generates a feed that looks like the live ltpc stream: every message carries a
+    random subset of the instruments, each with a small random walk in price.
+
+    Returns:
+        list: One MessageToDict-style dict per message.
+    """
+    rng = random.Random(seed)
+    keys = [f"NSE_EQ|INE{i:06d}01018" for i in range(n_instruments)]
+    prices = {key: rng.uniform(50, 2000) for key in keys}
+    close = dict(prices)
+    last_ltt = {}
+    now = start_ms
+    messages = []
+    for _ in range(n_messages):
+        now += rng.randint(20, 400)
+        feeds = {}
+        for key in rng.sample(keys, max(1, n_instruments // 2)):
+            prices[key] = round(max(1.0, prices[key] + rng.gauss(0, 0.5)), 2)
+            # Trade times lag the message but never go backwards for one instrument.
+            last_ltt[key] = max(last_ltt.get(key, 0), now - rng.randint(0, 500))
+            feeds[key] = {'ltpc': {
+                'ltp': prices[key],
+                'ltt': str(last_ltt[key]),
+                'ltq': str(rng.choice((1, 1, 2, 5, 10, 25, 50, 100, 500))),
+                'cp': round(close[key], 2),
+            }}
+        messages.append({'type': 'live_feed', 'feeds': feeds, 'currentTs': str(now)})
+    return messages
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from app.aggregation import MAX_LTT_MS, BarAggregator, aggregate_arrays
+from app.tick_store import TickColumns
+
+NOW = 1_760_000_000_000
+
+
+def random_ticks(n, seed, late_fraction=0.0):
+    """Columns of a random walk with invalid ticks mixed in and optionally some late ones."""
+    rng = np.random.default_rng(seed)
+    ltt = NOW + np.cumsum(rng.integers(0, 400, n))
+    late = rng.random(n) < late_fraction
+    ltt[late] -= rng.integers(1, 20_000, late.sum())
+    ltp = np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2)
+    ltp[rng.random(n) < 0.01] = np.nan
+    ltq = rng.integers(1, 200, n)
+    ltq[rng.random(n) < 0.01] = 0
+    columns = TickColumns()
+    for values in zip(ltt.tolist(), ltp.tolist(), ltq.tolist()):
+        columns.append(*values, 99.0)
+    return columns
+
+
+def incremental(columns, *params):
+    aggregator = BarAggregator(*params)
+    aggregator.add_columns(columns)
+    return aggregator
+
+
+@pytest.mark.parametrize("params", [(1000, 1000, 50), (60000, 5000, 150), (300000, 60000, 10)])
+@pytest.mark.parametrize("late_fraction", [0.0, 0.05])
+def test_vectorized_build_matches_incremental(params, late_fraction):
+    columns = random_ticks(5000, seed=params[0] + int(late_fraction * 100), late_fraction=late_fraction)
+    built = BarAggregator.from_columns(*params, [columns])
+    added = incremental(columns, *params)
+    assert built.snapshot() == added.snapshot()
+    assert built.bars == added.bars and built.bubbles == added.bubbles
+    assert (built.last_price, built.qty_total, built.qty_count, built.ticks_consumed) == \
+           (added.last_price, added.qty_total, added.qty_count, added.ticks_consumed)
+
+
+def test_build_from_parts_then_add_matches_incremental():
+    columns = random_ticks(3000, seed=3)
+    head, tail = TickColumns(), TickColumns()
+    for i, values in enumerate(zip(columns.ltt, columns.ltp, columns.ltq, columns.cp)):
+        (head if i < 2000 else tail).append(*values)
+    first, second = TickColumns(), TickColumns()
+    for i, values in enumerate(zip(head.ltt, head.ltp, head.ltq, head.cp)):
+        (first if i < 700 else second).append(*values)
+
+    aggregator = BarAggregator.from_columns(60000, 5000, 50, [first, None, second])
+    aggregator.add_columns(tail)
+    assert aggregator.snapshot() == incremental(columns, 60000, 5000, 50).snapshot()
+
+
+def test_aggregate_arrays_of_implausible_times_buckets_like_add():
+    ltt = np.array([MAX_LTT_MS + 1500, MAX_LTT_MS + 1700, MAX_LTT_MS + 2500], dtype=np.int64)
+    ltp = np.array([10.0, 11.0, 9.0])
+    ltq = np.array([5, 60, 7])
+    result = aggregate_arrays(ltt, ltp, ltq, 1000, 1000, 50)
+    aggregator = BarAggregator(1000, 1000, 50)
+    for values in zip(ltt.tolist(), ltp.tolist(), ltq.tolist()):
+        aggregator.add(*values)
+    assert result['bars'] == aggregator.snapshot()['bars']
+    assert [bar[0] for bar in result['bars']] == [(MAX_LTT_MS + 1500) // 1000 * 1000,
+                                                   (MAX_LTT_MS + 2500) // 1000 * 1000]
+
+
+def test_no_valid_ticks():
+    result = aggregate_arrays(np.array([NOW]), np.array([np.nan]), np.array([5]), 1000, 1000, 50)
+    assert result == {'bars': [], 'bubbles': [], 'last_price': 0.0, 'qty_total': 0, 'qty_count': 0}
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.bar_pyramid import PB_CLOSE, PB_OPEN, PYRAMID_LEVELS_MS, BarPyramid, PyramidEngine
+from app.tick_store import TickColumns
+
+NOW = 1_760_000_000_000
+
+
+def random_ticks(n, seed, late_fraction):
+    rng = np.random.default_rng(seed)
+    ltt = NOW + np.cumsum(rng.integers(0, 300, n))
+    late = rng.random(n) < late_fraction
+    ltt[late] -= rng.integers(1, 400_000, late.sum())
+    ltp = np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2)
+    ltp[rng.random(n) < 0.01] = np.nan
+    ltq = rng.integers(0, 200, n)
+    columns = TickColumns()
+    for values in zip(ltt.tolist(), ltp.tolist(), ltq.tolist()):
+        columns.append(*values, 99.0)
+    return columns
+
+
+def assert_same_levels(a, b):
+    for interval in PYRAMID_LEVELS_MS:
+        left, right = a.levels[interval].as_arrays(), b.levels[interval].as_arrays()
+        for name in left:
+            np.testing.assert_array_equal(left[name], right[name], err_msg=f"{interval} {name}")
+
+
+@pytest.mark.parametrize("late_fraction", [0.0, 0.02, 0.2])
+def test_incremental_matches_rebuilt_for_out_of_order_input(late_fraction):
+    columns = random_ticks(20000, seed=int(late_fraction * 100), late_fraction=late_fraction)
+    built = BarPyramid.from_columns([columns])
+    added = BarPyramid()
+    added.add_columns(columns)
+    assert (built.last_price, built.ticks_consumed) == (added.last_price, added.ticks_consumed)
+    assert_same_levels(built, added)
+
+
+def test_open_and_close_are_the_earliest_and_latest_trades():
+    columns = TickColumns()
+    for ltt, ltp in ((NOW + 100, 10.0), (NOW + 900, 12.0), (NOW + 50, 9.0), (NOW + 500, 11.0)):
+        columns.append(ltt, ltp, 1, 0.0)
+    pyramid = BarPyramid()
+    pyramid.add_columns(columns)
+    [bar] = pyramid.levels[1000].between()
+    assert (bar[PB_OPEN], bar[PB_CLOSE]) == (9.0, 12.0)
+    assert BarPyramid.from_columns([columns]).levels[1000].between() == [bar]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    pyramid = BarPyramid.from_columns([random_ticks(5000, seed=1, late_fraction=0.05)])
+    path = str(tmp_path / "bars.npz")
+    pyramid.save(path)
+    assert_same_levels(BarPyramid.load(path), pyramid)
+
+
+class _History:
+    def __init__(self):
+        self.live = {}
+
+    def disk_columns(self, security_id):
+        return random_ticks(100, seed=len(security_id), late_fraction=0)
+
+
+def test_viewed_pyramids_are_not_evicted():
+    engine = PyramidEngine(_History(), threading.Lock(), cache_size=2)
+    engine.set_viewed("viewed", True)
+    for security_id in ("viewed", "a", "bb", "ccc"):
+        engine.get(security_id)
+    assert list(engine._pyramids) == ["viewed", "bb", "ccc"]
+    engine.set_viewed("viewed", False)
+    assert list(engine._pyramids) == ["bb", "ccc"]
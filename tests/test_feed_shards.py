@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+import websocket
+
+from app.fake_feed_server import FakeFeedServer
+from app.feed_shards import CONNECTED, DISCONNECTED, ShardedFeed
+from app.reconnect import ReconnectSupervisor
+
+KEYS = [f"NSE_EQ|INE{i:03d}" for i in range(10)]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def fake_feed():
+    server = FakeFeedServer(port=0, interval=0.05).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def feed(fake_feed):
+    received = {'ticks': [], 'gaps': []}
+    lock = threading.Lock()
+
+    def on_ticks(ticks, current_ts, quotes):
+        with lock:
+            received['ticks'].extend(ticks)
+
+    def on_gap(shard_id, keys, last_ts, first_ts):
+        with lock:
+            received['gaps'].append((shard_id, keys, last_ts, first_ts))
+
+    feed = ShardedFeed(on_ticks, {}, n_shards=2, max_keys_per_shard=6, feed_url=fake_feed.url,
+                       on_gap=on_gap, supervisor=ReconnectSupervisor(base_delay=0.05, max_delay=0.2, jitter=0))
+    feed.received = received
+    feed.connect("test-token")
+    yield feed
+    feed.close()
+
+
+def test_keys_are_spread_over_shards_and_all_tick(fake_feed, feed):
+    feed.subscribe(KEYS)
+    assert wait_for(lambda: {tick.instrument_key for tick in feed.received['ticks']} == set(KEYS))
+
+    assert [len(shard.keys) for shard in feed.shards] == [5, 5]
+    assert sorted(map(sorted, fake_feed.subscriptions())) == sorted(
+        sorted(key for key in KEYS if feed.shard_for(key) == shard.shard_id) for shard in feed.shards)
+    # An instrument stays on its shard, so its ticks stay in order.
+    for key in KEYS:
+        ltt = [tick.ltt for tick in feed.received['ticks'] if tick.instrument_key == key]
+        assert ltt == sorted(ltt)
+
+
+def test_keys_beyond_the_shard_limit_are_not_subscribed(feed):
+    feed.subscribe(KEYS + ["NSE_EQ|EXTRA1", "NSE_EQ|EXTRA2", "NSE_EQ|EXTRA3"])
+    assert sum(len(shard.keys) for shard in feed.shards) == 12
+    assert feed.stats['unassigned_keys'] == 1
+
+
+def test_dropped_connections_reconnect_resubscribe_and_report_the_gap(fake_feed, feed):
+    feed.subscribe(KEYS)
+    assert wait_for(lambda: all(shard.last_ts for shard in feed.shards))
+
+    fake_feed.drop_connections()
+    assert wait_for(lambda: all(shard.stats['reconnects'] == 1 for shard in feed.shards))
+    assert wait_for(lambda: all(shard.connection_state == CONNECTED for shard in feed.shards))
+    assert wait_for(lambda: len(feed.received['gaps']) == 2)
+
+    assert fake_feed.stats['connections'] == 4
+    assert sorted(map(sorted, fake_feed.subscriptions())) == sorted(sorted(shard.keys) for shard in feed.shards)
+    for shard_id, keys, last_ts, first_ts in feed.received['gaps']:
+        assert keys == set(feed.shards[shard_id].keys)
+        assert first_ts >= last_ts
+        assert feed.shards[shard_id].stats['gaps'] == 1
+
+    # Ticks keep flowing after the reconnect.
+    count = len(feed.received['ticks'])
+    assert wait_for(lambda: len(feed.received['ticks']) > count + len(KEYS))
+
+
+def test_a_rejected_token_stops_reconnects_but_other_handshake_errors_retry(feed):
+    assert wait_for(lambda: all(shard.connection_state == CONNECTED for shard in feed.shards))
+    rejected, unavailable = feed.shards
+
+    rejected._on_error(rejected.streamer, websocket.WebSocketBadStatusException(
+        "Handshake status 401 Unauthorized", 401, "Unauthorized"))
+    # The status is what counts, not a "401" somewhere in the message.
+    unavailable._on_error(unavailable.streamer, websocket.WebSocketBadStatusException(
+        "Handshake status 503 (401 retries left)", 503, "Service Unavailable"))
+
+    assert wait_for(lambda: unavailable.connection_state == CONNECTED and unavailable.stats['reconnects'] == 1)
+    time.sleep(0.3)
+    assert rejected.connection_state == DISCONNECTED
+    assert rejected.stats['reconnects'] == 0
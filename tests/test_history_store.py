@@ -0,0 +1,60 @@
+import json
+
+from app.history_store import HistoryStore, JsonlIndex, parse_jsonl_line
+
+NOW = 1_760_000_000_000
+
+
+def feed_line(feeds, **dumps_options):
+    return json.dumps({'type': 'live_feed', 'feeds': feeds, 'currentTs': str(NOW)}, **dumps_options) + '\n'
+
+
+def ltpc(i):
+    return {'ltp': 100.0 + i, 'ltt': str(NOW + i), 'ltq': str(i + 1), 'cp': 99.0}
+
+
+def parse_file(path):
+    columns_by_security = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            parse_jsonl_line(line, columns_by_security)
+    return columns_by_security
+
+
+def test_index_reads_feeds_whatever_the_writer_layout(tmp_path):
+    path = tmp_path / "day.txt"
+    lines = []
+    for i in range(30):
+        lines.append(feed_line({
+            'NSE_EQ|A': {'ltpc': ltpc(i), 'ticker': 'A'},
+            # Compact separators and the ticker first.
+            'NSE_EQ|B': {'ticker': 'B', 'ltpc': ltpc(2 * i)},
+            # A full-mode feed with its ltpc nested deeper has no top-level ltpc.
+            'NSE_FO|C': {'ff': {'marketFF': {'ltpc': ltpc(i)}}},
+        }, separators=(',', ':') if i % 2 else (', ', ': ')))
+    path.write_text(''.join(lines))
+
+    index = JsonlIndex(str(path))
+    parsed = parse_file(path)
+    assert index.securities() == ['NSE_EQ|A', 'NSE_EQ|B', 'NSE_FO|C']
+    for key in ('NSE_EQ|A', 'NSE_EQ|B'):
+        columns = index.read_columns(key)
+        assert len(columns) == 30
+        assert (list(columns.ltt), list(columns.ltp)) == (list(parsed[key].ltt), list(parsed[key].ltp))
+    assert len(index.read_columns('NSE_FO|C')) == 0
+    assert len(index.read_columns('NSE_EQ|MISSING')) == 0
+
+
+def test_long_feed_objects_are_read_past_the_first_window(tmp_path):
+    path = tmp_path / "day.txt"
+    path.write_text(feed_line({'NSE_EQ|A': {'note': 'x' * 5000, 'ltpc': ltpc(1)}, 'NSE_EQ|B': {'ltpc': ltpc(2)}}))
+    assert list(JsonlIndex(str(path)).read_columns('NSE_EQ|A').ltp) == [101.0]
+
+
+def test_lazy_loads_keep_no_per_security_locks(tmp_path):
+    path = tmp_path / "day.txt"
+    path.write_text(''.join(feed_line({f'NSE_EQ|S{k}': {'ltpc': ltpc(i)} for k in range(5)}) for i in range(10)))
+    history = HistoryStore(str(tmp_path / "day"), str(path), memory_budget=1)
+    for k in range(5):
+        assert len(history._load_disk(f'NSE_EQ|S{k}')) == 10
+    assert history._load_locks == {}
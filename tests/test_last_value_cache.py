@@ -0,0 +1,74 @@
+import numpy as np
+
+from app.history_store import HistoryStore
+from app.last_value_cache import LastValueCache
+from app.ticks import Tick, ticks_to_json_line
+
+NOW = 1_760_000_000_000
+KEYS = ("NSE_EQ|A", "NSE_EQ|B", "NSE_FO|C")
+
+
+def day_ticks(n=300, seed=5):
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(n):
+        ticks = [Tick(key, key[-1], round(100 + rng.normal(), 2), NOW + i * 700 + k, int(rng.integers(1, 120)), 99.0)
+                 for k, key in enumerate(KEYS)]
+        records.append((ticks, NOW + i * 700))
+    return records
+
+
+def write_jsonl(path, records):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(ticks_to_json_line(record) + '\n')
+
+
+def test_big_player_volume_uses_the_quantity_threshold():
+    cache = LastValueCache(HistoryStore("/nonexistent/day", "/nonexistent/day.txt"), big_player_qty=50)
+    for ltp, ltq in ((100.0, 60), (101.0, 10), (100.5, 80), (102.0, 50), (102.0, 49)):
+        cache.update(Tick(KEYS[0], "A", ltp, NOW, ltq, 99.0))
+    row = cache.watch_summary(KEYS[0])
+    assert row[4:6] == [60 + 50, 80]
+    assert row[6] == round((110 - 80) / 190, 3)
+
+
+def test_preloaded_disk_summaries_match_live_ones_without_filling_the_history_lru(tmp_path):
+    records = day_ticks()
+    jsonl_path = str(tmp_path / "UpstoxWSS_01_01_25.txt")
+    write_jsonl(jsonl_path, records)
+    history = HistoryStore(str(tmp_path / "UpstoxWSS_01_01_25"), jsonl_path, memory_budget=1 << 20)
+    from_disk = LastValueCache(history)
+    from_disk.preload(KEYS + ("NSE_EQ|MISSING",))
+    assert history.memory_usage()['loaded_securities'] == 0
+
+    live = LastValueCache(HistoryStore("/nonexistent/day", "/nonexistent/day.txt"))
+    for ticks, _ in records:
+        for tick in ticks:
+            live.update(tick)
+    for key in KEYS:
+        assert from_disk.watch_summary(key) == live.watch_summary(key)
+        assert from_disk.snapshot(key) == live.snapshot(key)
+    assert from_disk.watch_summary("NSE_EQ|MISSING") is None
+
+
+def test_non_trades_are_skipped_and_live_trades_follow_the_disk_history(tmp_path):
+    jsonl_path = str(tmp_path / "UpstoxWSS_01_01_25.txt")
+    key = KEYS[0]
+    write_jsonl(jsonl_path, [
+        ([Tick(key, "A", 100.0, NOW, 60, 99.0)], NOW),
+        # A quote update without a trade sets neither the price nor the volume.
+        ([Tick(key, "A", 200.0, NOW + 1, 0, 99.0)], NOW + 1),
+    ])
+    cache = LastValueCache(HistoryStore(str(tmp_path / "UpstoxWSS_01_01_25"), jsonl_path), big_player_qty=50)
+    # The first live trade is a down-tick from the last disk trade, not a buy.
+    cache.update(Tick(key, "A", 99.0, NOW + 2, 70, 99.0))
+    cache.update(Tick(key, "A", 300.0, NOW + 3, 0, 99.0))
+    cache.update(Tick(key, "A", 99.5, NOW + 4, 80, 99.0))
+
+    row = cache.watch_summary(key)
+    assert row[1] == 99.5
+    assert row[3:6] == [60 + 70 + 80, 60 + 80, 70]
+    snapshot = cache.snapshot(key)
+    assert snapshot['day'] == [100.0, 100.0, 99.0, 99.5]
+    assert snapshot['ticks'] == 3
@@ -0,0 +1,109 @@
+"""
+Live fan-out under the app's own Socket.IO async mode (eventlet, not monkey-patched):
+ticks are handed over on a plain OS thread, as the feed dispatcher does, and they
+and the events they trigger must still reach a connected client.
+"""
+import socket
+import threading
+import time
+
+import pytest
+import socketio as socketio_client
+from flask import Flask
+from flask_socketio import SocketIO
+
+from app import bubble_chart_logic
+from app.fanout import LiveFanout
+from app.ticks import Tick
+from app.wire import BINARY_MIN_TICKS, WIRE_BINARY, WIRE_JSON
+
+KEY = "NSE_EQ|INE000A01011"
+
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, room=None, namespace=None):
+        self.emitted.append((event, room))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(bubble_chart_logic, 'HISTORY_DIR', str(tmp_path))
+    app = Flask(__name__)
+    sio = SocketIO(app, cors_allowed_origins="*")
+    assert sio.async_mode == 'eventlet'
+    bubble_chart = bubble_chart_logic.BubbleChartLogic(sio)
+    bubble_chart.register_handlers()
+    port = free_port()
+    threading.Thread(target=sio.run, args=(app,), kwargs={'port': port, 'log_output': False}, daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", bubble_chart
+
+
+def test_live_ticks_from_a_feed_thread_reach_clients(server):
+    url, bubble_chart = server
+    received, added, ready = [], [], threading.Event()
+    client = socketio_client.Client(reconnection=False)
+    client.on('historical_chunk', lambda msg: msg.get('final') and ready.set(), namespace='/bubble')
+    client.on('live_ticks', lambda msg: received.extend(msg['ticks']), namespace='/bubble')
+    client.on('securities_added', lambda msg: added.extend(msg['securities']), namespace='/bubble')
+    client.connect(url, namespaces=['/bubble'], transports=['websocket'])
+    try:
+        client.emit('request_initial_data', {'symbol': KEY}, namespace='/bubble')
+        assert ready.wait(10)
+
+        now = int(time.time() * 1000)
+        ticks = [Tick(KEY, "TEST", 100.0 + i, now + i, 10, 99.0) for i in range(5)]
+        feed = threading.Thread(target=bubble_chart.broadcast_live_tick, args=(ticks,))
+        feed.start()
+        feed.join(5)
+
+        deadline = time.monotonic() + 5
+        while len(received) < len(ticks) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert [tick['ltp'] for tick in received] == [tick.ltp for tick in ticks]
+        assert added == [KEY]
+    finally:
+        client.disconnect()
+
+
+def test_ticks_are_only_buffered_and_counted_for_rooms_with_viewers():
+    sio = RecordingSocketIO()
+    fanout = LiveFanout(sio, '/bubble', flush_interval=0.01)
+    fanout._task = object()  # Buffer as if the flush task were running; flushes are driven below.
+    now = int(time.time() * 1000)
+    ticks = [Tick(KEY, "TEST", 100.0 + i, now + i, 10, 99.0) for i in range(BINARY_MIN_TICKS)]
+
+    for tick in ticks:
+        fanout.add_tick(KEY, tick)
+    fanout.flush()
+    assert sio.emitted == [] and fanout.totals()['frames'] == 0
+
+    fanout.watch_ticks(KEY, WIRE_JSON, 1)
+    fanout.watch_ticks(KEY, WIRE_BINARY, 1)
+    for tick in ticks:
+        fanout.add_tick(KEY, tick)
+    fanout.flush()
+    binary_room = LiveFanout.tick_room(KEY, WIRE_BINARY)
+    assert sio.emitted == [('live_ticks', KEY), ('live_ticks', binary_room)]
+    stats = fanout.stats()
+    assert stats[KEY] == stats[binary_room] == {'frames': 1, 'updates': len(ticks), 'max_batch': len(ticks)}
+
+    fanout.watch_ticks(KEY, WIRE_JSON, -1)
+    fanout.add_tick(KEY, ticks[0])
+    fanout.flush()
+    assert fanout.stats()[KEY]['frames'] == 1
+    assert fanout.stats()[binary_room]['frames'] == 2
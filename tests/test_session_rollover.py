@@ -0,0 +1,93 @@
+import time
+from datetime import timedelta
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from app import bubble_chart_logic
+from app.metrics import METRICS
+from app.partitions import DailySink, day_bounds_ms, day_of
+from app.ticks import Tick
+
+KEY = "NSE_EQ|INE000A01011"
+
+
+def make_logic(tmp_path, monkeypatch):
+    monkeypatch.setattr(bubble_chart_logic, 'HISTORY_DIR', str(tmp_path))
+    return bubble_chart_logic.BubbleChartLogic(SocketIO(Flask(__name__), async_mode='threading'))
+
+
+def test_first_ticks_of_a_new_day_roll_the_session(tmp_path, monkeypatch):
+    logic = make_logic(tmp_path, monkeypatch)
+    today = logic.session_day
+    now = int(time.time() * 1000)
+    view = logic.aggregation.make_key(KEY, 60000, 5000, 50)
+    logic.aggregation.subscribe("sid", view)
+
+    logic.broadcast_live_tick([Tick(KEY, "X", 100.0, now, 60, 99.0)], now)
+    assert logic.session_day == today
+    assert logic.last_values.snapshot(KEY)['volume'] == 60
+
+    tomorrow = today + timedelta(days=1)
+    midnight = day_bounds_ms(tomorrow)[0]
+    logic.broadcast_live_tick([Tick(KEY, "X", 101.0, midnight + 5, 7, 100.0)], midnight + 10)
+
+    assert logic.session_day == tomorrow
+    assert logic.journal_base_path.endswith(tomorrow.strftime('%d_%m_%y'))
+    assert logic.history.archive.before_ms == midnight
+    assert list(logic.history.live.copy_columns(KEY).ltp) == [101.0]
+    assert logic.last_values.snapshot(KEY)['volume'] == 7
+    assert logic.watchlists.last_values is logic.last_values
+    assert logic.pyramids.history is logic.history
+    bars = logic.aggregation.subscribe("sid", view)['bars']
+    assert [bar[0] for bar in bars] == [midnight]
+
+
+def test_ticks_dated_by_ltt_without_current_ts_and_never_rolling_back(tmp_path, monkeypatch):
+    logic = make_logic(tmp_path, monkeypatch)
+    tomorrow = logic.session_day + timedelta(days=1)
+    midnight = day_bounds_ms(tomorrow)[0]
+    logic.broadcast_live_tick([Tick(KEY, "X", 101.0, midnight + 5, 7, 100.0)])
+    assert logic.session_day == tomorrow == day_of(midnight)
+
+    logic.broadcast_live_tick([Tick(KEY, "X", 102.0, midnight - 5, 3, 100.0)], midnight - 1)
+    assert logic.session_day == tomorrow
+    assert list(logic.history.live.copy_columns(KEY).ltp) == [101.0, 102.0]
+
+
+class ListSink:
+    def __init__(self):
+        self.records = []
+        self.closed = False
+
+    def write_batch(self, records):
+        self.records.extend(records)
+        return len(records)
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_daily_sink_drops_late_records_of_closed_days(tmp_path):
+    sinks = {}
+    sink = DailySink(lambda day: sinks.setdefault(day, ListSink()), grace=0)
+    today = day_of()
+    yesterday_ms = day_bounds_ms(today - timedelta(days=1))[0] + 1000
+    older_ms = yesterday_ms - 86_400_000
+    today_ms = day_bounds_ms(today)[0] + 1000
+
+    assert sink.write_batch([("y1", yesterday_ms), ("t1", today_ms)]) == 2
+    assert sinks[today - timedelta(days=1)].closed
+    before = METRICS.counters.get(('history_late_records', ()), 0)
+    assert sink.write_batch([("y2", yesterday_ms), ("o1", older_ms), ("t2", today_ms)]) == 1
+
+    assert [r[0] for r in sinks[today - timedelta(days=1)].records] == ["y1"]
+    assert [r[0] for r in sinks[today].records] == ["t1", "t2"]
+    assert today - timedelta(days=2) not in sinks
+    assert METRICS.counters[('history_late_records', ())] == before + 2
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+
+from app.tick_journal import (INDEX_SUFFIX, RECORD, RUN, RUN_DTYPE, TICKS_SUFFIX, TickJournal, TickJournalReader,
+                              journal_exists, journal_record_count)
+from app.ticks import Tick
+
+NOW = 1_760_000_000_000
+
+
+def batches(n_batches=5, per_batch=40, keys=("NSE_EQ|A", "NSE_EQ|B", "NSE_FO|C")):
+    """(ticks, current_ts) records with the instruments interleaved, as the feed sends them."""
+    records, expected = [], {key: [] for key in keys}
+    for b in range(n_batches):
+        ticks = []
+        for i in range(per_batch):
+            key = keys[(b + i) % len(keys)]
+            tick = Tick(key, key.split('|')[1], 100.0 + b + i / 100, NOW + b * 1000 + i, i + 1, 99.0)
+            ticks.append(tick)
+            expected[key].append(tick)
+        records.append((ticks, NOW + b * 1000))
+    return records, expected
+
+
+def assert_columns(columns, ticks):
+    assert list(columns.ltt) == [tick.ltt for tick in ticks]
+    assert list(columns.ltp) == [tick.ltp for tick in ticks]
+    assert list(columns.ltq) == [tick.ltq for tick in ticks]
+    assert list(columns.cp) == [tick.cp for tick in ticks]
+
+
+def write(base_path, records, batch_size=2):
+    journal = TickJournal(base_path)
+    for start in range(0, len(records), batch_size):
+        journal.write_batch(records[start:start + batch_size])
+    journal.close()
+
+
+def test_write_and_read_back(tmp_path):
+    base_path = str(tmp_path / "UpstoxWSS_01_01_25")
+    records, expected = batches()
+    write(base_path, records)
+
+    assert journal_exists(base_path)
+    assert journal_record_count(base_path) == 200
+    reader = TickJournalReader(base_path)
+    try:
+        assert reader.securities() == sorted(expected)
+        for key, ticks in expected.items():
+            assert reader.tick_count(key) == len(ticks)
+            assert_columns(reader.read_columns(key), ticks)
+            # Slices are zero-copy views into the memory map.
+            assert all(not part.flags.owndata for part in reader.slices(key))
+        assert len(reader.read_columns("NSE_EQ|MISSING")) == 0
+    finally:
+        reader.close()
+
+
+def test_reopening_appends_and_keeps_instrument_ids(tmp_path):
+    base_path = str(tmp_path / "day")
+    records, expected = batches(n_batches=6)
+    write(base_path, records[:3])
+    write(base_path, records[3:])
+    reader = TickJournalReader(base_path)
+    try:
+        for key, ticks in expected.items():
+            assert_columns(reader.read_columns(key), ticks)
+    finally:
+        reader.close()
+
+
+def test_max_records_hides_later_ticks(tmp_path):
+    base_path = str(tmp_path / "day")
+    records, _ = batches(n_batches=2)
+    write(base_path, records, batch_size=1)
+    reader = TickJournalReader(base_path, max_records=40)
+    try:
+        assert len(reader) == 40
+        assert sum(reader.tick_count(key) for key in reader.securities()) == 40
+    finally:
+        reader.close()
+
+
+def test_torn_tail_is_dropped_and_missing_index_is_rebuilt(tmp_path):
+    base_path = str(tmp_path / "day")
+    records, expected = batches(n_batches=2)
+    write(base_path, records, batch_size=1)
+    # A crash mid-write: half a record on the ticks file and no index for the last batch.
+    with open(base_path + TICKS_SUFFIX, 'ab') as f:
+        f.write(b'\0' * (RECORD.size // 2))
+    with open(base_path + INDEX_SUFFIX, 'rb') as f:
+        index = f.read()
+    with open(base_path + INDEX_SUFFIX, 'wb') as f:
+        f.write(index[:len(index) // 2])
+
+    reader = TickJournalReader(base_path)
+    try:
+        assert len(reader) == 80
+        for key, ticks in expected.items():
+            assert_columns(reader.read_columns(key), ticks)
+    finally:
+        reader.close()
+
+    write(base_path, [([Tick("NSE_EQ|A", "A", 1.0, NOW + 10_000, 1, 1.0)], NOW)])
+    assert journal_record_count(base_path) == 81
+    reader = TickJournalReader(base_path)
+    try:
+        assert np.asarray(reader.read_columns("NSE_EQ|A").ltt)[-1] == NOW + 10_000
+    finally:
+        reader.close()
+
+
+def test_restart_after_a_crash_indexes_the_records_left_without_runs(tmp_path):
+    base_path = str(tmp_path / "day")
+    records, expected = batches(n_batches=6)
+    write(base_path, records[:2], batch_size=1)
+    index_size = os.path.getsize(base_path + INDEX_SUFFIX)
+    # Two more commits reach the ticks file, then the process dies before their runs
+    # (and half of the next record) are written.
+    write(base_path, records[2:4], batch_size=1)
+    with open(base_path + INDEX_SUFFIX, 'r+b') as f:
+        f.truncate(index_size + RUN.size // 2)
+    with open(base_path + TICKS_SUFFIX, 'ab') as f:
+        f.write(b'\1' * (RECORD.size // 3))
+
+    write(base_path, records[4:], batch_size=1)
+    with open(base_path + INDEX_SUFFIX, 'rb') as f:
+        runs = np.frombuffer(f.read(), dtype=RUN_DTYPE)
+    assert runs['count'].sum() == 240
+    assert (runs['first'][1:] == runs['first'][:-1] + runs['count'][:-1]).all()
+    reader = TickJournalReader(base_path)
+    try:
+        assert len(reader) == 240
+        for key, ticks in expected.items():
+            assert_columns(reader.read_columns(key), ticks)
+    finally:
+        reader.close()
+
+
+def test_reader_fills_unindexed_gaps_between_runs(tmp_path):
+    base_path = str(tmp_path / "day")
+    records, expected = batches(n_batches=3)
+    write(base_path, records, batch_size=1)
+    # Drop the middle commit's runs, as a journal written before the index repair could have.
+    with open(base_path + INDEX_SUFFIX, 'rb') as f:
+        runs = np.frombuffer(f.read(), dtype=RUN_DTYPE)
+    middle = (runs['first'] >= 40) & (runs['first'] < 80)
+    with open(base_path + INDEX_SUFFIX, 'wb') as f:
+        f.write(runs[~middle].tobytes())
+
+    reader = TickJournalReader(base_path)
+    try:
+        for key, ticks in expected.items():
+            assert_columns(reader.read_columns(key), ticks)
+    finally:
+        reader.close()
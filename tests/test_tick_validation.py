@@ -0,0 +1,88 @@
+import math
+
+from app.aggregation import MAX_LTT_MS
+from app.metrics import METRICS
+from app.tick_validation import (MAX_FUTURE_SKEW_MS, REJECT_DUPLICATE, REJECT_FUTURE, REJECT_INVALID,
+                                 REJECT_NO_QUANTITY, REJECT_OUT_OF_ORDER, TickValidator)
+from app.ticks import Tick
+
+NOW = 1_760_000_000_000
+KEY = "NSE_EQ|INE001"
+
+
+def tick(ltt=NOW, ltp=100.0, ltq=5, cp=99.0, key=KEY):
+    return Tick(key, "X", ltp, ltt, ltq, cp)
+
+
+def test_clean_ticks_pass_unchanged():
+    ticks = [tick(NOW), tick(NOW + 1, 100.5), tick(NOW + 1, 100.5, key="NSE_EQ|INE002")]
+    validator = TickValidator()
+    accepted = validator.validate(ticks, NOW)
+    assert accepted == ticks
+    assert all(a is b for a, b in zip(accepted, ticks))
+    assert validator.stats['accepted'] == 3
+
+
+def test_values_are_coerced_to_numbers():
+    [accepted] = TickValidator().validate([tick(str(NOW), "101", "7", 99)], NOW)
+    assert accepted == tick(NOW, 101.0, 7, 99.0)
+    assert [type(value) for value in accepted[2:]] == [float, int, int, float]
+
+
+def test_invalid_and_non_trades_are_rejected():
+    validator = TickValidator()
+    ticks = [tick(ltp=float('nan')), tick(ltp=float('inf')), tick(ltt=0), tick(ltp="x"),
+             tick(ltq=0), tick(ltq=-3)]
+    assert validator.validate(ticks, NOW) == []
+    assert validator.stats[REJECT_INVALID] == 4
+    assert validator.stats[REJECT_NO_QUANTITY] == 2
+
+
+def test_non_finite_cp_is_zeroed():
+    [accepted] = TickValidator().validate([tick(cp=float('nan'))], NOW)
+    assert accepted.cp == 0.0 and not math.isnan(accepted.cp)
+
+
+def test_implausible_ltt_is_truncated_to_the_second():
+    validator = TickValidator()
+    ltt = MAX_LTT_MS + 1123
+    [accepted] = validator.validate([tick(ltt)], MAX_LTT_MS + 2000)
+    assert accepted.ltt == ltt // 1000 * 1000
+    assert validator.stats['normalized_ltt'] == 1
+
+
+def test_microsecond_ltt_is_still_in_the_future_after_normalization():
+    validator = TickValidator()
+    assert validator.validate([tick(NOW * 1000)], NOW) == []
+    assert validator.stats[REJECT_FUTURE] == 1
+
+
+def test_future_ticks_are_rejected_relative_to_current_ts():
+    validator = TickValidator()
+    ok = tick(NOW + MAX_FUTURE_SKEW_MS)
+    assert validator.validate([ok, tick(NOW + MAX_FUTURE_SKEW_MS + 1, 101.0)], NOW) == [ok]
+    assert validator.stats[REJECT_FUTURE] == 1
+
+
+def test_out_of_order_ticks_are_rejected_per_instrument():
+    validator = TickValidator()
+    validator.validate([tick(NOW)], NOW)
+    other = tick(NOW - 10, key="NSE_EQ|INE002")
+    assert validator.validate([tick(NOW - 1), other], NOW) == [other]
+    assert validator.stats[REJECT_OUT_OF_ORDER] == 1
+
+
+def test_repeats_are_rejected_but_distinct_trades_at_the_same_ms_kept():
+    validator = TickValidator()
+    first, second = tick(NOW, 100.0, 5), tick(NOW, 100.0, 6)
+    assert validator.validate([first, second, first], NOW) == [first, second]
+    # A resent batch (e.g. after a reconnect) is dropped as well.
+    assert validator.validate([first, second], NOW) == []
+    assert validator.stats[REJECT_DUPLICATE] == 3
+    assert validator.validate([tick(NOW + 1, 100.0, 5)], NOW) == [tick(NOW + 1, 100.0, 5)]
+
+
+def test_rejections_are_counted_in_metrics():
+    before = METRICS.counters.get(('ticks_rejected', (('reason', REJECT_NO_QUANTITY),)), 0)
+    TickValidator().validate([tick(ltq=0), tick(ltq=0)], NOW)
+    assert METRICS.counters[('ticks_rejected', (('reason', REJECT_NO_QUANTITY),))] == before + 2
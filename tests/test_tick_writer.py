@@ -0,0 +1,75 @@
+import threading
+import time
+
+from app.tick_writer import TickWriter
+
+
+class SlowSink:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.records = []
+        self.closed = False
+
+    def write_batch(self, batch):
+        time.sleep(self.delay)
+        self.records.extend(batch)
+        return len(batch)
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_close_writes_everything_queued_and_closes_the_sink():
+    sink = SlowSink()
+    writer = TickWriter(sink, batch_size=7, flush_interval=10.0)
+    for i in range(100):
+        assert writer.enqueue(i)
+    writer.close()
+    assert sink.records == list(range(100))
+    assert sink.closed
+    assert writer.stats()['written'] == 100
+
+
+def test_close_drains_a_full_queue():
+    sink = SlowSink(delay=0.01)
+    writer = TickWriter(sink, max_queue_size=20, batch_size=1, flush_interval=0.0)
+    queued = [i for i in range(40) if writer.enqueue(i)]
+    writer.close(timeout=0.05)
+    writer._thread.join(5)
+    assert sink.records == queued
+    assert sink.closed
+
+
+def test_records_enqueued_after_close_are_rejected():
+    sink = SlowSink()
+    writer = TickWriter(sink, name="test_writer")
+    assert writer._thread.name == "test_writer"
+    writer.close()
+    assert not writer.enqueue("late")
+    assert writer.stats()['dropped'] == 1 and sink.records == []
+
+
+def test_concurrent_enqueues_during_close_are_either_written_or_rejected():
+    sink = SlowSink()
+    writer = TickWriter(sink, flush_interval=0.001)
+    accepted = []
+
+    def produce(offset):
+        for i in range(2000):
+            if writer.enqueue(offset + i):
+                accepted.append(offset + i)
+
+    threads = [threading.Thread(target=produce, args=(n * 10000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.005)
+    writer.close()
+    for thread in threads:
+        thread.join()
+    assert sorted(sink.records) == sorted(accepted)
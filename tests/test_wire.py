@@ -0,0 +1,60 @@
+import numpy as np
+
+from app.tick_store import TickColumns
+from app.ticks import Tick
+from app.wire import FLAG_LTT_DELTA, HEADER, decode_tick_block, encode_columns, encode_ticks, encode_tick_block
+
+
+def make_columns(n, start_ltt=1_760_000_000_000):
+    columns = TickColumns()
+    rng = np.random.default_rng(7)
+    ltt = start_ltt + np.cumsum(rng.integers(0, 2000, n))
+    for i in range(n):
+        columns.append(int(ltt[i]), round(100 + rng.normal(), 2), int(rng.integers(1, 1000)), 99.5)
+    return columns
+
+
+def assert_block_matches(block, columns, start=0, stop=None):
+    decoded = decode_tick_block(block)
+    for name, dtype in (('ltt', np.int64), ('ltp', np.float64), ('ltq', np.int32), ('cp', np.float64)):
+        expected = np.frombuffer(getattr(columns, name), dtype=dtype)[start:stop]
+        np.testing.assert_array_equal(decoded[name], expected)
+        assert decoded[name].dtype == dtype
+
+
+def test_columns_round_trip():
+    columns = make_columns(1000)
+    block = encode_columns(columns)
+    assert block[1] & FLAG_LTT_DELTA
+    assert len(block) == HEADER.size + 1000 * (8 + 8 + 4 + 4)
+    assert_block_matches(block, columns)
+
+
+def test_slices_round_trip():
+    columns = make_columns(100)
+    assert_block_matches(encode_columns(columns, 10, 60), columns, 10, 60)
+    assert_block_matches(encode_columns(columns, 90, 500), columns, 90, 100)
+
+
+def test_empty_block():
+    decoded = decode_tick_block(encode_columns(TickColumns()))
+    assert all(len(values) == 0 for values in decoded.values())
+
+
+def test_ltt_gaps_too_large_for_int32_deltas_fall_back_to_absolute_times():
+    ltt = [1_000, 1_000 + 2 ** 31 + 5, 1_760_000_000_000]
+    block = encode_tick_block(ltt, [1.0, 2.0, 3.0], [1, 2, 3], [0.0, 0.0, 0.0])
+    assert not block[1] & FLAG_LTT_DELTA
+    np.testing.assert_array_equal(decode_tick_block(block)['ltt'], ltt)
+
+
+def test_out_of_order_ltt_round_trips():
+    ltt = [1_760_000_000_500, 1_760_000_000_000, 1_760_000_000_900]
+    np.testing.assert_array_equal(decode_tick_block(encode_tick_block(ltt, [1.0] * 3, [1] * 3, [0.0] * 3))['ltt'], ltt)
+
+
+def test_tick_records_encode_like_columns():
+    columns = make_columns(50)
+    ticks = [Tick("NSE_EQ|X", "X", ltp, ltt, ltq, cp)
+             for ltt, ltp, ltq, cp in zip(columns.ltt, columns.ltp, columns.ltq, columns.cp)]
+    assert encode_ticks(ticks) == encode_columns(columns)